@@ -0,0 +1,232 @@
+"""
+Local stand-ins for Ridibooks, Longblack and Readwise, serving synthetic pages
+shaped like the real ones, so the syncs can be measured without the network.
+"""
+
+import datetime
+import html
+import json
+import math
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# the Longblack client reads at most this many listing pages
+LONGBLACK_MAX_PAGES = 20
+
+
+class FakeServer(ThreadingHTTPServer):
+    """
+    Serves the responses of `handle()` on a free local port from a daemon thread,
+    and counts the requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+    def reset(self):
+        with self.lock:
+            self.request_count = 0
+
+    def count_request(self):
+        with self.lock:
+            self.request_count += 1
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[int, str, bytes]:
+        """
+        Returns the status, content type and body of the response.
+        """
+        raise NotImplementedError
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeServer
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, which Nagle's algorithm delays
+    disable_nagle_algorithm = True
+
+    def _respond(self, method: str):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        self.server.count_request()
+        status, content_type, content = self.server.handle(method, self.path, body)
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self._respond('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self._respond('POST')
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+def _html(body: str) -> tuple[int, str, bytes]:
+    return 200, 'text/html; charset=utf-8', f'<html><body>{body}</body></html>'.encode()
+
+
+def _not_found() -> tuple[int, str, bytes]:
+    return 404, 'text/plain', b'Not Found'
+
+
+class FakeRidibooksServer(FakeServer):
+    def __init__(self, book_count: int = 10, notes_per_book: int = 10):
+        super().__init__()
+        self.book_count = book_count
+        self.notes_per_book = notes_per_book
+
+    def handle(self, method, path, body):
+        if path == '/account/myridi':
+            return _html('myridi')
+
+        if path == '/reading-note/shelf':
+            return _html(f'<article><ul>{self._shelf_items()}</ul></article>')
+
+        match = re.fullmatch(r'/reading-note/detail/(\d+)', path)
+        if match and int(match.group(1)) < self.book_count:
+            notes = self._note_items(int(match.group(1)))
+            return _html(f'<article><ul>{notes}</ul></article>')
+
+        return _not_found()
+
+    def _shelf_items(self) -> str:
+        return ''.join(
+            f'<li><a href="/reading-note/detail/{book_id}">'
+            f'<h3>Book {book_id}</h3><span>{self.notes_per_book}</span></a>'
+            f'<a href="/author/{book_id % 100}">Author {book_id % 100}</a></li>'
+            for book_id in range(self.book_count)
+        )
+
+    def _note_items(self, book_id: int) -> str:
+        items = []
+
+        for i in range(self.notes_per_book):
+            note_id = book_id * self.notes_per_book + i
+            date = datetime.date(2024, 1, 1) + datetime.timedelta(days=i % 365)
+            memo = f'<p>Memo {note_id}</p>' if i % 3 == 0 else ''
+            items.append(
+                f'<li id="annotation_{note_id}">'
+                f'<p>Highlighted text {note_id} of book {book_id}.</p>{memo}'
+                f'<p>{date:%Y.%m.%d}.</p></li>'
+            )
+
+        return ''.join(items)
+
+
+class FakeLongblackServer(FakeServer):
+    def __init__(self, scrap_count: int = 10):
+        super().__init__()
+        self.scrap_count = scrap_count
+        # the listing is spread over the pages the client reads
+        self.page_size = max(1, math.ceil(scrap_count / LONGBLACK_MAX_PAGES))
+        self.latest = datetime.datetime(2024, 12, 31, 23, 59)
+
+    def handle(self, method, path, body):
+        url = urllib.parse.urlsplit(path)
+
+        if url.path == '/membership':
+            return _html('membership')
+
+        if url.path == '/scrap':
+            query = urllib.parse.parse_qs(url.query)
+            page = int(query.get('page', ['1'])[0])
+            return _html(self._scrap_items(page))
+
+        return _not_found()
+
+    def _scrap_items(self, page: int) -> str:
+        start = (page - 1) * self.page_size
+        stop = min(start + self.page_size, self.scrap_count)
+        items = []
+
+        # newest first, as the listing is sorted by the latest
+        for scrap_index in range(start, stop):
+            note_id = scrap_index // 5
+            created = self.latest - datetime.timedelta(minutes=scrap_index)
+            title = html.escape(f'Author {note_id % 50}: Note {note_id}')
+            items.append(
+                '<div class="swiper-slide"><div class="scrap">'
+                f'<p class="scrap-content">Scrap text {scrap_index}.</p>'
+                f'<span class="date">{created:%Y.%m.%d %H:%M}</span>'
+                f'<a class="note-info" href="/note/{note_id}#memoId=s{scrap_index}">'
+                f'<img src="/cover/{note_id}.jpg"><span>{title}</span></a>'
+                '<div class="actions"><button class="show-memo">'
+                '<i class="memo-icon"></i></button></div>'
+                '</div></div>'
+            )
+
+        return ''.join(items)
+
+
+class FakeReadwiseServer(FakeServer):
+    """
+    Accepts the highlights of the Readwise API, answering after `latency` seconds.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.highlight_count = 0
+        self.next_highlight_id = 1
+
+    def reset(self):
+        super().reset()
+        with self.lock:
+            self.highlight_count = 0
+
+    def handle(self, method, path, body):
+        time.sleep(self.latency)
+
+        if path == '/api/v2/auth/':
+            return 204, 'application/json', b''
+
+        if method == 'POST' and path == '/api/v2/highlights/':
+            highlights = json.loads(body)['highlights']
+
+            with self.lock:
+                self.highlight_count += len(highlights)
+                first_id = self.next_highlight_id
+                self.next_highlight_id += len(highlights)
+
+            response = [
+                {
+                    'id': 1,
+                    'title': 'Benchmark',
+                    'modified_highlights': list(
+                        range(first_id, first_id + len(highlights))
+                    ),
+                }
+            ]
+            return 200, 'application/json', json.dumps(response).encode()
+
+        if method == 'POST' and re.fullmatch(r'/api/v2/highlights/\d+/tags/', path):
+            return 201, 'application/json', body
+
+        return _not_found()
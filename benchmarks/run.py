@@ -0,0 +1,280 @@
+"""
+Measures the syncs end to end against the local fake servers.
+
+    python -m benchmarks.run --sizes 10 --sizes 1000 --output results.json
+"""
+
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional, TypedDict
+from unittest import mock
+
+import typer
+from typing_extensions import Annotated
+
+from benchmarks.fake_servers import (
+    FakeLongblackServer,
+    FakeReadwiseServer,
+    FakeRidibooksServer,
+    FakeServer,
+)
+from ridiwise.api.longblack import LongblackClient
+from ridiwise.api.rate_limit import RateLimiter
+from ridiwise.api.readwise import MAX_IN_FLIGHT_REQUESTS, ReadwiseClient
+from ridiwise.api.ridibooks import AUTH_COOKIE_NAMES, RidiClient
+from ridiwise.api.settings import FetchMode, NoteExtractionMode
+from ridiwise.cmd.context import AuthMethod, ContextState
+from ridiwise.cmd.state import SyncStateStore
+from ridiwise.cmd.sync import longblack, ridibooks
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+PROVIDERS = {
+    ridibooks.PROVIDER: (ridibooks, RidiClient),
+    longblack.PROVIDER: (longblack, LongblackClient),
+}
+
+app = typer.Typer(add_completion=False)
+
+
+class SyncMeasurement(TypedDict):
+    wall_seconds: float
+    peak_rss_bytes: int
+
+
+class BenchmarkResult(TypedDict):
+    provider: str
+    size: int
+    wall_seconds: float
+    pages: int
+    pages_per_second: float
+    highlights: int
+    highlights_per_second: float
+    peak_rss_bytes: int
+
+
+def get_peak_rss_bytes() -> int:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def write_storage_state(client_class, cache_dir: Path):
+    """
+    Saves a session for the fake server, as if logged in before.
+    """
+    cookies = [
+        {'name': name, 'value': 'benchmark', 'domain': '127.0.0.1', 'path': '/'}
+        for name in AUTH_COOKIE_NAMES
+    ]
+    (cache_dir / client_class.storage_state_filename).write_text(
+        json.dumps({'cookies': cookies, 'origins': []}), encoding='utf-8'
+    )
+
+
+# pylint: disable=too-many-arguments
+def measure_sync(
+    provider: str,
+    source_url: str,
+    readwise_url: str,
+    cache_dir: Path,
+    fetch_mode: FetchMode,
+    concurrency: int,
+    readwise_max_rate: Optional[float],
+) -> SyncMeasurement:
+    """
+    Runs a sync from an empty state. Called in a fresh process, so the peak RSS is
+    of this sync only.
+    """
+    module, client_class = PROVIDERS[provider]
+    write_storage_state(client_class, cache_dir)
+
+    context: ContextState = {
+        'logger': logging.getLogger('ridiwise'),
+        'auths': {
+            provider: {
+                'auth_method': AuthMethod.HEADLESS_BROWSER,
+                'user_id': 'benchmark',
+                'password': 'benchmark',
+            }
+        },
+        'config_dir': cache_dir,
+        'cache_dir': cache_dir,
+        'headless_mode': True,
+        'browser_timeout_seconds': 10,
+        'browser_concurrency': concurrency,
+        'lean_browsing': True,
+        'browser_endpoint': None,
+        'fetch_mode': fetch_mode,
+        'error_on_empty_source': False,
+        'full_sync': False,
+        'resume': False,
+        'metrics_file': None,
+        'readwise_transport': {},
+        'readwise_compress_requests': False,
+        'note_extraction_mode': NoteExtractionMode.DOM,
+    }
+
+    with (
+        mock.patch.object(client_class, 'base_url', source_url),
+        mock.patch.object(ReadwiseClient, 'base_url', f'{readwise_url}/api/v2'),
+        ReadwiseClient(
+            token='benchmark',
+            rate_limiter=(
+                RateLimiter(max_rate=readwise_max_rate, burst=MAX_IN_FLIGHT_REQUESTS)
+                if readwise_max_rate
+                else None
+            ),
+        ) as readwise_client,
+        SyncStateStore(cache_dir) as state_store,
+    ):
+        started = time.perf_counter()
+        module.sync_to_readwise(context, readwise_client, state_store, tags=None)
+        wall_seconds = time.perf_counter() - started
+
+    return {
+        'wall_seconds': wall_seconds,
+        'peak_rss_bytes': get_peak_rss_bytes(),
+    }
+
+
+def create_source_server(provider: str, size: int, notes_per_book: int) -> FakeServer:
+    if provider == ridibooks.PROVIDER:
+        return FakeRidibooksServer(book_count=size, notes_per_book=notes_per_book)
+
+    return FakeLongblackServer(scrap_count=size)
+
+
+def run_benchmark(
+    provider: str,
+    size: int,
+    readwise_server: FakeReadwiseServer,
+    fetch_mode: FetchMode,
+    concurrency: int,
+    notes_per_book: int,
+    readwise_max_rate: Optional[float],
+) -> BenchmarkResult:
+    readwise_server.reset()
+
+    with (
+        create_source_server(provider, size, notes_per_book) as source_server,
+        tempfile.TemporaryDirectory() as cache_dir,
+        concurrent.futures.ProcessPoolExecutor(
+            1, mp_context=multiprocessing.get_context('spawn')
+        ) as executor,
+    ):
+        measurement = executor.submit(
+            measure_sync,
+            provider,
+            source_server.url,
+            readwise_server.url,
+            Path(cache_dir),
+            fetch_mode,
+            concurrency,
+            readwise_max_rate,
+        ).result()
+
+        pages = source_server.request_count
+
+    wall_seconds = measurement['wall_seconds']
+    highlights = readwise_server.highlight_count
+
+    return {
+        'provider': provider,
+        'size': size,
+        'wall_seconds': wall_seconds,
+        'pages': pages,
+        'pages_per_second': pages / wall_seconds,
+        'highlights': highlights,
+        'highlights_per_second': highlights / wall_seconds,
+        'peak_rss_bytes': measurement['peak_rss_bytes'],
+    }
+
+
+def print_result(result: BenchmarkResult):
+    print(
+        f'{result["provider"]:<10} {result["size"]:>6} '
+        f'{result["wall_seconds"]:>9.2f}s '
+        f'{result["pages"]:>7} {result["pages_per_second"]:>9.1f}/s '
+        f'{result["highlights"]:>8} {result["highlights_per_second"]:>10.1f}/s '
+        f'{result["peak_rss_bytes"] / 1024 / 1024:>8.1f}MiB'
+    )
+
+
+@app.command()
+def main(
+    sizes: Annotated[
+        Optional[list[int]],
+        typer.Option(
+            help='Books of the Ridibooks shelf and scraps of Longblack to sync.',
+        ),
+    ] = None,
+    providers: Annotated[
+        Optional[list[str]],
+        typer.Option(help='Providers to measure.'),
+    ] = None,
+    fetch_mode: Annotated[
+        FetchMode,
+        typer.Option(help='Fetch mode of the provider clients.'),
+    ] = FetchMode.HTTP,
+    concurrency: Annotated[
+        int,
+        typer.Option(min=1, help='Pages to load in parallel.'),
+    ] = 4,
+    notes_per_book: Annotated[
+        int,
+        typer.Option(min=1, help='Notes of each Ridibooks book.'),
+    ] = 10,
+    readwise_latency: Annotated[
+        float,
+        typer.Option(help='Seconds the fake Readwise API takes to respond.'),
+    ] = 0.05,
+    readwise_max_rate: Annotated[
+        Optional[float],
+        typer.Option(
+            help='Requests per second to Readwise, instead of the rate of its API.',
+        ),
+    ] = None,
+    output: Annotated[
+        Optional[Path],
+        typer.Option(help='Write the results to a JSON file.'),
+    ] = None,
+):
+    """
+    Benchmark the syncs against local fake Ridibooks, Longblack and Readwise.
+    """
+    results: list[BenchmarkResult] = []
+
+    print(
+        f'{"provider":<10} {"size":>6} {"wall":>10} {"pages":>7} {"pages/s":>11} '
+        f'{"highlights":>8} {"highlights/s":>12} {"peak RSS":>11}'
+    )
+
+    with FakeReadwiseServer(latency=readwise_latency) as readwise_server:
+        for provider in providers or list(PROVIDERS):
+            for size in sizes or DEFAULT_SIZES:
+                result = run_benchmark(
+                    provider,
+                    size,
+                    readwise_server,
+                    fetch_mode=fetch_mode,
+                    concurrency=concurrency,
+                    notes_per_book=notes_per_book,
+                    readwise_max_rate=readwise_max_rate,
+                )
+                print_result(result)
+                results.append(result)
+
+    if output:
+        output.write_text(json.dumps(results, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    app()
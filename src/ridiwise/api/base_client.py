@@ -1,8 +1,56 @@
 import abc
+import importlib.util
 import logging
 import typing
+from typing import Optional
 
-from httpx import Auth, Client, Request, Response
+from httpx import Auth, Client, Limits, Request, Response, Timeout
+
+from ridiwise.api.settings import (
+    DEFAULT_CONNECT_TIMEOUT_SECONDS,
+    DEFAULT_KEEPALIVE_EXPIRY_SECONDS,
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_TIMEOUT_SECONDS,
+    TransportSettings,
+)
+
+
+def get_transport_options(
+    settings: Optional[TransportSettings] = None,
+    logger: Optional[logging.Logger] = None,
+) -> dict:
+    """
+    Returns the `httpx.Client` options of the transport settings. HTTP/2 needs the
+    optional `h2` package, and falls back to HTTP/1.1 without it.
+    """
+    settings = settings or {}
+    http2 = settings.get('http2', False)
+
+    if http2 and importlib.util.find_spec('h2') is None:
+        (logger or logging.getLogger(__name__)).warning(
+            'HTTP/2 requires `pip install httpx[http2]`, using HTTP/1.1'
+        )
+        http2 = False
+
+    max_connections = settings.get('max_connections', DEFAULT_MAX_CONNECTIONS)
+    timeout_seconds = settings.get('timeout_seconds', DEFAULT_TIMEOUT_SECONDS)
+
+    return {
+        'limits': Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=settings.get(
+                'keepalive_expiry_seconds', DEFAULT_KEEPALIVE_EXPIRY_SECONDS
+            ),
+        ),
+        'timeout': Timeout(
+            timeout_seconds,
+            connect=settings.get(
+                'connect_timeout_seconds', DEFAULT_CONNECT_TIMEOUT_SECONDS
+            ),
+        ),
+        'http2': http2,
+    }
 
 
 class HTTPTokenAuth(Auth):
@@ -21,9 +69,18 @@ class BaseClient(metaclass=abc.ABCMeta):
     provider: str
     base_url: str
 
-    def __init__(self, *args, **kwargs):
-        self.client = Client(base_url=self.base_url, *args, **kwargs)
+    def __init__(
+        self,
+        *args,
+        transport_settings: Optional[TransportSettings] = None,
+        **kwargs,
+    ):
         self.logger = logging.getLogger(name=self.provider)
+        self.client = Client(
+            base_url=self.base_url,
+            *args,
+            **{**get_transport_options(transport_settings, self.logger), **kwargs},
+        )
 
     def __enter__(self):
         return self
@@ -1,52 +1,535 @@
+import abc
+import collections
+import concurrent.futures
+import http.cookiejar
+import itertools
+import json
+import math
+import time
+import urllib.parse
 from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, TypeVar, Union
 
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import BrowserContext, Page, Route, sync_playwright
 
+from ridiwise import metrics
 from ridiwise.api.base_client import BaseClient
+from ridiwise.api.html import Element, parse_html
+from ridiwise.api.settings import FetchMode
 
+T = TypeVar('T')
+U = TypeVar('U')
 
-class BrowserBaseClient(BaseClient):
+# applied by the browsers to cookies set without a SameSite attribute
+DEFAULT_COOKIE_SAME_SITE = 'Lax'
+
+# aborted in lean browsing mode unless the provider allows them
+BLOCKED_RESOURCE_TYPES = frozenset({'image', 'media', 'font', 'stylesheet'})
+TRACKER_DOMAINS = frozenset(
+    {
+        'google-analytics.com',
+        'googletagmanager.com',
+        'googleadservices.com',
+        'doubleclick.net',
+        'facebook.net',
+        'facebook.com',
+        'analytics.tiktok.com',
+        'hotjar.com',
+        'clarity.ms',
+        'criteo.com',
+        'criteo.net',
+        'amplitude.com',
+        'braze.com',
+        'branch.io',
+        'wcs.naver.net',
+        'sentry.io',
+        'datadoghq-browser-agent.com',
+    }
+)
+
+
+# pylint: disable=import-outside-toplevel
+def get_cookie_jar(browser: str, domain_name: str) -> http.cookiejar.CookieJar:
+    import browser_cookie3
+
+    try:
+        cookie_jar_function = getattr(browser_cookie3, browser)
+        cookie_jar = cookie_jar_function(domain_name=domain_name)
+        return cookie_jar
+    except AttributeError as e:
+        raise RuntimeError(f'Browser "{browser}" is not supported.') from e
+    except Exception as e:
+        raise RuntimeError('Unable to import cookies from browser.') from e
+
+
+def to_storage_state_cookie(cookie: http.cookiejar.Cookie) -> dict:
+    """
+    Converts a cookie imported from a browser to a cookie of the Playwright storage
+    state, which the browser context and the HTTP client are loaded with.
+    """
+    return {
+        'name': cookie.name,
+        'value': cookie.value,
+        'domain': cookie.domain,
+        'path': cookie.path or '/',
+        # -1 for a session cookie
+        'expires': cookie.expires or -1,
+        'httpOnly': cookie.has_nonstandard_attr('HTTPOnly'),
+        'secure': cookie.secure,
+        'sameSite': DEFAULT_COOKIE_SAME_SITE,
+    }
+
+
+class BrowserBaseClient(BaseClient):  # pylint: disable=too-many-instance-attributes
     storage_state_filename = 'browser_state.json'
+    # responds with success only to an authenticated session
+    authenticated_path: str
+    # where unauthenticated requests are redirected to
+    login_path: str
+    # cookies which must be in the saved session to be authenticated
+    auth_cookie_names: tuple[str, ...] = ()
+    # domain of the cookies imported from the browser of the user
+    cookie_domain: str
+    # how long a successful authentication probe is trusted
+    session_ttl_seconds = 600
+
+    # resources and domains the provider needs even in lean browsing mode
+    allowed_resource_types: frozenset[str] = frozenset()
+    allowed_domains: frozenset[str] = frozenset()
 
-    # pylint: disable=keyword-arg-before-vararg,fixme
+    # pylint: disable=keyword-arg-before-vararg,too-many-arguments,fixme
     # TODO: fix lint error
     def __init__(
         self,
         cache_dir: Path,
         headless: bool = True,
         browser_timeout_seconds: int = 10,
+        concurrency: int = 1,
         *args,
+        lean_browsing: bool = False,
+        browser_endpoint: Optional[str] = None,
+        fetch_mode: FetchMode = FetchMode.BROWSER,
+        cookie_browser: Optional[str] = None,
         **kwargs,
     ):
         self.cache_dir = cache_dir
         self.headless = headless
         self.browser_timeout_seconds = browser_timeout_seconds
+        self.concurrency = max(1, concurrency)
+        self.lean_browsing = lean_browsing
+        self.browser_endpoint = browser_endpoint
+        self.fetch_mode = fetch_mode
+        # logs in with the cookies of this browser instead of the login form
+        self.cookie_browser = cookie_browser
 
         self.playwright = None
         self.browser = None
-        self.browser_context = None
+        self._browser_context: Optional[BrowserContext] = None
+        # epoch seconds until which the session is trusted without a probe
+        self._session_valid_until = 0.0
 
         super().__init__(*args, **kwargs)
 
     def __enter__(self):
+        if self.fetch_mode == FetchMode.BROWSER:
+            self._start_browser()
+        else:
+            self.load_storage_state_cookies()
+
+        super().__enter__()
+        return self
+
+    def __exit__(self, *args):
+        if self._browser_context is not None:
+            self._browser_context.close()
+            # disconnects only, when attached to a running browser
+            self.browser.close()
+            self.playwright.stop()
+
+        super().__exit__(*args)
+
+    @property
+    def browser_context(self) -> BrowserContext:
+        """
+        Browser context of the client, launching the browser on first use.
+        """
+        if self._browser_context is None:
+            self._start_browser()
+
+        return self._browser_context
+
+    @property
+    def storage_state_path(self) -> Path:
+        return self.cache_dir / self.storage_state_filename
+
+    def _start_browser(self):
         self.playwright = sync_playwright().start()
-        self.browser = self.playwright.chromium.launch(headless=self.headless)
+
+        if self.browser_endpoint:
+            # attach to the warm browser of `ridiwise daemon`
+            self.browser = self.playwright.chromium.connect_over_cdp(
+                self.browser_endpoint
+            )
+        else:
+            self.browser = self.playwright.chromium.launch(headless=self.headless)
 
         try:
-            self.browser_context = self.browser.new_context(
-                storage_state=self.cache_dir / self.storage_state_filename
+            browser_context = self.browser.new_context(
+                storage_state=self.storage_state_path
             )
         except FileNotFoundError:
-            self.browser_context = self.browser.new_context()
+            browser_context = self.browser.new_context()
 
-        self.browser_context.set_default_timeout(self.browser_timeout_seconds * 1000)
+        browser_context.set_default_timeout(self.browser_timeout_seconds * 1000)
 
-        super().__enter__()
-        return self
+        if self.lean_browsing:
+            browser_context.route('**/*', self._handle_lean_route)
 
-    def __exit__(self, *args):
-        self.browser_context.close()
-        self.browser.close()
-        self.playwright.stop()
+        self._browser_context = browser_context
 
-        super().__exit__(*args)
+    def save_storage_state(self):
+        """
+        Saves the browser session, and shares it with the HTTP client.
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.browser_context.storage_state(path=self.storage_state_path)
+        self.load_storage_state_cookies()
+
+    def import_browser_cookies(self):
+        """
+        Imports the session cookies from the browser of the user into the saved
+        session, the browser context and the HTTP client, instead of logging in.
+        """
+        self.logger.info(f'Login: importing cookies from {self.cookie_browser}')
+
+        cookies = [
+            to_storage_state_cookie(cookie)
+            for cookie in get_cookie_jar(self.cookie_browser, self.cookie_domain)
+        ]
+
+        if not cookies or not {cookie['name'] for cookie in cookies}.issuperset(
+            self.auth_cookie_names
+        ):
+            raise RuntimeError(
+                f'No session found in {self.cookie_browser}. '
+                f'Log in to {self.base_url} with it first.'
+            )
+
+        imported = {
+            (cookie['domain'], cookie['path'], cookie['name']) for cookie in cookies
+        }
+        storage_state = self.read_storage_state()
+        storage_state['cookies'] = [
+            cookie
+            for cookie in storage_state.get('cookies', [])
+            if (cookie['domain'], cookie['path'], cookie['name']) not in imported
+        ] + cookies
+        storage_state.setdefault('origins', [])
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.storage_state_path, 'w', encoding='utf-8') as f:
+            json.dump(storage_state, f)
+
+        if self._browser_context is not None:
+            self._browser_context.add_cookies(cookies)
+
+        self.load_storage_state_cookies()
+
+        if not self.is_authenticated():
+            raise RuntimeError(
+                f'The session of {self.cookie_browser} has expired. '
+                f'Log in to {self.base_url} with it again.'
+            )
+
+    def read_storage_state(self) -> dict:
+        try:
+            with open(self.storage_state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def load_storage_state_cookies(self):
+        """
+        Loads the cookies of the saved browser session into the HTTP client.
+        """
+        for cookie in self.read_storage_state().get('cookies', []):
+            self.client.cookies.set(
+                cookie['name'],
+                cookie['value'],
+                domain=cookie['domain'],
+                path=cookie.get('path', '/'),
+            )
+
+    def is_authenticated(self) -> bool:
+        url = f'{self.base_url}{self.authenticated_path}'
+
+        if self.fetch_mode == FetchMode.HTTP:
+            return self.client.get(url, follow_redirects=False).is_success
+
+        # shares the cookies of the context without opening a page
+        res = self.browser_context.request.get(url, max_redirects=0)
+        return res.ok
+
+    def is_login_url(self, url: str) -> bool:
+        return urllib.parse.urlsplit(url).path.startswith(self.login_path)
+
+    def get_session_cookie_expiry(self) -> float:
+        """
+        Returns the earliest expiry, in epoch seconds, of the auth cookies in the
+        saved session: 0 if any of them is missing, and infinity if none expires.
+        """
+        host = urllib.parse.urlsplit(self.base_url).hostname
+        expires_by_name = {
+            cookie['name']: cookie.get('expires', -1)
+            for cookie in self.read_storage_state().get('cookies', [])
+            if f'.{host}'.endswith(f'.{cookie["domain"].lstrip(".")}')
+        }
+
+        expiry = math.inf
+        for name in self.auth_cookie_names:
+            if name not in expires_by_name:
+                return 0.0
+
+            # session cookies have no expiry
+            if expires_by_name[name] > 0:
+                expiry = min(expiry, expires_by_name[name])
+
+        return expiry
+
+    def ensure_session(self):
+        """
+        Logs in unless the session is known to be valid.
+
+        A successful probe is trusted for `session_ttl_seconds`, or until the auth
+        cookies expire, so the probe is not repeated on every call.
+        """
+        if time.time() < self._session_valid_until:
+            return
+
+        cookie_expiry = self.get_session_cookie_expiry()
+
+        if time.time() < cookie_expiry:
+            with metrics.span('session_probe', provider=self.provider):
+                authenticated = self.is_authenticated()
+        else:
+            authenticated = False
+
+        if authenticated:
+            self.logger.debug('Session is valid')
+        else:
+            self.logger.info('Login required')
+            with metrics.span('login', provider=self.provider):
+                if self.cookie_browser:
+                    self.import_browser_cookies()
+                else:
+                    self.login()
+            cookie_expiry = self.get_session_cookie_expiry()
+
+        valid_until = time.time() + self.session_ttl_seconds
+        if cookie_expiry > time.time():
+            valid_until = min(valid_until, cookie_expiry)
+
+        self._session_valid_until = valid_until
+
+    def invalidate_session(self):
+        """
+        Forgets the session validity, e.g. after a 401 or a redirect to the login
+        page, so it is probed again on the next `ensure_session`.
+        """
+        self._session_valid_until = 0.0
+
+    def reload_if_logged_out(self, page: Page, url: str):
+        """
+        Loads `url` again if the page was redirected to the login page, after
+        validating the session.
+        """
+        if not self.is_login_url(page.url):
+            return
+
+        self.invalidate_session()
+        self.ensure_session()
+        page.goto(url)
+
+    @abc.abstractmethod
+    def login(self):
+        """
+        Logs in to the provider and saves the session to the storage state.
+        """
+
+    def fetch_html(self, url: str) -> Optional[Element]:
+        """
+        Fetches a server-rendered page with the session of the HTTP client.
+        Returns None if the page is not served to the session, i.e. it redirects.
+        """
+        response = self.client.get(url, follow_redirects=False)
+        metrics.inc('pages_total', provider=self.provider, fetch_mode=FetchMode.HTTP)
+
+        if response.status_code == 401 or (
+            response.is_redirect
+            and self.is_login_url(response.headers.get('location', ''))
+        ):
+            self.invalidate_session()
+
+        if response.is_redirect or response.status_code in (401, 403):
+            self.logger.info(f'Not served without a browser: {url}')
+            return None
+
+        response.raise_for_status()
+        return parse_html(response.text)
+
+    def is_blocked_request(self, resource_type: str, url: str) -> bool:
+        """
+        Whether lean browsing mode aborts the request: heavy resources the scraper
+        does not read, and third-party trackers.
+        """
+        if resource_type in BLOCKED_RESOURCE_TYPES - self.allowed_resource_types:
+            return True
+
+        host = urllib.parse.urlsplit(url).hostname or ''
+        return any(
+            host == domain or host.endswith(f'.{domain}')
+            for domain in TRACKER_DOMAINS - self.allowed_domains
+        )
+
+    def _handle_lean_route(self, route: Route):
+        request = route.request
+
+        if self.is_blocked_request(request.resource_type, request.url):
+            route.abort()
+        else:
+            route.fallback()
+
+    def map_pages(
+        self,
+        urls: Iterable[str],
+        parse: Callable[[Page], T],
+        setup: Optional[Callable[[Page], None]] = None,
+        phase: str = 'page',
+        return_exceptions: bool = False,
+    ) -> Iterator[Union[T, Exception]]:
+        """
+        Loads `urls` on a pool of up to `concurrency` reusable pages and yields
+        `parse(page)` for each url, in the order of `urls`. `setup` is called once
+        for each page of the pool, before its first navigation. Loading and parsing
+        each page is timed as `phase`.
+
+        With `return_exceptions`, the error of a page, in navigating to it, loading
+        or parsing it, is yielded in place of its result instead of stopping the
+        others.
+
+        The next pages keep loading in the browser while the current one is parsed,
+        so network waits overlap even though the sync API handles one page at a time.
+        Pages redirected to the login page are loaded again once the session is
+        validated.
+        """
+        urls = iter(urls)
+        pages: list[Page] = []
+        # the page, its url, and the error in starting to navigate to it
+        in_flight: collections.deque[tuple[Page, str, Optional[Exception]]] = (
+            collections.deque()
+        )
+
+        try:
+            for url in itertools.islice(urls, self.concurrency):
+                page = self.browser_context.new_page()
+                pages.append(page)
+                if setup:
+                    setup(page)
+                in_flight.append((page, url, self._start_navigation(page, url)))
+
+            while in_flight:
+                page, url, navigation_error = in_flight.popleft()
+
+                try:
+                    with metrics.span(
+                        phase, provider=self.provider, fetch_mode=FetchMode.BROWSER
+                    ):
+                        if navigation_error is not None:
+                            raise navigation_error
+
+                        page.wait_for_load_state()
+                        self.reload_if_logged_out(page, url)
+                        result = parse(page)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    if not return_exceptions:
+                        raise
+
+                    self.logger.warning(f'Failed to load `{url}`: {e}')
+                    result = e
+
+                metrics.inc(
+                    'pages_total', provider=self.provider, fetch_mode=FetchMode.BROWSER
+                )
+
+                next_url = next(urls, None)
+                if next_url is not None:
+                    in_flight.append(
+                        (page, next_url, self._start_navigation(page, next_url))
+                    )
+
+                yield result
+        finally:
+            for page in pages:
+                page.close()
+
+    @staticmethod
+    def _start_navigation(page: Page, url: str) -> Optional[Exception]:
+        """
+        Starts navigating to `url` without waiting for the page to load, and
+        returns the error if it fails, to be raised in the turn of the url.
+        """
+        try:
+            page.goto(url, wait_until='commit')
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            return e
+
+        return None
+
+    def map_fetches(
+        self,
+        items: Iterable[U],
+        fetch: Callable[[U], T],
+        phase: str = 'fetch',
+        return_exceptions: bool = False,
+    ) -> Iterator[Union[T, Exception]]:
+        """
+        Calls `fetch` for each item on a pool of `concurrency` threads and yields the
+        results in the order of `items`. Each fetch is timed as `phase`.
+
+        With `return_exceptions`, the error of a fetch is yielded in place of its
+        result instead of stopping the others.
+
+        Only `concurrency` fetches run ahead of the consumer, so a slow consumer
+        holds back the fetches instead of piling up their results.
+        """
+        items = iter(items)
+
+        def timed_fetch(item: U) -> T:
+            with metrics.span(phase, provider=self.provider, fetch_mode=FetchMode.HTTP):
+                return fetch(item)
+
+        with concurrent.futures.ThreadPoolExecutor(self.concurrency) as executor:
+            in_flight: collections.deque[concurrent.futures.Future] = collections.deque(
+                executor.submit(timed_fetch, item)
+                for item in itertools.islice(items, self.concurrency)
+            )
+
+            try:
+                while in_flight:
+                    try:
+                        result = in_flight.popleft().result()
+                    except Exception as e:  # pylint: disable=broad-exception-caught
+                        if not return_exceptions:
+                            raise
+
+                        self.logger.warning(f'Failed to fetch: {e}')
+                        result = e
+
+                    next_item = next(items, None)
+                    if next_item is not None:
+                        in_flight.append(executor.submit(timed_fetch, next_item))
+
+                    yield result
+            finally:
+                for future in in_flight:
+                    future.cancel()
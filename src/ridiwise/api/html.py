@@ -0,0 +1,134 @@
+from html.parser import HTMLParser
+from typing import Callable, Iterator, Optional, Union
+
+# elements which never have children nor an end tag
+VOID_ELEMENTS = frozenset(
+    {
+        'area',
+        'base',
+        'br',
+        'col',
+        'embed',
+        'hr',
+        'img',
+        'input',
+        'link',
+        'meta',
+        'source',
+        'track',
+        'wbr',
+    }
+)
+
+
+class Element:
+    """
+    Minimal DOM element to read server-rendered pages without a browser.
+    """
+
+    def __init__(
+        self,
+        tag: str,
+        attrs: dict[str, Optional[str]],
+        parent: Optional['Element'] = None,
+    ):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children: list[Union['Element', str]] = []
+
+    def __repr__(self):
+        return f'<Element {self.tag} {self.attrs}>'
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        value = self.attrs.get(name)
+        return default if value is None else value
+
+    @property
+    def classes(self) -> set[str]:
+        return set(self.get('class', '').split())
+
+    def has_class(self, *names: str) -> bool:
+        return self.classes.issuperset(names)
+
+    @property
+    def text(self) -> str:
+        """
+        Text content of the element, with line breaks for `<br>`.
+        """
+        parts = []
+        for child in self.children:
+            if isinstance(child, str):
+                parts.append(child)
+            elif child.tag == 'br':
+                parts.append('\n')
+            else:
+                parts.append(child.text)
+        return ''.join(parts)
+
+    def iter(self) -> Iterator['Element']:
+        """
+        Iterates over the descendant elements in document order.
+        """
+        for child in self.children:
+            if isinstance(child, Element):
+                yield child
+                yield from child.iter()
+
+    def find_all(
+        self,
+        tag: Optional[str] = None,
+        class_: Optional[str] = None,
+        predicate: Optional[Callable[['Element'], bool]] = None,
+    ) -> list['Element']:
+        return [
+            elem
+            for elem in self.iter()
+            if (tag is None or elem.tag == tag)
+            and (class_ is None or elem.has_class(class_))
+            and (predicate is None or predicate(elem))
+        ]
+
+    def find(
+        self,
+        tag: Optional[str] = None,
+        class_: Optional[str] = None,
+        predicate: Optional[Callable[['Element'], bool]] = None,
+    ) -> Optional['Element']:
+        return next(iter(self.find_all(tag, class_, predicate)), None)
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Element('#document', {})
+        self.current = self.root
+
+    def handle_starttag(self, tag, attrs):
+        elem = Element(tag, dict(attrs), parent=self.current)
+        self.current.children.append(elem)
+
+        if tag not in VOID_ELEMENTS:
+            self.current = elem
+
+    def handle_startendtag(self, tag, attrs):
+        self.current.children.append(Element(tag, dict(attrs), parent=self.current))
+
+    def handle_endtag(self, tag):
+        # close the nearest open element, implicitly closing the unclosed ones
+        elem = self.current
+        while elem is not self.root:
+            if elem.tag == tag:
+                self.current = elem.parent
+                return
+            elem = elem.parent
+
+    def handle_data(self, data):
+        self.current.children.append(data)
+
+
+def parse_html(html: str) -> Element:
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
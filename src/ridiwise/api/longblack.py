@@ -1,25 +1,62 @@
+import contextlib
 import datetime
+import hashlib
+import json
 import re
+import time
 import urllib.parse
-from typing import Optional, TypedDict
+from pathlib import Path
+from typing import Callable, Generator, Iterable, Iterator, Optional, TypedDict
 from zoneinfo import ZoneInfo
 
 from playwright.sync_api import (
     Locator,
+    Page,
 )
 from playwright.sync_api import (
     TimeoutError as PlaywrightTimeoutError,
 )
 
+from ridiwise import metrics
 from ridiwise.api.browser_base_client import BrowserBaseClient
+from ridiwise.api.settings import FetchMode
 
 DOMAIN = 'www.longblack.co'
-COOKIE_DOMAIN = f'https://{DOMAIN}'
 
 SELECTOR_LOGIN_USER_ID = 'form.login-form input[name="email"]'
 SELECTOR_LOGIN_PASSWORD = 'form.login-form input[name="password"]'
 SELECTOR_LOGIN_BUTTON = 'form.login-form button[type="submit"]'
 
+SELECTOR_SCRAP_ITEMS = '.swiper-slide:has(div.scrap)'
+
+# read every scrap of a listing page in a single round trip to the browser,
+# with the memo when its modal is already rendered with the scrap
+SCRIPT_SCRAP_ITEMS = """
+items => items.map(item => {
+    const noteInfo = item.querySelector('a.note-info');
+    const memoButton = item.querySelector('.actions button.show-memo');
+    const memoIndicator = memoButton?.querySelector('.memo-icon.dot') ?? null;
+    const memoBox = item.querySelector('.memo-modal textarea');
+    const coverImage = noteInfo.querySelector('img');
+    return {
+        highlighted_text: item.querySelector('.scrap-content').innerText.trim(),
+        date: item.querySelector('.date').textContent.trim(),
+        scrap_url: noteInfo.getAttribute('href'),
+        note_title: noteInfo.querySelector('span').textContent.trim(),
+        note_cover_image_url: coverImage?.getAttribute('src') ?? null,
+        has_memo: memoIndicator !== null && memoIndicator.checkVisibility(),
+        memo: memoBox?.value ?? null,
+    };
+})
+"""
+
+# recent listing pages only, to avoid spamming the server
+MAX_LISTING_PAGES = 20
+
+MEMO_CACHE_FILENAME = 'memo_cache_longblack.json'
+# memos can be edited without a trace on the listing, so they are read again
+MEMO_CACHE_TTL = datetime.timedelta(days=7)
+
 
 class Note(TypedDict):
     """
@@ -46,23 +83,112 @@ class Scrap(TypedDict):
     note: Note
 
 
+class ScrapItem(TypedDict):
+    """
+    Scrap item of the scrap page, as read from the DOM
+    """
+
+    highlighted_text: str
+    date: str
+    scrap_url: str
+    note_title: str
+    note_cover_image_url: Optional[str]
+    has_memo: bool
+    # when the memo is in the page without opening its modal
+    memo: Optional[str]
+
+
+class MemoCacheEntry(TypedDict):
+    signature: str
+    memo: str
+    cached_at: float
+
+
+class MemoCache:
+    """
+    Memos read before, by scrap id, so the modals of unchanged scraps are not
+    opened again.
+
+    An entry is used only while the scrap shows the same text and date, and up to
+    `ttl` after it was read.
+    """
+
+    def __init__(self, path: Path, ttl: datetime.timedelta = MEMO_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries: dict[str, MemoCacheEntry] = {}
+        self.changed = False
+
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    @staticmethod
+    def get_signature(item: ScrapItem) -> str:
+        payload = json.dumps([item['highlighted_text'], item['date']])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, scrap_id: str, signature: str) -> Optional[str]:
+        entry = self.entries.get(scrap_id)
+        if entry is None or entry['signature'] != signature:
+            return None
+
+        if time.time() - entry['cached_at'] > self.ttl.total_seconds():
+            return None
+
+        return entry['memo']
+
+    def set(self, scrap_id: str, signature: str, memo: str):
+        self.entries[scrap_id] = {
+            'signature': signature,
+            'memo': memo,
+            'cached_at': time.time(),
+        }
+        self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        self.changed = False
+
+
 class LongblackClient(BrowserBaseClient):
     base_url = f'https://{DOMAIN}'
     provider = 'longblack'
     storage_state_filename = f'browser_state_{provider}.json'
+    authenticated_path = '/membership'
+    login_path = '/login'
+    cookie_domain = 'longblack.co'
+    # memo indicators and modals are shown and hidden by the styles
+    allowed_resource_types = frozenset({'stylesheet'})
 
     def __init__(
         self,
-        user_id: str,
-        password: str,
+        user_id: Optional[str],
+        password: Optional[str],
         *args,
+        refresh_memos: bool = False,
         **kwargs,
     ):
         self.user_id = user_id
         self.password = password
+        # read every memo from its modal, e.g. for a full sync
+        self.refresh_memos = refresh_memos
 
         super().__init__(*args, **kwargs)
 
+        self.memo_cache = MemoCache(self.cache_dir / MEMO_CACHE_FILENAME)
+
+    def __exit__(self, *args):
+        self.memo_cache.save()
+        super().__exit__(*args)
+
     @staticmethod
     def parse_scrap_url(url) -> Optional[tuple[str, str]]:
         """
@@ -116,74 +242,348 @@ class LongblackClient(BrowserBaseClient):
 
             try:
                 page.wait_for_url('**/membership')
-                self.cache_dir.mkdir(parents=True, exist_ok=True)
-                self.browser_context.storage_state(
-                    path=self.cache_dir / self.storage_state_filename
-                )
+                self.save_storage_state()
             except PlaywrightTimeoutError as e:
                 self.logger.error('Login timeout')
                 raise e
 
-    def is_authenticated(self) -> bool:
-        with self.browser_context.new_page() as page:
-            res = page.request.get(f'{self.base_url}/membership', max_redirects=0)
-            return res.ok
+    def get_scraps(
+        self,
+        since: Optional[datetime.datetime] = None,
+    ) -> list[Scrap]:
+        return list(self.iter_scraps(since))
 
-    def get_scraps(self) -> list[Scrap]:
-        if not self.is_authenticated():
-            self.logger.info('Login required')
-            self.login()
+    def iter_scraps(
+        self,
+        since: Optional[datetime.datetime] = None,
+        on_error: Optional[Callable[[str, Exception], None]] = None,
+    ) -> Iterator[Scrap]:
+        """
+        Yields the scraps, newest first, a listing page at a time.
 
-        scraps = []
+        The listing pages are loaded `concurrency` at a time. The listing is sorted
+        by the latest, so when `since` is given, it stops at the first scrap created
+        before it instead of walking all the pages, and the first page is loaded
+        alone. Scraps added while the pages are loaded shift the older ones to the
+        next page, so the scraps are deduplicated by id.
 
-        # get recent 20 pages only to avoid spamming the server
-        for page_num in range(1, 21):
-            query_params = urllib.parse.urlencode(
-                {
-                    'page': page_num,
-                    'view': 'note',
-                    'sort': 'latest',
-                    'search': '',
-                }
+        When `on_error` is given, a listing page that fails is skipped, and
+        `on_error` is called with its URL and the error, e.g. to read it again with
+        `iter_scraps_of_pages`.
+        """
+        self.ensure_session()
+
+        urls = [
+            self._get_listing_url(page_num)
+            for page_num in range(1, MAX_LISTING_PAGES + 1)
+        ]
+
+        yield from self._iter_unique_scraps(self._iter_listing(urls, since, on_error))
+
+    def iter_scraps_of_pages(
+        self,
+        urls: list[str],
+        since: Optional[datetime.datetime] = None,
+        on_error: Optional[Callable[[str, Exception], None]] = None,
+    ) -> Iterator[Scrap]:
+        """
+        Yields the scraps of the given listing pages, as `iter_scraps` does.
+        """
+        self.ensure_session()
+
+        yield from self._iter_unique_scraps(
+            self._iter_listing_pages(urls, since, on_error)
+        )
+
+    @staticmethod
+    def _iter_unique_scraps(pages: Iterable[list[Scrap]]) -> Iterator[Scrap]:
+        scrap_ids = set()
+        for page_scraps in pages:
+            for scrap in page_scraps:
+                if scrap['scrap_id'] not in scrap_ids:
+                    scrap_ids.add(scrap['scrap_id'])
+                    yield scrap
+
+    def _iter_listing(
+        self,
+        urls: list[str],
+        since: Optional[datetime.datetime],
+        on_error: Optional[Callable[[str, Exception], None]],
+    ) -> Iterator[list[Scrap]]:
+        if not since:
+            yield from self._iter_listing_pages(urls, since, on_error)
+            return
+
+        # the scraps since the last sync are mostly on the first page, so the
+        # others are only loaded when it does not reach `since`
+        reached_end = yield from self._iter_listing_pages(urls[:1], since, on_error)
+        if not reached_end:
+            yield from self._iter_listing_pages(urls[1:], since, on_error)
+
+    def _iter_listing_pages(
+        self,
+        urls: list[str],
+        since: Optional[datetime.datetime],
+        on_error: Optional[Callable[[str, Exception], None]],
+    ) -> Generator[list[Scrap], None, bool]:
+        """
+        Yields the scraps of the listing pages, up to the end of the listing or
+        `since`, and returns whether it was reached.
+        """
+        page_count = 0
+
+        if self.fetch_mode == FetchMode.HTTP:
+            pages, reached_end = self._get_listing_over_http(urls, since, on_error)
+            yield from pages
+
+            if reached_end:
+                return True
+
+            page_count = len(pages)
+
+        with contextlib.closing(
+            self.map_pages(
+                urls[page_count:],
+                lambda page: self._get_scraps_from_dom_page(page, since),
+                phase='scraps',
+                return_exceptions=on_error is not None,
             )
+        ) as results:
+            for url, result in zip(urls[page_count:], results):
+                if isinstance(result, Exception):
+                    on_error(url, result)
+                    continue
+
+                page_scraps, reached_since = result
+                yield page_scraps
+
+                if reached_since:
+                    self.logger.info(f'Reached scraps synced before: {since}')
+
+                if reached_since or not page_scraps:
+                    return True
+
+        return False
+
+    def _get_listing_url(self, page_num: int) -> str:
+        query_params = urllib.parse.urlencode(
+            {
+                'page': page_num,
+                'view': 'note',
+                'sort': 'latest',
+                'search': '',
+            }
+        )
+        return f'{self.base_url}/scrap?{query_params}'
+
+    def _get_listing_over_http(
+        self,
+        urls: list[str],
+        since: Optional[datetime.datetime],
+        on_error: Optional[Callable[[str, Exception], None]],
+    ) -> tuple[list[list[Scrap]], bool]:
+        """
+        Returns the scraps of the leading listing pages read over HTTP, and whether
+        they reach the end of the listing or `since`.
 
-            with self.browser_context.new_page() as page:
-                page.goto(f'{self.base_url}/scrap?{query_params}')
-                items = page.locator('.swiper-slide:has(div.scrap)').all()
+        Pages with memos only available from their modals are loaded in the
+        browser afterwards. It stops at the first page not rendered by the server,
+        or which failed, leaving the rest to the browser. A page which fails in the
+        browser is left empty, after calling `on_error`.
 
-                if not items:
+        Scrap dates have a minute resolution, so the scraps from the same minute as
+        `since` are kept and left to the caller.
+        """
+        pages: list[Optional[list[Scrap]]] = []
+        reached_end = False
+
+        with contextlib.closing(
+            self.map_fetches(
+                urls,
+                self._fetch_scrap_items,
+                phase='scraps',
+                return_exceptions=on_error is not None,
+            )
+        ) as results:
+            for items in results:
+                # an empty page is the end only once the listing is known to be
+                # rendered by the server
+                if (
+                    items is None
+                    or isinstance(items, Exception)
+                    or (not items and not pages)
+                ):
                     break
 
-                scraps.extend([self._parse_dom(item) for item in items])
+                items, reached_since = self._take_since(items, since)
+                memos = [self._get_known_memo(item) for item in items]
+
+                # other memos are only available from the modals of the rendered page
+                if all(
+                    memo is not None or not item['has_memo']
+                    for item, memo in zip(items, memos)
+                ):
+                    pages.append(
+                        [
+                            self._get_scrap_from_item(item, memo)
+                            for item, memo in zip(items, memos)
+                        ]
+                    )
+                else:
+                    pages.append(None)
+
+                if reached_since:
+                    self.logger.info(f'Reached scraps synced before: {since}')
+
+                if reached_since or not items:
+                    reached_end = True
+                    break
 
-        return scraps
+        rendered_urls = [
+            url for url, page_scraps in zip(urls, pages) if page_scraps is None
+        ]
 
-    def _parse_dom(self, elem: Locator) -> Scrap:
-        highlighted_text = elem.locator('.scrap-content').inner_text().strip()
-        date_str = elem.locator('.date').text_content().strip()
-        scrap_date = self.parse_scrap_date(date_str)
+        with contextlib.closing(
+            self.map_pages(
+                rendered_urls,
+                lambda page: self._get_scraps_from_dom_page(page, since)[0],
+                phase='scraps',
+                return_exceptions=on_error is not None,
+            )
+        ) as rendered:
+            rendered_pages = dict(zip(rendered_urls, rendered))
 
-        note_info = elem.locator('a.note-info')
+        for url, page_scraps in rendered_pages.items():
+            if isinstance(page_scraps, Exception):
+                on_error(url, page_scraps)
+                rendered_pages[url] = []
 
-        scrap_url = note_info.get_attribute('href')
-        note_id, scrap_id = self.parse_scrap_url(scrap_url)
-        note_title = note_info.locator('span').text_content().strip()
-        note_cover_image_url = note_info.locator('img').get_attribute('src')
+        return [
+            rendered_pages[url] if page_scraps is None else page_scraps
+            for url, page_scraps in zip(urls, pages)
+        ], reached_end
+
+    def _get_scraps_from_dom_page(
+        self,
+        page: Page,
+        since: Optional[datetime.datetime],
+    ) -> tuple[list[Scrap], bool]:
+        locator = page.locator(SELECTOR_SCRAP_ITEMS)
+        items, reached_since = self._take_since(
+            locator.evaluate_all(SCRIPT_SCRAP_ITEMS), since
+        )
+
+        scraps = []
+        for index, item in enumerate(items):
+            memo = self._get_known_memo(item)
 
-        memo = self._get_memo(elem)
+            if memo is None and item['has_memo']:
+                with metrics.span('memo', provider=self.provider):
+                    memo = self._get_memo(locator.nth(index))
+
+                if memo is not None:
+                    self._cache_memo(item, memo)
+
+            scraps.append(self._get_scrap_from_item(item, memo))
+
+        return scraps, reached_since
+
+    def _take_since(
+        self,
+        items: list[ScrapItem],
+        since: Optional[datetime.datetime],
+    ) -> tuple[list[ScrapItem], bool]:
+        """
+        Returns the items created from `since`, and whether there were older ones.
+        """
+        if since:
+            for index, item in enumerate(items):
+                if self.parse_scrap_date(item['date']) < since:
+                    return items[:index], True
+
+        return items, False
+
+    def _get_known_memo(self, item: ScrapItem) -> Optional[str]:
+        """
+        Returns the memo of the item from the page or the cache, or None if it has
+        to be read from its modal.
+        """
+        if not item['has_memo']:
+            return None
+
+        if item['memo'] is not None:
+            self._cache_memo(item, item['memo'])
+            return item['memo']
+
+        if self.refresh_memos:
+            return None
+
+        _, scrap_id = self.parse_scrap_url(item['scrap_url'])
+        return self.memo_cache.get(scrap_id, MemoCache.get_signature(item))
+
+    def _cache_memo(self, item: ScrapItem, memo: str):
+        _, scrap_id = self.parse_scrap_url(item['scrap_url'])
+        self.memo_cache.set(scrap_id, MemoCache.get_signature(item), memo)
+
+    def _fetch_scrap_items(self, url: str) -> Optional[list[ScrapItem]]:
+        document = self.fetch_html(url)
+        if document is None:
+            return None
+
+        items: list[ScrapItem] = []
+        for slide in document.find_all(
+            class_='swiper-slide',
+            predicate=lambda elem: elem.find('div', class_='scrap') is not None,
+        ):
+            content = slide.find(class_='scrap-content')
+            date = slide.find(class_='date')
+            note_info = slide.find('a', class_='note-info')
+
+            if not all([content, date, note_info]):
+                self.logger.info(f'Scrap page is not server-rendered: {url}')
+                return None
+
+            note_title = note_info.find('span')
+            note_cover_image = note_info.find('img')
+            memo_indicator = slide.find(
+                predicate=lambda elem: elem.has_class('memo-icon', 'dot')
+            )
+            memo_modal = slide.find(class_='memo-modal')
+            memo_box = memo_modal.find('textarea') if memo_modal else None
+
+            items.append(
+                {
+                    'highlighted_text': content.text.strip(),
+                    'date': date.text.strip(),
+                    'scrap_url': note_info.get('href', ''),
+                    'note_title': note_title.text.strip() if note_title else '',
+                    'note_cover_image_url': (
+                        note_cover_image.get('src') if note_cover_image else None
+                    ),
+                    'has_memo': memo_indicator is not None,
+                    'memo': memo_box.text if memo_box else None,
+                }
+            )
+
+        return items
+
+    def _get_scrap_from_item(self, item: ScrapItem, memo: Optional[str]) -> Scrap:
+        scrap_url = item['scrap_url']
+        note_id, scrap_id = self.parse_scrap_url(scrap_url)
+        note_title = item['note_title']
 
         return {
             'scrap_id': scrap_id,
             'scrap_url': scrap_url,
-            'highlighted_text': highlighted_text,
+            'highlighted_text': item['highlighted_text'],
             'memo': memo,
-            'created_datetime': scrap_date,
+            'created_datetime': self.parse_scrap_date(item['date']),
             'note': {
                 'title': note_title,
                 'note_url': f'{self.base_url}/note/{note_id}',
                 'note_id': note_id,
                 'author': self.get_author_from_scrap_title(note_title),
-                'cover_image_url': note_cover_image_url,
+                'cover_image_url': item['note_cover_image_url'],
             },
         }
 
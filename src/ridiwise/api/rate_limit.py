@@ -0,0 +1,113 @@
+import datetime
+import email.utils
+import threading
+import time
+from typing import Callable, Optional
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a `Retry-After` header value, either delay seconds or an HTTP date, into
+    seconds to wait.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+class RateLimiter:  # pylint: disable=too-many-instance-attributes
+    """
+    Token bucket shared by every request to an API.
+
+    The rate is halved whenever the server responds with 429 and requests are held
+    back for its `Retry-After`, then it recovers step by step with each successful
+    response up to `max_rate`.
+    """
+
+    # fraction of `max_rate` regained with each successful response
+    recovery_step = 0.05
+
+    def __init__(
+        self,
+        max_rate: float,
+        burst: int = 1,
+        min_rate: float = 0.1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.clock = clock
+
+        self.rate = max_rate
+        self.tokens = float(burst)
+        self.updated_at = clock()
+        self.blocked_until = 0.0
+
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        # no tokens are earned while blocked by a `Retry-After`
+        if now <= self.updated_at:
+            return
+
+        elapsed = now - self.updated_at
+        self.tokens = min(float(self.burst), self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        """
+        Takes a token and returns the seconds to wait before sending the request.
+        """
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+
+            self.tokens -= 1
+            debt = max(0.0, -self.tokens)
+
+            return max(now, self.blocked_until) - now + debt / self.rate
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_success(self):
+        with self.lock:
+            self._refill(self.clock())
+            self.rate = min(
+                self.max_rate, self.rate + self.max_rate * self.recovery_step
+            )
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+
+            self.rate = max(self.min_rate, self.rate / 2)
+
+            if retry_after is None:
+                retry_after = 1 / self.rate
+
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+            # once the block ends, a single request goes at once and the next ones
+            # are spaced at the lowered rate, instead of all being released together
+            self.tokens = 1.0
+            self.updated_at = max(self.updated_at, self.blocked_until)
@@ -1,13 +1,31 @@
+import concurrent.futures
+import gzip
 import json
-from typing import Literal, Optional, TypeAlias, TypedDict
+import logging
+from typing import Iterable, Iterator, Literal, Optional, TypeAlias, TypedDict
 
 import httpx
 
+from ridiwise import metrics
 from ridiwise.api.base_client import BaseClient, HTTPTokenAuth
+from ridiwise.api.rate_limit import RateLimiter, parse_retry_after
+from ridiwise.api.settings import TransportSettings
 
 # https://readwise.io/api_deets
 API_BASE_URL = 'https://readwise.io/api/v2'
 
+MAX_HIGHLIGHTS_PER_REQUEST = 200
+MAX_REQUEST_BYTES = 512 * 1024
+MAX_IN_FLIGHT_REQUESTS = 4
+
+# request bodies from this size are gzipped when compression is enabled
+COMPRESS_MIN_BYTES = 16 * 1024
+COMPRESS_LEVEL = 6
+
+# https://readwise.io/api_deets: "The default base rate is 240 requests per minute"
+MAX_REQUESTS_PER_SECOND = 240 / 60
+MAX_RATE_LIMIT_RETRIES = 5
+
 
 BookCategory: TypeAlias = Literal['books', 'articles', 'tweets', 'podcasts']
 HighlightLocationType: TypeAlias = Literal['page', 'order', 'time_offset']
@@ -59,20 +77,146 @@ class CreateHighlightTagResponse(TypedDict):
     name: str
 
 
+def encode_json(value) -> bytes:
+    """
+    Serializes a request body as compact JSON.
+    """
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def chunk_highlights(
+    highlights: Iterable[CreateHighlightRequestItem],
+    max_count: int = MAX_HIGHLIGHTS_PER_REQUEST,
+    max_bytes: int = MAX_REQUEST_BYTES,
+) -> Iterator[list[CreateHighlightRequestItem]]:
+    """
+    Splits highlights into chunks of at most `max_count` items and about
+    `max_bytes` of serialized JSON. A single highlight larger than `max_bytes` is
+    sent in a chunk of its own.
+    """
+    chunk = []
+    chunk_bytes = 0
+
+    for highlight in highlights:
+        highlight_bytes = len(encode_json(highlight)) + 1
+
+        if chunk and (
+            len(chunk) >= max_count or chunk_bytes + highlight_bytes > max_bytes
+        ):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+
+        chunk.append(highlight)
+        chunk_bytes += highlight_bytes
+
+    if chunk:
+        yield chunk
+
+
+def merge_highlights_responses(
+    responses: Iterable[CreateHighlightsResponse],
+) -> CreateHighlightsResponse:
+    """
+    Merges the responses of chunked requests into one, combining the entries of
+    the same book.
+    """
+    merged: dict[int, CreateHighlightResponseItem] = {}
+
+    for response in responses:
+        for item in response:
+            if item['id'] not in merged:
+                merged[item['id']] = {**item, 'modified_highlights': []}
+
+            merged_item = merged[item['id']]
+            merged_item.update(
+                {
+                    key: value
+                    for key, value in item.items()
+                    if key != 'modified_highlights'
+                }
+            )
+            merged_item['modified_highlights'].extend(item['modified_highlights'])
+
+    return list(merged.values())
+
+
 class ReadwiseClient(BaseClient):
     base_url = API_BASE_URL
     provider = 'readwise'
 
-    def __init__(self, token, *args, **kwargs):
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        token,
+        *args,
+        max_highlights_per_request: int = MAX_HIGHLIGHTS_PER_REQUEST,
+        max_request_bytes: int = MAX_REQUEST_BYTES,
+        max_in_flight_requests: int = MAX_IN_FLIGHT_REQUESTS,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_rate_limit_retries: int = MAX_RATE_LIMIT_RETRIES,
+        transport_settings: Optional[TransportSettings] = None,
+        compress_requests: bool = False,
+        **kwargs,
+    ):
         if not token:
             raise ValueError(f'{self.provider}: `token` must be provided')
 
         self.auth = HTTPTokenAuth(keyword='Token', token=token)
-        super().__init__(*args, **kwargs)
+        self.max_highlights_per_request = max_highlights_per_request
+        self.max_request_bytes = max_request_bytes
+        self.max_in_flight_requests = max_in_flight_requests
+        self.rate_limiter = rate_limiter or RateLimiter(
+            max_rate=MAX_REQUESTS_PER_SECOND,
+            burst=max_in_flight_requests,
+        )
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.compress_requests = compress_requests
+        super().__init__(*args, transport_settings=transport_settings, **kwargs)
+
+    @property
+    def request_rate(self) -> float:
+        """
+        Current allowed requests per second, lowered after rate limited responses.
+        """
+        return self.rate_limiter.rate
+
+    def _should_retry(self, response: httpx.Response, attempt: int) -> bool:
+        if response.status_code != 429:
+            # error responses say nothing about the rate the API accepts
+            if response.is_success:
+                self.rate_limiter.on_success()
+            return False
+
+        if attempt >= self.max_rate_limit_retries:
+            return False
+
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        self.rate_limiter.on_rate_limited(retry_after)
+        metrics.inc('rate_limited_total', provider=self.provider)
+        self.logger.warning(
+            f'Rate limited, retrying after {retry_after or 0:.1f}s '
+            f'at {self.request_rate:.2f} requests/s'
+        )
+        return True
+
+    def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        attempt = 0
+
+        while True:
+            self.rate_limiter.acquire()
+
+            with metrics.span('request', provider=self.provider, method=method):
+                response = self.client.request(method, url, auth=self.auth, **kwargs)
+
+            if not self._should_retry(response, attempt):
+                return response
+
+            attempt += 1
 
     def validate_token(self):
         try:
-            response = self.client.get('/auth/', auth=self.auth)
+            response = self._request('GET', '/auth/')
             response.raise_for_status()
             return True
         except httpx.HTTPStatusError as e:
@@ -86,11 +230,60 @@ class ReadwiseClient(BaseClient):
         self,
         highlights: list[CreateHighlightRequestItem],
     ) -> CreateHighlightsResponse:
-        payload: CreateHighlightsRequest = {'highlights': highlights}
+        """
+        Creates the highlights, splitting large batches into chunks which are sent
+        concurrently.
+        """
+        chunks = list(
+            chunk_highlights(
+                highlights,
+                max_count=self.max_highlights_per_request,
+                max_bytes=self.max_request_bytes,
+            )
+        )
+
+        if len(chunks) <= 1:
+            response = self._create_highlights_chunk(highlights)
+        else:
+            self.logger.info(
+                f'Uploading {len(highlights)} highlights in {len(chunks)} chunks'
+            )
+            with concurrent.futures.ThreadPoolExecutor(
+                self.max_in_flight_requests
+            ) as executor:
+                responses = list(executor.map(self._create_highlights_chunk, chunks))
+
+            response = merge_highlights_responses(responses)
+
+        metrics.inc(
+            'highlights_uploaded_total', len(highlights), provider=self.provider
+        )
+        return response
+
+    def _post_json(self, url: str, payload) -> httpx.Response:
+        """
+        Posts the payload serialized once as compact JSON, gzipped from
+        `COMPRESS_MIN_BYTES` when request compression is enabled.
+        """
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(json.dumps(payload, indent=2, ensure_ascii=False))
+
+        content = encode_json(payload)
+        headers = {'Content-Type': 'application/json'}
+
+        if self.compress_requests and len(content) >= COMPRESS_MIN_BYTES:
+            content = gzip.compress(content, compresslevel=COMPRESS_LEVEL)
+            headers['Content-Encoding'] = 'gzip'
 
-        self.logger.debug(json.dumps(payload, indent=2, ensure_ascii=False))
+        return self._request('POST', url, content=content, headers=headers)
 
-        response = self.client.post('/highlights/', auth=self.auth, json=payload)
+    def _create_highlights_chunk(
+        self,
+        highlights: list[CreateHighlightRequestItem],
+    ) -> CreateHighlightsResponse:
+        payload: CreateHighlightsRequest = {'highlights': highlights}
+
+        response = self._post_json('/highlights/', payload)
         response.raise_for_status()
         return response.json()
 
@@ -102,11 +295,7 @@ class ReadwiseClient(BaseClient):
     ) -> Optional[CreateHighlightTagResponse]:
         payload: CreateHighlightTagRequest = {'name': tag}
 
-        response = self.client.post(
-            f'/highlights/{highlight_id}/tags/',
-            auth=self.auth,
-            json=payload,
-        )
+        response = self._post_json(f'/highlights/{highlight_id}/tags/', payload)
 
         if response.status_code == 400 and ignore_error_if_exists:
             try:
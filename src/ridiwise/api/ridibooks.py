@@ -1,39 +1,66 @@
+import contextlib
 import datetime
-import http.cookiejar
+import json
 import re
-from typing import Optional, TypedDict
+from typing import Callable, Iterator, Optional, TypedDict
 from zoneinfo import ZoneInfo
 
 from playwright.sync_api import (
-    ElementHandle,
+    Error as PlaywrightError,
+)
+from playwright.sync_api import (
+    Frame,
+    Page,
+    Response,
 )
 from playwright.sync_api import (
     TimeoutError as PlaywrightTimeoutError,
 )
 
+from ridiwise import metrics
 from ridiwise.api.browser_base_client import BrowserBaseClient
+from ridiwise.api.html import Element
+from ridiwise.api.settings import FetchMode, NoteExtractionMode
 
 DOMAIN = 'ridibooks.com'
-COOKIE_DOMAIN = f'https://{DOMAIN}'
 
 SELECTOR_LOGIN_USER_ID = 'input[placeholder="아이디"]'
 SELECTOR_LOGIN_PASSWORD = 'input[placeholder="비밀번호"]'
 
-BOOK_COVER_IMAGE_URL_FORMAT = 'https://img.ridicdn.net/cover/{book_id}/xxlarge#1'
+AUTH_COOKIE_NAMES = ('ridi-at', 'ridi-rt')
+
+SELECTOR_SHELF_ITEMS = 'article li'
+SELECTOR_NOTE_ITEMS = 'article li[id^="annotation_"]'
+SELECTOR_MORE_BUTTON = 'article button:has-text("더보기")'
+
+# read every item of a list in a single round trip to the browser
+SCRIPT_SHELF_ITEMS = """
+items => items.map(item => ({
+    title: item.querySelector('h3')?.innerText ?? null,
+    text: item.innerText,
+    links: Array.from(item.querySelectorAll('a'), link => ({
+        href: link.getAttribute('href') ?? '',
+        text: link.innerText,
+    })),
+}))
+"""
+SCRIPT_NOTE_ITEMS = """
+(items, offset) => items.slice(offset).map(item => ({
+    id: item.id,
+    paragraphs: Array.from(item.querySelectorAll('p'), p => p.innerText),
+}))
+"""
+SCRIPT_NOTE_ITEMS_GROWN = """
+([selector, count]) => document.querySelectorAll(selector).length > count
+"""
 
+BOOK_COVER_IMAGE_URL_FORMAT = 'https://img.ridicdn.net/cover/{book_id}/xxlarge#1'
 
-# pylint: disable=import-outside-toplevel
-def get_cookie_jar(browser: str) -> http.cookiejar.CookieJar:
-    import browser_cookie3
-
-    try:
-        cookie_jar_function = getattr(browser_cookie3, browser)
-        cookie_jar = cookie_jar_function(domain_name=DOMAIN)
-        return cookie_jar
-    except AttributeError as e:
-        raise RuntimeError(f'Browser "{browser}" is not supported.') from e
-    except Exception as e:
-        raise RuntimeError('Unable to import cookies from browser.') from e
+# XHR/fetch responses of the reading-note page that carry the annotations
+ANNOTATION_RESPONSE_URL_PATTERN = re.compile(r'annotation', re.IGNORECASE)
+ANNOTATION_TEXT_KEYS = ('highlighted_text', 'highlight', 'text', 'content')
+ANNOTATION_MEMO_KEYS = ('memo', 'note')
+ANNOTATION_DATE_KEYS = ('created_at', 'createdAt', 'created_date', 'created')
 
 
 class Note(TypedDict):
@@ -43,6 +70,31 @@ class Note(TypedDict):
     created_date: Optional[datetime.datetime]
 
 
+class ShelfItemLink(TypedDict):
+    href: str
+    text: str
+
+
+class ShelfItem(TypedDict):
+    """
+    Book item of the shelf page, as read from the DOM
+    """
+
+    title: Optional[str]
+    # whole text of the item, with the note count and date of the book
+    text: str
+    links: list[ShelfItemLink]
+
+
+class NoteItem(TypedDict):
+    """
+    Annotation item of the reading-note page, as read from the DOM
+    """
+
+    id: str
+    paragraphs: list[str]
+
+
 class Book(TypedDict):
     book_title: str
     book_url: str
@@ -51,22 +103,34 @@ class Book(TypedDict):
     notes: list[Note]
     authors: list[str]
     book_cover_image_url: str
+    # changes when notes are added to or removed from the book
+    shelf_summary: str
 
 
 class RidiClient(BrowserBaseClient):
     base_url = f'https://{DOMAIN}'
     provider = 'ridibooks'
     storage_state_filename = 'browser_state_ridibooks.json'
+    authenticated_path = '/account/myridi'
+    login_path = '/account/login'
+    auth_cookie_names = AUTH_COOKIE_NAMES
+    cookie_domain = DOMAIN
+    # visibility of the "더보기" button depends on the styles
+    allowed_resource_types = frozenset({'stylesheet'})
 
     def __init__(
         self,
-        user_id: str,
-        password: str,
+        user_id: Optional[str],
+        password: Optional[str],
         *args,
+        note_extraction_mode: NoteExtractionMode = NoteExtractionMode.DOM,
         **kwargs,
     ):
         self.user_id = user_id
         self.password = password
+        self.note_extraction_mode = note_extraction_mode
+
+        self._annotation_responses: dict[Page, list[Response]] = {}
 
         super().__init__(*args, **kwargs)
 
@@ -96,6 +160,112 @@ class RidiClient(BrowserBaseClient):
 
         return None
 
+    @staticmethod
+    def parse_annotation_datetime(value) -> Optional[datetime.datetime]:
+        """
+        Parses an annotation date from the API: epoch seconds/milliseconds, an ISO
+        8601 string or the 'YYYY.MM.DD.' format of the page.
+        """
+        timezone = ZoneInfo('Asia/Seoul')
+
+        if isinstance(value, bool) or value is None:
+            return None
+
+        if isinstance(value, (int, float)):
+            # milliseconds
+            if value > 1e11:
+                value /= 1000
+            return datetime.datetime.fromtimestamp(value, tz=timezone)
+
+        if not isinstance(value, str):
+            return None
+
+        try:
+            dt = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return RidiClient.parse_note_date(value)
+
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone)
+        return dt
+
+    @staticmethod
+    def is_annotation_response(response: Response) -> bool:
+        return (
+            response.request.resource_type in ('xhr', 'fetch')
+            and response.ok
+            and 'json' in response.headers.get('content-type', '')
+            and ANNOTATION_RESPONSE_URL_PATTERN.search(response.url) is not None
+        )
+
+    @classmethod
+    def parse_annotation_payload(cls, payload) -> list[Note]:
+        """
+        Builds notes from an annotation API payload, taking the items of the lists
+        at any depth which have an `id`, a highlighted text and a date field.
+        """
+        if isinstance(payload, dict):
+            return [
+                note
+                for value in payload.values()
+                for note in cls.parse_annotation_payload(value)
+            ]
+
+        if not isinstance(payload, list):
+            return []
+
+        notes: list[Note] = []
+        for item in payload:
+            note = cls._parse_annotation(item)
+            if note is None:
+                notes.extend(cls.parse_annotation_payload(item))
+            else:
+                notes.append(note)
+
+        return notes
+
+    @classmethod
+    def _parse_annotation(cls, item) -> Optional[Note]:
+        if not isinstance(item, dict):
+            return None
+
+        annotation_id = item.get('id')
+        if isinstance(annotation_id, bool) or not isinstance(annotation_id, (int, str)):
+            return None
+
+        highlighted_text = next(
+            (
+                item[key]
+                for key in ANNOTATION_TEXT_KEYS
+                if isinstance(item.get(key), str)
+            ),
+            None,
+        )
+        # other objects with an id and a text, e.g. a book with its description,
+        # have no creation date
+        if not highlighted_text or not any(key in item for key in ANNOTATION_DATE_KEYS):
+            return None
+
+        memo = next(
+            (
+                item[key].strip()
+                for key in ANNOTATION_MEMO_KEYS
+                if isinstance(item.get(key), str)
+            ),
+            None,
+        )
+        created_date = next(
+            (item[key] for key in ANNOTATION_DATE_KEYS if key in item),
+            None,
+        )
+
+        return {
+            'id': str(annotation_id),
+            'highlighted_text': highlighted_text.strip(),
+            'memo': memo or None,
+            'created_date': cls.parse_annotation_datetime(created_date),
+        }
+
     def login(self):
         self.logger.info('Login: `ridibooks.com`')
 
@@ -113,54 +283,194 @@ class RidiClient(BrowserBaseClient):
 
             try:
                 page.wait_for_url('**/myridi')
-                self.cache_dir.mkdir(parents=True, exist_ok=True)
-                self.browser_context.storage_state(
-                    path=self.cache_dir / self.storage_state_filename
-                )
+                self.save_storage_state()
             except PlaywrightTimeoutError as e:
                 self.logger.error('Login timeout')
                 raise e
 
-    def is_authenticated(self) -> bool:
-        with self.browser_context.new_page() as page:
-            res = page.request.get(f'{self.base_url}/account/myridi', max_redirects=0)
-            return res.ok
-
-    def is_cookie_authenticated(self):
-        return all(
-            next(
-                (
-                    cookie['value']
-                    for cookie in self.browser_context.cookies(COOKIE_DOMAIN)
-                    if cookie['name'] == auth_key
+    def get_books_from_shelf(self) -> list[Book]:
+        return list(self.iter_books_from_shelf())
+
+    def iter_books_from_shelf(
+        self,
+        book_filter: Optional[Callable[[list[Book]], list[Book]]] = None,
+        on_error: Optional[Callable[[Optional[Book], Exception], None]] = None,
+    ) -> Iterator[Book]:
+        """
+        Yields the books of the shelf with their notes, each as soon as its notes
+        are read. Books whose notes need the browser come after the others in
+        HTTP fetch mode.
+
+        `book_filter` is given every book of the shelf, without notes, and returns
+        the ones to read the notes of, e.g. the ones changed since the last sync.
+
+        When `on_error` is given, a book that fails is skipped, and `on_error` is
+        called with it, or None for a shelf item not read as a book, and the error.
+        """
+        self.ensure_session()
+
+        items = None
+        if self.fetch_mode == FetchMode.HTTP:
+            with metrics.span(
+                'shelf', provider=self.provider, fetch_mode=FetchMode.HTTP
+            ):
+                items = self._fetch_shelf_items()
+
+        if not items:
+            [items] = self.map_pages(
+                [f'{self.base_url}/reading-note/shelf'],
+                lambda page: page.locator(SELECTOR_SHELF_ITEMS).evaluate_all(
+                    SCRIPT_SHELF_ITEMS
                 ),
-                None,
+                phase='shelf',
             )
-            for auth_key in ['ridi-at', 'ridi-rt']
-        )
 
-    def get_books_from_shelf(self) -> list[Book]:
-        if not self.is_authenticated():
-            self.logger.info('Login required')
-            self.login()
+        books = []
+        for item in items:
+            try:
+                books.append(self._get_book_info_from_item(item))
+            except ValueError as e:
+                if on_error is None:
+                    raise
 
-        with self.browser_context.new_page() as page:
-            page.goto(f'{self.base_url}/reading-note/shelf')
-            items = page.query_selector_all('article li')
+                self.logger.warning(f'Skipped shelf item `{item["title"]}`: {e}')
+                on_error(None, e)
+
+        if book_filter is not None:
+            books = book_filter(books)
 
-            books = [self._get_book_info_from_dom(item) for item in items]
+        yield from self.iter_books_with_notes(books, on_error)
 
-            for book in books:
-                book['notes'] = self.get_notes_by_book(book['book_id'])
+    def iter_books_with_notes(
+        self,
+        books: list[Book],
+        on_error: Optional[Callable[[Optional[Book], Exception], None]] = None,
+    ) -> Iterator[Book]:
+        """
+        Yields the books with their notes, as `iter_books_from_shelf` does for the
+        books of the shelf.
+        """
+        self.ensure_session()
 
-            return books
+        if self.fetch_mode == FetchMode.HTTP:
+            rendered_books = []
+
+            with contextlib.closing(
+                self.map_fetches(
+                    books,
+                    self._fetch_notes,
+                    phase='notes',
+                    return_exceptions=on_error is not None,
+                )
+            ) as fetched_notes:
+                for book, notes in zip(books, fetched_notes):
+                    if isinstance(notes, Exception):
+                        on_error(book, notes)
+                        continue
+
+                    if notes is None:
+                        rendered_books.append(book)
+                        continue
+
+                    # the books of the shelf are not given the notes, so only the
+                    # books yielded and not yet released by the caller hold them
+                    yield {**book, 'notes': notes}
+        else:
+            rendered_books = books
+
+        # render the pages which could not be read without the browser
+        with contextlib.closing(
+            self.map_pages(
+                (book['book_notes_url'] for book in rendered_books),
+                self._get_notes_from_page,
+                setup=self._setup_notes_page,
+                phase='notes',
+                return_exceptions=on_error is not None,
+            )
+        ) as rendered_notes:
+            for book, notes in zip(rendered_books, rendered_notes):
+                if isinstance(notes, Exception):
+                    on_error(book, notes)
+                    continue
+
+                yield {**book, 'notes': notes}
+
+    def _fetch_shelf_items(self) -> Optional[list[ShelfItem]]:
+        document = self.fetch_html(f'{self.base_url}/reading-note/shelf')
+        if document is None:
+            return None
+
+        items: list[ShelfItem] = []
+        for article in document.find_all('article'):
+            for elem in article.find_all('li'):
+                title = elem.find('h3')
+                items.append(
+                    {
+                        'title': title.text.strip() if title else None,
+                        'text': elem.text,
+                        'links': [
+                            {'href': link.get('href', ''), 'text': link.text.strip()}
+                            for link in elem.find_all('a')
+                        ],
+                    }
+                )
+
+        if not items:
+            self.logger.info('Shelf is not server-rendered')
+
+        return items
+
+    def _fetch_notes(self, book: Book) -> Optional[list[Note]]:
+        """
+        Reads the notes of the server-rendered reading-note page. Returns None if
+        the page needs the browser: not rendered, or more notes behind "더보기".
+        """
+        document = self.fetch_html(book['book_notes_url'])
+        if document is None:
+            return None
+
+        articles = document.find_all('article')
+
+        if any(
+            article.find('button', predicate=lambda elem: '더보기' in elem.text)
+            for article in articles
+        ):
+            return None
+
+        note_elems: list[Element] = [
+            elem
+            for article in articles
+            for elem in article.find_all(
+                'li',
+                predicate=lambda elem: elem.get('id', '').startswith('annotation_'),
+            )
+        ]
+
+        # a book on the shelf has notes, so none means they are rendered by scripts
+        if not note_elems:
+            return None
+
+        notes = [
+            self._get_note_from_item(
+                {
+                    'id': elem.get('id'),
+                    'paragraphs': [p.text for p in elem.find_all('p')],
+                }
+            )
+            for elem in note_elems
+        ]
+        return [note for note in notes if note is not None]
+
+    def _get_book_info_from_item(self, item: ShelfItem) -> Book:
+        book_title = item['title']
+
+        if book_title is None:
+            raise ValueError('Failed to get book title')
 
-    def _get_book_info_from_dom(self, elem: ElementHandle) -> Book:
-        book_title = elem.query_selector('h3').inner_text()
         book_ids = [
-            self.extract_book_id(link.get_attribute('href'))
-            for link in elem.query_selector_all('a')
-            if link.get_attribute('href').startswith('/reading-note/detail/')
+            self.extract_book_id(link['href'])
+            for link in item['links']
+            if link['href'].startswith('/reading-note/detail/')
         ]
 
         # pylint: disable=consider-using-set-comprehension
@@ -172,9 +482,9 @@ class RidiClient(BrowserBaseClient):
         book_id = book_id_set.pop()
 
         authors = [
-            link.inner_text()
-            for link in elem.query_selector_all('a')
-            if link.get_attribute('href').startswith('/author/')
+            link['text']
+            for link in item['links']
+            if link['href'].startswith('/author/')
         ]
 
         return {
@@ -185,46 +495,168 @@ class RidiClient(BrowserBaseClient):
             'notes': [],
             'authors': authors,
             'book_cover_image_url': BOOK_COVER_IMAGE_URL_FORMAT.format(book_id=book_id),
+            'shelf_summary': ' '.join(item['text'].split()),
         }
 
-    def get_notes_by_book(self, book_id):
-        if not self.is_cookie_authenticated():
-            self.login()
+    def get_notes_by_book(self, book_id) -> list[Note]:
+        return list(self.iter_notes_by_book(book_id))
+
+    def iter_notes_by_book(self, book_id) -> Iterator[Note]:
+        """
+        Yields the notes of a book batch by batch, as the reading-note page loads
+        them.
+        """
+        self.ensure_session()
 
         with self.browser_context.new_page() as page:
-            page.goto(f'{self.base_url}/reading-note/detail/{book_id}')
-
-            # pylint: disable=fixme
-            # TODO: Implement handling when the number of notes is very large
-            for _ in range(5):
-                try:
-                    more_button = page.locator('article button:has-text("더보기")')
-                    if not more_button.is_visible(timeout=500):
-                        break
+            self._setup_notes_page(page)
+            url = f'{self.base_url}/reading-note/detail/{book_id}'
+            page.goto(url)
+            self.reload_if_logged_out(page, url)
+
+            yield from self._iter_notes_from_page(page)
+
+    def _setup_notes_page(self, page: Page):
+        if self.note_extraction_mode != NoteExtractionMode.NETWORK:
+            return
+
+        responses = self._annotation_responses.setdefault(page, [])
+
+        def on_response(response: Response):
+            if self.is_annotation_response(response):
+                responses.append(response)
+
+        def on_frame_navigated(frame: Frame):
+            if frame == page.main_frame:
+                responses.clear()
+
+        page.on('response', on_response)
+        page.on('framenavigated', on_frame_navigated)
+        page.on('close', lambda _: self._annotation_responses.pop(page, None))
+
+    def _get_notes_from_page(self, page: Page) -> list[Note]:
+        return list(self._iter_notes_from_page(page))
+
+    def _iter_notes_from_page(self, page: Page) -> Iterator[Note]:
+        if self.note_extraction_mode == NoteExtractionMode.NETWORK:
+            notes = self._get_notes_from_responses(page)
+            if notes is not None:
+                yield from notes
+                return
+
+            self.logger.warning(
+                f'No annotation responses captured from {page.url}, '
+                'falling back to the DOM'
+            )
+
+        yield from self._iter_notes_from_dom_page(page)
+
+    def _get_notes_from_responses(self, page: Page) -> Optional[list[Note]]:
+        """
+        Loads every annotation by following "더보기" until it disappears, waiting on
+        the annotation responses instead of the rendered list.
+
+        The notes are returned in the order of the rendered list, and the ones not
+        in the responses, e.g. the first batch rendered by the server, are read
+        from the DOM.
+        """
+        page.wait_for_load_state('networkidle')
+
+        more_button = page.locator(SELECTOR_MORE_BUTTON)
+        while more_button.is_visible():
+            try:
+                with page.expect_response(self.is_annotation_response):
                     more_button.click()
-                except PlaywrightTimeoutError:
-                    break
+            except PlaywrightTimeoutError:
+                break
 
-            note_items = page.query_selector_all('article li[id^="annotation_"]')
+        responses = self._annotation_responses.get(page)
+        if not responses:
+            return None
 
-            notes = [self._get_note_from_dom(item) for item in note_items]
-            return notes
+        notes: dict[str, Note] = {}
+        for response in responses:
+            try:
+                payload = response.json()
+            except (json.JSONDecodeError, PlaywrightError):
+                self.logger.warning(f'Invalid annotation response: {response.url}')
+                continue
 
-    def _get_note_from_dom(self, elem: ElementHandle) -> Optional[Note]:
-        annotation_id = elem.get_attribute('id').removeprefix('annotation_')
-        items = elem.query_selector_all('p')
+            for note in self.parse_annotation_payload(payload):
+                notes.setdefault(note['id'], note)
 
+        items: list[NoteItem] = page.locator(SELECTOR_NOTE_ITEMS).evaluate_all(
+            SCRIPT_NOTE_ITEMS, 0
+        )
         if not items:
+            return list(notes.values())
+
+        rendered_notes: list[Note] = []
+        for item in items:
+            note = notes.get(item['id'].removeprefix('annotation_'))
+            if note is None:
+                note = self._get_note_from_item(item)
+            if note is not None:
+                rendered_notes.append(note)
+
+        return rendered_notes
+
+    def _iter_notes_from_dom_page(self, page: Page) -> Iterator[Note]:
+        """
+        Yields the rendered notes, then follows "더보기" and yields the newly
+        appended ones, until the button disappears or the list stops growing.
+        """
+        note_items = page.locator(SELECTOR_NOTE_ITEMS)
+        more_button = page.locator(SELECTOR_MORE_BUTTON)
+        note_count = 0
+
+        while True:
+            items: list[NoteItem] = note_items.evaluate_all(
+                SCRIPT_NOTE_ITEMS, note_count
+            )
+            note_count += len(items)
+
+            for item in items:
+                note = self._get_note_from_item(item)
+                if note is not None:
+                    yield note
+
+            if not more_button.is_visible():
+                return
+
+            # keep the notes loaded so far
+            try:
+                more_button.click()
+            except PlaywrightTimeoutError:
+                self.logger.warning(f'Timed out loading more notes from {page.url}')
+                return
+
+            try:
+                page.wait_for_function(
+                    SCRIPT_NOTE_ITEMS_GROWN, arg=[SELECTOR_NOTE_ITEMS, note_count]
+                )
+            except PlaywrightTimeoutError:
+                page.wait_for_load_state('networkidle')
+
+                if note_items.count() <= note_count:
+                    self.logger.warning(f'No more notes loaded from {page.url}')
+                    return
+
+    def _get_note_from_item(self, item: NoteItem) -> Optional[Note]:
+        annotation_id = item['id'].removeprefix('annotation_')
+        paragraphs = item['paragraphs']
+
+        if not paragraphs:
             return None
 
-        highlighted_text = items[0].inner_text().strip()
+        highlighted_text = paragraphs[0].strip()
 
-        if len(items) == 3:
-            memo = items[1].inner_text().strip()
-            created_date = items[2].inner_text().strip()
+        if len(paragraphs) == 3:
+            memo = paragraphs[1].strip()
+            created_date = paragraphs[2].strip()
         else:
             memo = None
-            created_date = items[1].inner_text().strip()
+            created_date = paragraphs[1].strip()
 
         return {
             'id': annotation_id,
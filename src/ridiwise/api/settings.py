@@ -0,0 +1,51 @@
+"""
+Settings of the clients, kept apart from them so the CLI can parse its options
+without loading httpx or Playwright.
+"""
+
+import enum
+from typing import TypedDict
+
+DEFAULT_MAX_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_EXPIRY_SECONDS = 30.0
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 5.0
+DEFAULT_TIMEOUT_SECONDS = 30.0
+
+
+class TransportSettings(TypedDict, total=False):
+    max_connections: int
+    keepalive_expiry_seconds: float
+    http2: bool
+    connect_timeout_seconds: float
+    # for reading and writing a request, and waiting for a pooled connection
+    timeout_seconds: float
+
+
+@enum.unique
+class FetchMode(enum.StrEnum):
+    # render every page in the browser
+    BROWSER = 'browser'
+    # fetch the server-rendered pages with the saved session, and start the browser
+    # only to log in or for the pages which need interaction
+    HTTP = 'http'
+
+
+@enum.unique
+class CookieBrowser(enum.StrEnum):
+    # browsers the session cookies are imported from, with browser_cookie3
+    CHROME = 'chrome'
+    CHROMIUM = 'chromium'
+    EDGE = 'edge'
+    BRAVE = 'brave'
+    OPERA = 'opera'
+    VIVALDI = 'vivaldi'
+    FIREFOX = 'firefox'
+    SAFARI = 'safari'
+
+
+@enum.unique
+class NoteExtractionMode(enum.StrEnum):
+    # scrape the rendered annotation list
+    DOM = 'dom'
+    # read the annotation API responses loaded by the page
+    NETWORK = 'network'
@@ -0,0 +1,153 @@
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Optional, TextIO, TypeVar
+
+from ridiwise.cmd.snapshot import decode_record, encode_value
+
+CHECKPOINT_DIRNAME = 'runs'
+
+# rounds of retrying the failed items at the end of a run, and the wait before the
+# first one, doubled for each next round
+RETRY_ROUNDS = 3
+RETRY_BACKOFF_SECONDS = 5.0
+
+T = TypeVar('T')
+
+
+def retry_failed(
+    failed: list[T],
+    retry: Callable[[list[T]], list[T]],
+    logger: logging.Logger,
+    rounds: int = RETRY_ROUNDS,
+    backoff_seconds: float = RETRY_BACKOFF_SECONDS,
+) -> list[T]:
+    """
+    Retries the failed items in rounds with an exponential backoff, and returns the
+    ones still failing. `retry` is given the items of a round and returns the ones
+    which failed again.
+    """
+    # pylint: disable=too-many-arguments
+    for round_num in range(rounds):
+        if not failed:
+            break
+
+        delay = backoff_seconds * 2**round_num
+        logger.warning(f'Retrying {len(failed)} failed items in {delay:.0f}s')
+        time.sleep(delay)
+
+        failed = retry(failed)
+
+    return failed
+
+
+def has_failed_items(result_count: dict[str, int]) -> bool:
+    return any(
+        count for key, count in result_count.items() if key.startswith('failed_')
+    )
+
+
+class RunJournal:  # pylint: disable=too-many-instance-attributes
+    """
+    Checkpoint journal of a sync run, appended as JSON lines under the cache home:
+    the items scraped, with their records, and the ones uploaded.
+
+    The journal of a run that did not finish is kept, so a run resuming it skips
+    the items already uploaded and uploads the scraped ones without scraping them
+    again. It is removed once a run finishes.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        provider: str,
+        account: str,
+        resume: bool = False,
+    ):
+        self.path = cache_dir / CHECKPOINT_DIRNAME / f'{provider}.jsonl'
+        self.account = account
+        self.lock = threading.Lock()
+        self.file: Optional[TextIO] = None
+
+        self.scraped: dict[str, dict] = {}
+        self.uploaded: set[str] = set()
+        self.marks: set[str] = set()
+
+        self.entries: list[dict] = []
+        self.resumed = resume and self._load()
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # rewritten without a line left partial by an interrupted run
+        self.file = open(self.path, 'w', encoding='utf-8')  # pylint: disable=consider-using-with
+
+        if self.resumed:
+            for entry in self.entries:
+                self._append(entry)
+        else:
+            self._append({'event': 'start', 'account': self.account})
+
+        self.entries = []
+        return self
+
+    def __exit__(self, *args):
+        self.file.close()
+
+    def _load(self) -> bool:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    self.entries.append(json.loads(line, object_hook=decode_record))
+        except FileNotFoundError:
+            return False
+        except json.JSONDecodeError:
+            pass
+
+        if not self.entries or self.entries[0].get('account') != self.account:
+            self.entries = []
+            return False
+
+        for entry in self.entries[1:]:
+            if entry['event'] == 'scraped':
+                self.scraped[entry['id']] = entry['record']
+            elif entry['event'] == 'uploaded':
+                self.uploaded.update(entry['ids'])
+            elif entry['event'] == 'mark':
+                self.marks.add(entry['name'])
+
+        return True
+
+    def _append(self, entry: dict):
+        with self.lock:
+            self.file.write(
+                json.dumps(
+                    entry,
+                    ensure_ascii=False,
+                    separators=(',', ':'),
+                    default=encode_value,
+                )
+            )
+            self.file.write('\n')
+            self.file.flush()
+
+    def record_scraped(self, item_id: str, record: dict):
+        self._append({'event': 'scraped', 'id': item_id, 'record': record})
+
+    def record_uploaded(self, item_ids: Iterable[str]):
+        self._append({'event': 'uploaded', 'ids': list(item_ids)})
+
+    def mark(self, name: str):
+        """
+        Records a step of the run as done, e.g. reading the whole listing.
+        """
+        self._append({'event': 'mark', 'name': name})
+
+    def finish(self):
+        """
+        Removes the journal, as the run has nothing left to resume.
+        """
+        self.file.close()
+        self.path.unlink(missing_ok=True)
@@ -1,15 +1,33 @@
 from collections import defaultdict
+from pathlib import Path
+from typing import Optional
 
 import typer
 
+from ridiwise import metrics
+from ridiwise.api.settings import (
+    DEFAULT_CONNECT_TIMEOUT_SECONDS,
+    DEFAULT_KEEPALIVE_EXPIRY_SECONDS,
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_TIMEOUT_SECONDS,
+    FetchMode,
+)
 from ridiwise.cmd.context import ContextState
 
 
+# pylint: disable=too-many-arguments
 def check_common_options(
     ctx: typer.Context,
     headless_mode: bool,
     browser_timeout_seconds: int,
+    browser_concurrency: int,
+    lean_browsing: bool,
+    browser_endpoint: Optional[str],
+    fetch_mode: FetchMode,
     error_on_empty_source: bool,
+    full_sync: bool,
+    resume: bool,
+    metrics_file: Optional[Path],
 ):
     context: ContextState = ctx.ensure_object(dict)
 
@@ -18,7 +36,18 @@ def check_common_options(
 
     context['headless_mode'] = headless_mode
     context['browser_timeout_seconds'] = browser_timeout_seconds
+    context['browser_concurrency'] = browser_concurrency
+    context['lean_browsing'] = lean_browsing
+    context['browser_endpoint'] = browser_endpoint
+    context['fetch_mode'] = fetch_mode
     context['error_on_empty_source'] = error_on_empty_source
+    context['full_sync'] = full_sync
+    context['resume'] = resume
+    context['metrics_file'] = metrics_file
+
+    if metrics_file:
+        # written even if the command fails, to show where the time went
+        ctx.call_on_close(lambda: metrics.registry.write(metrics_file))
 
 
 def common_params(
@@ -33,16 +62,124 @@ def common_params(
         envvar='BROWSER_TIMEOUT_SECONDS',
         help='Timeout for browser page loading in seconds.',
     ),
+    browser_concurrency: int = typer.Option(
+        default=1,
+        envvar='BROWSER_CONCURRENCY',
+        min=1,
+        help=(
+            'Number of pages to load in parallel, in the browser or over HTTP. '
+            'Higher values sync faster but put more load on the source servers.'
+        ),
+    ),
+    lean_browsing: bool = typer.Option(
+        default=False,
+        envvar='LEAN_BROWSING',
+        help='Block images, media, fonts and trackers the sync does not need.',
+    ),
+    browser_endpoint: Optional[str] = typer.Option(
+        default=None,
+        envvar='RIDIWISE_BROWSER_ENDPOINT',
+        help='Attach to the browser of `ridiwise daemon` instead of launching one.',
+    ),
+    fetch_mode: FetchMode = typer.Option(
+        default=FetchMode.BROWSER,
+        envvar='FETCH_MODE',
+        help=(
+            'Fetch pages with the saved session over HTTP and use the browser only '
+            'when needed (http), or render every page in the browser (browser). '
+            'With http, the Ridibooks books which need the browser are synced '
+            'after the others, out of shelf order.'
+        ),
+    ),
     error_on_empty_source: bool = typer.Option(
         default=False,
         envvar='ERROR_ON_EMPTY_SOURCE',
         help='Exit with exit code 2 if no article/book is found from the source.',
     ),
+    full_sync: bool = typer.Option(
+        default=False,
+        envvar='FULL_SYNC',
+        help='Ignore the local sync state, rescan the source and send every highlight.',
+    ),
+    resume: bool = typer.Option(
+        default=False,
+        envvar='RESUME',
+        help=(
+            'Continue the last run if it was interrupted or left failed items, '
+            'instead of scraping and uploading its finished items again.'
+        ),
+    ),
+    metrics_file: Optional[Path] = typer.Option(
+        default=None,
+        envvar='METRICS_FILE',
+        help=(
+            'Write the timings and counters of the run to this file, as JSON for '
+            'a .json file, or in the Prometheus text format otherwise.'
+        ),
+    ),
 ):
     ctx.ensure_object(dict)
     check_common_options(
         ctx=ctx,
         headless_mode=headless_mode,
         browser_timeout_seconds=browser_timeout_seconds,
+        browser_concurrency=browser_concurrency,
+        lean_browsing=lean_browsing,
+        browser_endpoint=browser_endpoint,
+        fetch_mode=fetch_mode,
         error_on_empty_source=error_on_empty_source,
+        full_sync=full_sync,
+        resume=resume,
+        metrics_file=metrics_file,
     )
+
+
+def readwise_params(
+    ctx: typer.Context,
+    readwise_max_connections: int = typer.Option(
+        default=DEFAULT_MAX_CONNECTIONS,
+        envvar='READWISE_MAX_CONNECTIONS',
+        min=1,
+        help='Size of the connection pool to Readwise.io, kept alive between requests.',
+    ),
+    readwise_keepalive_seconds: float = typer.Option(
+        default=DEFAULT_KEEPALIVE_EXPIRY_SECONDS,
+        envvar='READWISE_KEEPALIVE_SECONDS',
+        min=0,
+        help='How long an idle connection to Readwise.io is kept alive.',
+    ),
+    readwise_http2: bool = typer.Option(
+        default=False,
+        envvar='READWISE_HTTP2',
+        help='Use HTTP/2 with Readwise.io. Requires `pip install httpx[http2]`.',
+    ),
+    readwise_connect_timeout_seconds: float = typer.Option(
+        default=DEFAULT_CONNECT_TIMEOUT_SECONDS,
+        envvar='READWISE_CONNECT_TIMEOUT_SECONDS',
+        min=0,
+        help='Timeout for connecting to Readwise.io in seconds.',
+    ),
+    readwise_timeout_seconds: float = typer.Option(
+        default=DEFAULT_TIMEOUT_SECONDS,
+        envvar='READWISE_TIMEOUT_SECONDS',
+        min=0,
+        help='Timeout for sending a request to and reading a response from '
+        'Readwise.io in seconds.',
+    ),
+    readwise_compress_requests: bool = typer.Option(
+        default=False,
+        envvar='READWISE_COMPRESS_REQUESTS',
+        help='Gzip large highlight batches sent to Readwise.io.',
+    ),
+):
+    # pylint: disable=too-many-arguments
+    context: ContextState = ctx.ensure_object(dict)
+
+    context['readwise_transport'] = {
+        'max_connections': readwise_max_connections,
+        'keepalive_expiry_seconds': readwise_keepalive_seconds,
+        'http2': readwise_http2,
+        'connect_timeout_seconds': readwise_connect_timeout_seconds,
+        'timeout_seconds': readwise_timeout_seconds,
+    }
+    context['readwise_compress_requests'] = readwise_compress_requests
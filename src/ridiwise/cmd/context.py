@@ -3,17 +3,24 @@ import logging
 from pathlib import Path
 from typing import Optional, TypedDict
 
+from ridiwise.api.settings import TransportSettings
+
 
 @enum.unique
 class AuthMethod(enum.StrEnum):
-    # BROWSER_COOKIE = 'browser_cookie'
+    BROWSER_COOKIE = 'browser_cookie'
     HEADLESS_BROWSER = 'headless_browser'
 
 
+# account the sync state is kept under when no user ID is given
+DEFAULT_ACCOUNT = 'default'
+
+
 class AuthState(TypedDict, total=False):
     auth_method: str
     user_id: Optional[str]
     password: Optional[str]
+    cookie_browser: Optional[str]
 
 
 class ContextState(TypedDict):
@@ -26,5 +33,19 @@ class ContextState(TypedDict):
     # headless browser options
     headless_mode: bool
     browser_timeout_seconds: int
+    browser_concurrency: int
+    lean_browsing: bool
+    browser_endpoint: Optional[str]
+    fetch_mode: str
 
     error_on_empty_source: bool
+    full_sync: bool
+    resume: bool
+    metrics_file: Optional[Path]
+
+    # readwise options
+    readwise_transport: TransportSettings
+    readwise_compress_requests: bool
+
+    # ridibooks options
+    note_extraction_mode: str
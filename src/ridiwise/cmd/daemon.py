@@ -0,0 +1,135 @@
+import logging
+import time
+from typing import TYPE_CHECKING
+
+import typer
+from typing_extensions import Annotated
+
+from ridiwise.cmd.context import ContextState
+
+if TYPE_CHECKING:
+    from playwright.sync_api import Browser, Playwright
+
+# how often the browser is checked while waiting for the next recycle
+POLL_INTERVAL_SECONDS = 5
+
+
+def has_open_contexts(browser: 'Browser') -> bool:
+    """
+    Whether a client attached to the browser still has a browser context open,
+    even one without pages, e.g. between the books of a sync.
+    """
+    # pylint: disable=import-outside-toplevel
+    from playwright.sync_api import Error as PlaywrightError
+
+    try:
+        session = browser.new_browser_cdp_session()
+        try:
+            result = session.send('Target.getBrowserContexts')
+        finally:
+            session.detach()
+    except PlaywrightError:
+        return False
+
+    return bool(result.get('browserContextIds'))
+
+
+def postpone_recycle(browser: 'Browser', logger: logging.Logger):
+    """
+    Waits until no client uses the browser, so a running sync is not pulled from
+    under it.
+    """
+    while browser.is_connected() and has_open_contexts(browser):
+        logger.info('Browser in use, postponing the recycle')
+        wait_until_recycle(browser, POLL_INTERVAL_SECONDS)
+
+
+def launch_browser(playwright: 'Playwright', host: str, port: int, headless: bool):
+    return playwright.chromium.launch(
+        headless=headless,
+        args=[
+            f'--remote-debugging-address={host}',
+            f'--remote-debugging-port={port}',
+        ],
+    )
+
+
+def wait_until_recycle(browser: 'Browser', recycle_seconds: int):
+    """
+    Keeps the browser running for `recycle_seconds`, returns early if it exits.
+    """
+    # pylint: disable=import-outside-toplevel
+    from playwright.sync_api import Error as PlaywrightError
+
+    # the page lets playwright process the browser events while waiting
+    page = browser.new_page()
+    deadline = time.monotonic() + recycle_seconds
+
+    try:
+        while time.monotonic() < deadline:
+            page.wait_for_timeout(POLL_INTERVAL_SECONDS * 1000)
+    except PlaywrightError:
+        return
+
+    page.close()
+
+
+def daemon(
+    ctx: typer.Context,
+    host: Annotated[
+        str,
+        typer.Option(
+            envvar='RIDIWISE_DAEMON_HOST',
+            help='Address the browser endpoint listens on.',
+        ),
+    ] = '127.0.0.1',
+    port: Annotated[
+        int,
+        typer.Option(
+            envvar='RIDIWISE_DAEMON_PORT',
+            help='Port the browser endpoint listens on.',
+        ),
+    ] = 9222,
+    recycle_minutes: Annotated[
+        int,
+        typer.Option(
+            envvar='RIDIWISE_DAEMON_RECYCLE_MINUTES',
+            min=1,
+            help='Restart the browser after this many minutes.',
+        ),
+    ] = 60,
+    headless_mode: Annotated[
+        bool,
+        typer.Option(
+            envvar='HEADLESS_MODE',
+            help='Hide the browser window (headless mode).',
+        ),
+    ] = True,
+):
+    """
+    Keep a warm browser running for the sync commands to attach to.
+
+    Pass the printed endpoint to the sync commands with `--browser-endpoint`.
+    """
+    # pylint: disable=import-outside-toplevel
+    from playwright.sync_api import sync_playwright
+
+    context: ContextState = ctx.ensure_object(dict)
+    logger = context['logger']
+    endpoint = f'http://{host}:{port}'
+
+    with sync_playwright() as playwright:
+        while True:
+            browser = launch_browser(playwright, host, port, headless_mode)
+            print(f'Browser endpoint: {endpoint}')
+
+            try:
+                wait_until_recycle(browser, recycle_minutes * 60)
+                postpone_recycle(browser, logger)
+            except KeyboardInterrupt as e:
+                browser.close()
+                raise typer.Exit() from e
+
+            logger.info('Recycling the browser')
+            if browser.is_connected():
+                browser.close()
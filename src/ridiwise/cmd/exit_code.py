@@ -1 +1,2 @@
 EXIT_CODE_EMPTY_SOURCE = 2
+EXIT_CODE_INCOMPLETE = 3
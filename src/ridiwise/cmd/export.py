@@ -0,0 +1,83 @@
+from pathlib import Path
+from typing import Iterable, Optional
+
+import typer
+from typing_extensions import Annotated
+
+from ridiwise.cmd.common_option import common_params
+from ridiwise.cmd.context import ContextState
+from ridiwise.cmd.exit_code import EXIT_CODE_EMPTY_SOURCE
+from ridiwise.cmd.snapshot import SnapshotWriter, get_snapshot_path
+from ridiwise.cmd.sync import longblack, ridibooks
+from ridiwise.cmd.sync.longblack import longblack_common_params
+from ridiwise.cmd.sync.ridibooks import ridi_common_params
+from ridiwise.cmd.utils import with_extra_parameters
+
+app = typer.Typer(name='export')
+
+
+@app.callback()
+def main():
+    """
+    Export the scraped highlights to a snapshot, to upload them later with
+    `ridiwise upload`.
+    """
+
+
+def write_snapshot(
+    context: ContextState,
+    provider: str,
+    records: Iterable[dict],
+    output: Optional[Path],
+):
+    """
+    Writes the records to a snapshot, one at a time, and prints where it is.
+    """
+    path = output or get_snapshot_path(context['cache_dir'], provider)
+    account = context['auths'][provider]['user_id']
+
+    with SnapshotWriter(path, provider, account) as writer:
+        for record in records:
+            writer.write(record)
+
+    print(f'Exported {writer.count} records to {path}')
+
+    if not writer.count and context['error_on_empty_source']:
+        raise typer.Exit(EXIT_CODE_EMPTY_SOURCE)
+
+
+output_option = typer.Option(
+    help='Snapshot file to write. Defaults to a new file under the cache home.',
+    dir_okay=False,
+    writable=True,
+)
+
+
+@app.command(name=ridibooks.PROVIDER)
+@with_extra_parameters(common_params)
+@with_extra_parameters(ridi_common_params)
+def export_ridibooks(
+    ctx: typer.Context,
+    output: Annotated[Optional[Path], output_option] = None,
+):
+    """
+    Export Ridibooks books with their notes.
+    """
+    context: ContextState = ctx.ensure_object(dict)
+    write_snapshot(context, ridibooks.PROVIDER, ridibooks.export_books(context), output)
+
+
+@app.command(name=longblack.PROVIDER)
+@with_extra_parameters(common_params)
+@with_extra_parameters(longblack_common_params)
+def export_longblack(
+    ctx: typer.Context,
+    output: Annotated[Optional[Path], output_option] = None,
+):
+    """
+    Export Longblack scraps.
+    """
+    context: ContextState = ctx.ensure_object(dict)
+    write_snapshot(
+        context, longblack.PROVIDER, longblack.export_scraps(context), output
+    )
@@ -6,7 +6,7 @@ import typer
 from typing_extensions import Annotated
 
 from ridiwise import __version__
-from ridiwise.cmd import sync
+from ridiwise.cmd import daemon, export, sync, upload
 
 app = typer.Typer(
     context_settings={'help_option_names': ['-h', '--help']},
@@ -20,6 +20,20 @@ app.add_typer(
     no_args_is_help=True,
 )
 
+app.add_typer(
+    export.app,
+    name='export',
+    no_args_is_help=True,
+)
+
+app.add_typer(
+    upload.app,
+    name='upload',
+    no_args_is_help=True,
+)
+
+app.command()(daemon.daemon)
+
 
 def setup_logging(log_level: int = logging.WARNING):
     logging.basicConfig(
@@ -0,0 +1,189 @@
+import concurrent.futures
+import queue
+from typing import TYPE_CHECKING, Callable, Optional
+
+from ridiwise.cmd.checkpoint import RETRY_BACKOFF_SECONDS, RETRY_ROUNDS, retry_failed
+
+if TYPE_CHECKING:
+    from ridiwise.api.readwise import CreateHighlightRequestItem, ReadwiseClient
+
+# batches waiting for the uploader before the scraper is held back
+MAX_QUEUED_BATCHES = 16
+# how often a blocked producer checks whether the uploader is still running
+PUT_TIMEOUT_SECONDS = 1
+
+# highlights to upload, and the callback to call once they are uploaded
+Batch = tuple[list['CreateHighlightRequestItem'], Callable[[], None]]
+
+
+class UploadPipeline:  # pylint: disable=too-many-instance-attributes
+    """
+    Uploads batches of highlights to Readwise from a worker thread while the caller
+    keeps scraping.
+
+    The queue is bounded, so scraping is held back while the uploads lag behind.
+    Batches waiting in the queue are sent together, up to the highlights of the
+    requests the client sends concurrently, and `on_uploaded` of each batch is
+    called right after its upload, so the progress is kept even if the run fails
+    later.
+
+    With `keep_failed`, a failed upload does not stop the uploader. Its batches are
+    uploaded again with a backoff once the queue is drained, and the ones still
+    failing are left in `failed_batches`.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        readwise_client: 'ReadwiseClient',
+        tags: Optional[list[str]] = None,
+        max_queued_batches: int = MAX_QUEUED_BATCHES,
+        keep_failed: bool = False,
+        retry_backoff_seconds: float = RETRY_BACKOFF_SECONDS,
+    ):
+        self.readwise_client = readwise_client
+        # the client splits an upload into requests which are sent in parallel
+        self.max_upload_highlights = (
+            readwise_client.max_highlights_per_request
+            * readwise_client.max_in_flight_requests
+        )
+        self.tags = tags or []
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queued_batches)
+
+        self.keep_failed = keep_failed
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.failed_batches: list[Batch] = []
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(1)
+        self.future: Optional[concurrent.futures.Future] = None
+
+    def __enter__(self):
+        self.future = self.executor.submit(self._run)
+        return self
+
+    def __exit__(self, exc_type, *args):
+        # let the uploader finish the queued batches, even if scraping failed
+        self._put(None)
+        self.executor.shutdown()
+
+        if exc_type is None:
+            self.future.result()
+
+        if exc_type is None and self.failed_batches:
+            self.failed_batches = retry_failed(
+                self.failed_batches,
+                self.upload_batches,
+                self.readwise_client.logger,
+                rounds=RETRY_ROUNDS,
+                backoff_seconds=self.retry_backoff_seconds,
+            )
+
+    @property
+    def failed_highlight_count(self) -> int:
+        return sum(len(highlights) for highlights, _ in self.failed_batches)
+
+    def put(
+        self,
+        highlights: list['CreateHighlightRequestItem'],
+        on_uploaded: Callable[[], None],
+    ):
+        """
+        Queues a batch of highlights, waiting while the queue is full. Raises the
+        error of the uploader if it stopped.
+        """
+        if not self._put((highlights, on_uploaded)):
+            self.future.result()
+
+    def _put(self, item) -> bool:
+        while not self.future.done():
+            try:
+                self.queue.put(item, timeout=PUT_TIMEOUT_SECONDS)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def _run(self):
+        max_highlights = self.max_upload_highlights
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            batches = [item]
+            highlight_count = len(item[0])
+
+            # gather the batches queued meanwhile into the same request
+            while highlight_count < max_highlights:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if item is None:
+                    self._upload(batches)
+                    return
+
+                batches.append(item)
+                highlight_count += len(item[0])
+
+            self._upload(batches)
+
+    def upload_batches(self, batches: list[Batch]) -> list[Batch]:
+        """
+        Uploads the batches in uploads of up to `max_upload_highlights`, and
+        returns the ones which failed.
+        """
+        self.failed_batches = []
+        max_highlights = self.max_upload_highlights
+
+        request_batches: list[Batch] = []
+        highlight_count = 0
+
+        for batch in batches:
+            if request_batches and highlight_count + len(batch[0]) > max_highlights:
+                self._upload(request_batches)
+                request_batches = []
+                highlight_count = 0
+
+            request_batches.append(batch)
+            highlight_count += len(batch[0])
+
+        if request_batches:
+            self._upload(request_batches)
+
+        return self.failed_batches
+
+    def _upload(self, batches: list[Batch]):
+        try:
+            highlights_response = self.readwise_client.create_highlights(
+                highlights=[
+                    highlight for highlights, _ in batches for highlight in highlights
+                ]
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if not self.keep_failed:
+                raise
+
+            self.readwise_client.logger.warning(f'Failed to upload highlights: {e}')
+            self.failed_batches.extend(batches)
+            return
+
+        for _, on_uploaded in batches:
+            on_uploaded()
+
+        # the tags are zipped with the highlights of each book, as uploaded one by one
+        for result in highlights_response:
+            for highlight_id, tag in zip(result['modified_highlights'], self.tags):
+                try:
+                    self.readwise_client.create_highlight_tag(
+                        highlight_id=highlight_id,
+                        tag=tag,
+                    )
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    if not self.keep_failed:
+                        raise
+
+                    self.readwise_client.logger.warning(f'Failed to tag highlight: {e}')
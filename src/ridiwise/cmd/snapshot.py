@@ -0,0 +1,111 @@
+import datetime
+import gzip
+import json
+import os
+from pathlib import Path
+from typing import Iterator, Optional, TypedDict
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIRNAME = 'snapshots'
+
+# keys of the scraped records holding a datetime, stored in ISO 8601
+DATETIME_KEYS = frozenset({'created_date', 'created_datetime'})
+
+
+class SnapshotHeader(TypedDict):
+    version: int
+    provider: str
+    account: str
+    created_at: str
+
+
+def get_snapshot_path(cache_dir: Path, provider: str) -> Path:
+    created_at = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    return cache_dir / SNAPSHOT_DIRNAME / f'{provider}-{created_at}.jsonl.gz'
+
+
+def encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def decode_record(record: dict) -> dict:
+    for key in DATETIME_KEYS & record.keys():
+        if record[key] is not None:
+            record[key] = datetime.datetime.fromisoformat(record[key])
+
+    return record
+
+
+class SnapshotWriter:
+    """
+    Writes the scraped records of a provider as gzipped JSON lines, one record at a
+    time, after a header line.
+
+    The records are written to a temporary file, which replaces `path` only when
+    the writer is closed without an error, so a failed export leaves no partial
+    snapshot.
+    """
+
+    def __init__(self, path: Path, provider: str, account: str):
+        self.path = path
+        self.temp_path = path.with_name(f'.{path.name}.tmp')
+        self.header: SnapshotHeader = {
+            'version': SNAPSHOT_VERSION,
+            'provider': provider,
+            'account': account,
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        self.count = 0
+        self.file: Optional[gzip.GzipFile] = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = gzip.open(self.temp_path, 'wt', encoding='utf-8')
+        self._write_line(self.header)
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.file.close()
+
+        if exc_type is None:
+            os.replace(self.temp_path, self.path)
+        else:
+            self.temp_path.unlink(missing_ok=True)
+
+    def _write_line(self, value: dict):
+        self.file.write(
+            json.dumps(
+                value, ensure_ascii=False, separators=(',', ':'), default=encode_value
+            )
+        )
+        self.file.write('\n')
+
+    def write(self, record: dict):
+        self._write_line(record)
+        self.count += 1
+
+
+def read_snapshot_header(path: Path) -> SnapshotHeader:
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header: SnapshotHeader = json.loads(f.readline())
+
+    if header.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f'Unsupported snapshot version: {header.get("version")}')
+
+    return header
+
+
+def iter_snapshot_records(path: Path) -> Iterator[dict]:
+    """
+    Yields the records of a snapshot, reading one line at a time.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        # header
+        f.readline()
+
+        for line in f:
+            if line.strip():
+                yield json.loads(line, object_hook=decode_record)
@@ -0,0 +1,263 @@
+import datetime
+import hashlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Mapping, Optional
+
+STATE_FILENAME = 'sync_state.sqlite3'
+
+# fields of an outgoing highlight which make it sent again when changed
+HIGHLIGHT_FINGERPRINT_KEYS = (
+    'text',
+    'note',
+    'highlighted_at',
+    'source_url',
+    'highlight_url',
+)
+
+
+def fingerprint(*values) -> str:
+    """
+    Returns a stable hash of the given values to detect content changes.
+    """
+    payload = json.dumps(
+        values,
+        ensure_ascii=False,
+        separators=(',', ':'),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_highlight_fingerprint(highlight: Mapping) -> str:
+    """
+    Returns a stable hash of the content of a highlight as sent to the destination,
+    so an edited text or memo is sent again while the untouched ones are not.
+    """
+    return fingerprint(*(highlight.get(key) for key in HIGHLIGHT_FINGERPRINT_KEYS))
+
+
+class SyncStateStore:
+    """
+    Local record of the highlights already synced to the destination, keyed by
+    provider, account and item id, along with the fingerprint of their content.
+
+    It also keeps the fingerprints of the source listings, e.g. the books of the
+    shelf, to skip reading the ones which did not change.
+    """
+
+    def __init__(self, cache_dir: Path, filename: str = STATE_FILENAME):
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = cache_dir / filename
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._create_tables()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _create_tables(self):
+        with self.lock, self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS synced_items (
+                    provider TEXT NOT NULL,
+                    account TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    synced_at TEXT NOT NULL,
+                    PRIMARY KEY (provider, account, item_id)
+                )
+                """
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS source_items (
+                    provider TEXT NOT NULL,
+                    account TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    checked_at TEXT NOT NULL,
+                    PRIMARY KEY (provider, account, item_id)
+                )
+                """
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    provider TEXT NOT NULL,
+                    account TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (provider, account)
+                )
+                """
+            )
+
+    def get_fingerprints(
+        self,
+        provider: str,
+        account: str,
+        item_ids: Iterable[str],
+    ) -> dict[str, str]:
+        return {
+            item_id: item_fingerprint
+            for item_id, (item_fingerprint, _) in self._get_rows(
+                'synced_items', 'synced_at', provider, account, item_ids
+            ).items()
+        }
+
+    def _get_rows(
+        self,
+        table: str,
+        time_column: str,
+        provider: str,
+        account: str,
+        item_ids: Iterable[str],
+    ) -> dict[str, tuple[str, str]]:
+        """
+        Returns the fingerprint and time of each item id found in `table`.
+        """
+        # pylint: disable=too-many-arguments
+        item_ids = list(item_ids)
+        rows = {}
+
+        # stay below the default SQLITE_MAX_VARIABLE_NUMBER
+        chunk_size = 500
+
+        with self.lock:
+            for i in range(0, len(item_ids), chunk_size):
+                chunk = item_ids[i : i + chunk_size]
+                placeholders = ', '.join('?' * len(chunk))
+                cursor = self.connection.execute(
+                    f'SELECT item_id, fingerprint, {time_column} FROM {table} '
+                    'WHERE provider = ? AND account = ? '
+                    f'AND item_id IN ({placeholders})',
+                    (provider, account, *chunk),
+                )
+                rows.update(
+                    (item_id, (item_fingerprint, checked_at))
+                    for item_id, item_fingerprint, checked_at in cursor
+                )
+
+        return rows
+
+    def filter_changed(
+        self,
+        provider: str,
+        account: str,
+        items: Mapping[str, str],
+    ) -> set[str]:
+        """
+        Returns the ids in `items` (item id -> fingerprint) that were never synced
+        or whose fingerprint differs from the last synced one.
+        """
+        synced = self.get_fingerprints(provider, account, items.keys())
+        return {
+            item_id
+            for item_id, item_fingerprint in items.items()
+            if synced.get(item_id) != item_fingerprint
+        }
+
+    def mark_synced(
+        self,
+        provider: str,
+        account: str,
+        items: Mapping[str, str],
+    ):
+        synced_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO synced_items '
+                '(provider, account, item_id, fingerprint, synced_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [
+                    (provider, account, item_id, item_fingerprint, synced_at)
+                    for item_id, item_fingerprint in items.items()
+                ],
+            )
+
+    def filter_changed_sources(
+        self,
+        provider: str,
+        account: str,
+        items: Mapping[str, str],
+        max_age: Optional[datetime.timedelta] = None,
+    ) -> set[str]:
+        """
+        Returns the ids in `items` (source item id -> fingerprint of its listing)
+        that changed since they were last checked, or were checked longer than
+        `max_age` ago.
+        """
+        # pylint: disable=too-many-arguments
+        checked = self._get_rows(
+            'source_items', 'checked_at', provider, account, items.keys()
+        )
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        return {
+            item_id
+            for item_id, item_fingerprint in items.items()
+            if item_id not in checked
+            or checked[item_id][0] != item_fingerprint
+            or (
+                max_age is not None
+                and now - datetime.datetime.fromisoformat(checked[item_id][1]) > max_age
+            )
+        }
+
+    def mark_sources_checked(
+        self,
+        provider: str,
+        account: str,
+        items: Mapping[str, str],
+    ):
+        """
+        Records the listing fingerprints of source items whose highlights are all
+        synced.
+        """
+        checked_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO source_items '
+                '(provider, account, item_id, fingerprint, checked_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [
+                    (provider, account, item_id, item_fingerprint, checked_at)
+                    for item_id, item_fingerprint in items.items()
+                ],
+            )
+
+    def get_watermark(self, provider: str, account: str) -> Optional[str]:
+        """
+        Returns the high-water mark of the last successful sync, if any.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT value FROM watermarks WHERE provider = ? AND account = ?',
+                (provider, account),
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def set_watermark(self, provider: str, account: str, value: str):
+        updated_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO watermarks '
+                '(provider, account, value, updated_at) '
+                'VALUES (?, ?, ?, ?)',
+                (provider, account, value, updated_at),
+            )
@@ -0,0 +1,253 @@
+import concurrent.futures
+import contextlib
+import socket
+from typing import Optional
+
+import typer
+from typing_extensions import Annotated
+
+from ridiwise.api.settings import CookieBrowser, FetchMode, NoteExtractionMode
+from ridiwise.cmd.checkpoint import has_failed_items
+from ridiwise.cmd.common_option import common_params, readwise_params
+from ridiwise.cmd.context import AuthMethod, ContextState
+from ridiwise.cmd.daemon import launch_browser
+from ridiwise.cmd.exit_code import EXIT_CODE_EMPTY_SOURCE, EXIT_CODE_INCOMPLETE
+from ridiwise.cmd.state import SyncStateStore
+from ridiwise.cmd.sync import longblack, ridibooks
+from ridiwise.cmd.utils import with_extra_parameters
+
+PROVIDERS = {
+    ridibooks.PROVIDER: ridibooks,
+    longblack.PROVIDER: longblack,
+}
+
+app = typer.Typer(name='all')
+
+
+@app.callback()
+def main():
+    """
+    Sync the highlights of every configured provider to another service.
+    """
+
+
+# pylint: disable=too-many-arguments
+def all_common_params(
+    ctx: typer.Context,
+    ridi_auth_method: AuthMethod = typer.Option(
+        default=AuthMethod.HEADLESS_BROWSER,
+        envvar='RIDI_AUTH_METHOD',
+        help='Authentication method to use with Ridibooks.',
+    ),
+    ridi_user_id: Optional[str] = typer.Option(
+        default=None,
+        envvar='RIDI_USER_ID',
+        help='Ridibooks user ID. Optional with the browser_cookie auth method.',
+    ),
+    ridi_password: Optional[str] = typer.Option(
+        default=None,
+        envvar='RIDI_PASSWORD',
+        help='Ridibooks password.',
+    ),
+    ridi_cookie_browser: CookieBrowser = typer.Option(
+        default=CookieBrowser.CHROME,
+        envvar='RIDI_COOKIE_BROWSER',
+        help='Browser to import the Ridibooks session from, with the browser_cookie '
+        'auth method.',
+    ),
+    ridi_note_extraction_mode: NoteExtractionMode = typer.Option(
+        default=NoteExtractionMode.DOM,
+        envvar='RIDI_NOTE_EXTRACTION_MODE',
+        help='Read book notes from the rendered page or its API responses.',
+    ),
+    longblack_auth_method: AuthMethod = typer.Option(
+        default=AuthMethod.HEADLESS_BROWSER,
+        envvar='LONGBLACK_AUTH_METHOD',
+        help='Authentication method to use with Longblack.',
+    ),
+    longblack_user_id: Optional[str] = typer.Option(
+        default=None,
+        envvar='LONGBLACK_USER_ID',
+        help='Longblack user ID. Optional with the browser_cookie auth method.',
+    ),
+    longblack_password: Optional[str] = typer.Option(
+        default=None,
+        envvar='LONGBLACK_PASSWORD',
+        help='Longblack password.',
+    ),
+    longblack_cookie_browser: CookieBrowser = typer.Option(
+        default=CookieBrowser.CHROME,
+        envvar='LONGBLACK_COOKIE_BROWSER',
+        help='Browser to import the Longblack session from, with the browser_cookie '
+        'auth method.',
+    ),
+):
+    context: ContextState = ctx.ensure_object(dict)
+
+    # a provider is synced when any of its credentials is given, or its session is
+    # imported from a browser
+    if ridi_user_id or ridi_password or ridi_auth_method == AuthMethod.BROWSER_COOKIE:
+        ridibooks.check_ridi_common_options(
+            ctx=ctx,
+            auth_method=ridi_auth_method,
+            user_id=ridi_user_id,
+            password=ridi_password,
+            note_extraction_mode=ridi_note_extraction_mode,
+            cookie_browser=ridi_cookie_browser,
+        )
+
+    if (
+        longblack_user_id
+        or longblack_password
+        or longblack_auth_method == AuthMethod.BROWSER_COOKIE
+    ):
+        longblack.check_longblack_common_options(
+            ctx=ctx,
+            auth_method=longblack_auth_method,
+            user_id=longblack_user_id,
+            password=longblack_password,
+            cookie_browser=longblack_cookie_browser,
+        )
+
+    if not context['auths']:
+        raise typer.BadParameter('No provider is configured.')
+
+
+def find_free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def shared_browser(context: ContextState, enabled: bool):
+    """
+    Launches a browser the providers attach to over CDP, each with its own context,
+    when `enabled`, unless one is already given or the pages are fetched over HTTP.
+
+    The CDP endpoint is unauthenticated, so any local process can attach to the
+    browser and read the sessions while the sync runs.
+    """
+    # pylint: disable=import-outside-toplevel
+    from playwright.sync_api import sync_playwright
+
+    if (
+        not enabled
+        or context['browser_endpoint']
+        or context['fetch_mode'] == FetchMode.HTTP
+    ):
+        yield
+        return
+
+    host = '127.0.0.1'
+    port = find_free_port(host)
+
+    with sync_playwright() as playwright:
+        browser = launch_browser(playwright, host, port, context['headless_mode'])
+        context['browser_endpoint'] = f'http://{host}:{port}'
+
+        try:
+            yield
+        finally:
+            context['browser_endpoint'] = None
+            browser.close()
+
+
+@app.command()
+@with_extra_parameters(common_params)
+@with_extra_parameters(readwise_params)
+@with_extra_parameters(all_common_params)
+def readwise(
+    ctx: typer.Context,
+    readwise_token: Annotated[
+        str,
+        typer.Option(
+            envvar='READWISE_TOKEN',
+            help='Readwise.io API token. https://readwise.io/access_token',
+        ),
+    ],
+    tags: Annotated[
+        Optional[list[str]],
+        typer.Option(
+            help='Tags to attach to the highlights. Multiple tags can be provided.',
+        ),
+    ] = None,
+    share_browser: Annotated[
+        bool,
+        typer.Option(
+            envvar='RIDIWISE_SHARE_BROWSER',
+            help=(
+                'Launch a single browser for the providers, which they attach to '
+                'over a local CDP port. Any local process can attach to the port '
+                'and read the logged-in sessions while the sync runs.'
+            ),
+        ),
+    ] = False,
+):
+    """
+    Sync the highlights of every configured provider to Readwise.io concurrently.
+    """
+    # pylint: disable=too-many-locals,import-outside-toplevel
+    from ridiwise.api.readwise import ReadwiseClient
+
+    context: ContextState = ctx.ensure_object(dict)
+    logger = context['logger']
+    providers = [provider for provider in PROVIDERS if provider in context['auths']]
+
+    with (
+        ReadwiseClient(
+            token=readwise_token,
+            transport_settings=context['readwise_transport'],
+            compress_requests=context['readwise_compress_requests'],
+        ) as readwise_client,
+        SyncStateStore(context['cache_dir']) as state_store,
+        shared_browser(context, share_browser),
+        concurrent.futures.ThreadPoolExecutor(len(providers)) as executor,
+    ):
+        futures = {
+            provider: executor.submit(
+                PROVIDERS[provider].sync_to_readwise,
+                context,
+                readwise_client,
+                state_store,
+                tags,
+            )
+            for provider in providers
+        }
+
+        concurrent.futures.wait(futures.values())
+
+    failed = False
+    empty = False
+    incomplete = False
+
+    print('Synced notes to Readwise.io:')
+
+    for provider, future in futures.items():
+        print(f'[{provider}]')
+
+        if future.exception() is not None:
+            logger.error(f'Failed to sync {provider}', exc_info=future.exception())
+            print(f'Failed: {future.exception()}')
+            failed = True
+            continue
+
+        result_count = future.result()
+
+        if result_count is None:
+            print('Nothing found.')
+            empty = True
+            continue
+
+        PROVIDERS[provider].print_result(result_count)
+        incomplete = incomplete or has_failed_items(result_count)
+
+    if failed:
+        raise typer.Exit(1)
+
+    if incomplete:
+        print('Some items failed. Run again with `--resume` to retry them.')
+        raise typer.Exit(EXIT_CODE_INCOMPLETE)
+
+    if empty and context['error_on_empty_source']:
+        raise typer.Exit(EXIT_CODE_EMPTY_SOURCE)
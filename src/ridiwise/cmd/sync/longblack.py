@@ -1,18 +1,36 @@
-import itertools
-from typing import Optional
+import datetime
+import functools
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
 
 import typer
 from typing_extensions import Annotated
 
-from ridiwise.api.longblack import LongblackClient
-from ridiwise.api.readwise import ReadwiseClient
-from ridiwise.cmd.common_option import common_params
-from ridiwise.cmd.context import AuthMethod, AuthState, ContextState
-from ridiwise.cmd.exit_code import EXIT_CODE_EMPTY_SOURCE
+from ridiwise import metrics
+from ridiwise.api.settings import CookieBrowser
+from ridiwise.cmd.checkpoint import RunJournal, has_failed_items, retry_failed
+from ridiwise.cmd.common_option import common_params, readwise_params
+from ridiwise.cmd.context import DEFAULT_ACCOUNT, AuthMethod, AuthState, ContextState
+from ridiwise.cmd.exit_code import EXIT_CODE_EMPTY_SOURCE, EXIT_CODE_INCOMPLETE
+from ridiwise.cmd.pipeline import UploadPipeline
+from ridiwise.cmd.state import SyncStateStore, get_highlight_fingerprint
 from ridiwise.cmd.utils import with_extra_parameters
 
+if TYPE_CHECKING:
+    from ridiwise.api.longblack import LongblackClient, Scrap
+    from ridiwise.api.readwise import CreateHighlightRequestItem, ReadwiseClient
+
 PROVIDER = 'longblack'
 
+# journal mark of a run which read the whole listing
+LISTING_READ = 'listing_read'
+# journal mark of a run which read the listing past the watermark
+LISTING_RECHECKED = 'listing_rechecked'
+
+# scraps older than the watermark, e.g. with an edited memo, are read again
+SCRAP_RECHECK_INTERVAL = datetime.timedelta(days=1)
+# the watermark key of the last listing read past the watermark
+RECHECK_WATERMARK = f'{PROVIDER}_recheck'
+
 app = typer.Typer(name='longblack')
 
 
@@ -28,6 +46,7 @@ def check_longblack_common_options(
     auth_method: AuthMethod,
     user_id: Optional[str],
     password: Optional[str],
+    cookie_browser: CookieBrowser = CookieBrowser.CHROME,
 ):
     context: ContextState = ctx.ensure_object(dict)
 
@@ -41,6 +60,10 @@ def check_longblack_common_options(
 
         auth_state['user_id'] = user_id
         auth_state['password'] = password
+    elif auth_method == AuthMethod.BROWSER_COOKIE:
+        auth_state['user_id'] = user_id or DEFAULT_ACCOUNT
+        auth_state['password'] = None
+        auth_state['cookie_browser'] = cookie_browser
 
     context['auths'][PROVIDER] = auth_state
 
@@ -55,13 +78,19 @@ def longblack_common_params(
     user_id: Optional[str] = typer.Option(
         default=None,
         envvar='LONGBLACK_USER_ID',
-        help='Longblack user ID.',
+        help='Longblack user ID. Optional with the browser_cookie auth method.',
     ),
     password: Optional[str] = typer.Option(
         default=None,
         envvar='LONGBLACK_PASSWORD',
         help='Longblack password.',
     ),
+    cookie_browser: CookieBrowser = typer.Option(
+        default=CookieBrowser.CHROME,
+        envvar='LONGBLACK_COOKIE_BROWSER',
+        help='Browser to import the Longblack session from, with the browser_cookie '
+        'auth method.',
+    ),
 ):
     ctx.ensure_object(dict)
     check_longblack_common_options(
@@ -69,11 +98,293 @@ def longblack_common_params(
         auth_method=auth_method,
         user_id=user_id,
         password=password,
+        cookie_browser=cookie_browser,
+    )
+
+
+def to_readwise_highlight(scrap: 'Scrap') -> 'CreateHighlightRequestItem':
+    return {
+        'text': scrap['highlighted_text'],
+        'title': scrap['note']['title'],
+        'source_type': PROVIDER,
+        'category': 'articles',
+        'author': scrap['note']['author'],
+        'highlighted_at': scrap['created_datetime'].isoformat(),
+        'note': scrap['memo'],
+        'source_url': scrap['note']['note_url'],
+        'highlight_url': scrap['scrap_url'],
+        'image_url': scrap['note']['cover_image_url'],
+    }
+
+
+def create_client(
+    context: ContextState, refresh_memos: bool = False
+) -> 'LongblackClient':
+    # pylint: disable=import-outside-toplevel
+    from ridiwise.api.longblack import LongblackClient
+
+    return LongblackClient(
+        user_id=context['auths'][PROVIDER]['user_id'],
+        password=context['auths'][PROVIDER]['password'],
+        cache_dir=context['cache_dir'],
+        headless=context['headless_mode'],
+        browser_timeout_seconds=context['browser_timeout_seconds'],
+        concurrency=context['browser_concurrency'],
+        lean_browsing=context['lean_browsing'],
+        browser_endpoint=context['browser_endpoint'],
+        fetch_mode=context['fetch_mode'],
+        cookie_browser=context['auths'][PROVIDER].get('cookie_browser'),
+        refresh_memos=refresh_memos or context['full_sync'],
     )
 
 
+def get_listing_since(
+    state_store: SyncStateStore, user_id: str
+) -> Optional[datetime.datetime]:
+    """
+    Returns the time to read the listing since, or None if the listing is read
+    past the watermark, once every `SCRAP_RECHECK_INTERVAL`.
+    """
+    watermark = state_store.get_watermark(PROVIDER, user_id)
+    if not watermark:
+        return None
+
+    rechecked_at = state_store.get_watermark(RECHECK_WATERMARK, user_id)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    if (
+        not rechecked_at
+        or now - datetime.datetime.fromisoformat(rechecked_at) > SCRAP_RECHECK_INTERVAL
+    ):
+        return None
+
+    return datetime.datetime.fromisoformat(watermark)
+
+
+def read_scraps(
+    context: ContextState, since: Optional[datetime.datetime]
+) -> tuple[list['Scrap'], list[str]]:
+    """
+    Returns the scraps of the listing since `since`, and the URLs of the listing
+    pages which could not be read.
+
+    A listing page that fails, e.g. on a timeout, does not stop the others, and is
+    retried at the end.
+    """
+    failed_pages: list[str] = []
+
+    def on_error(url: str, _: Exception):
+        failed_pages.append(url)
+
+    # a listing read past the watermark is the only one to see the memos edited on
+    # older scraps, so it does not take them from the cache
+    with create_client(context, refresh_memos=since is None) as longblack_client:
+        scraps = list(longblack_client.iter_scraps(since, on_error))
+
+        def read_pages(urls: list[str]) -> list[str]:
+            failed_pages.clear()
+            scraps.extend(longblack_client.iter_scraps_of_pages(urls, since, on_error))
+            return list(failed_pages)
+
+        unread_pages = retry_failed(list(failed_pages), read_pages, context['logger'])
+
+    # the pages read again can have scraps shifted from the others
+    return list({scrap['scrap_id']: scrap for scrap in scraps}.values()), unread_pages
+
+
+@metrics.span('sync', provider=PROVIDER)
+def sync_to_readwise(
+    context: ContextState,
+    readwise_client: 'ReadwiseClient',
+    state_store: SyncStateStore,
+    tags: Optional[list[str]],
+) -> Optional[dict[str, int]]:
+    """
+    Syncs the scraps created since the last sync, and returns the counts of the
+    result, or None if no scrap is found.
+
+    The scraps read and uploaded are kept in a journal until the run has nothing
+    left, so a run with `resume` uploads the rest without reading the listing
+    again.
+    """
+    user_id = context['auths'][PROVIDER]['user_id']
+
+    watermark = None
+    since = None
+    if not context['full_sync']:
+        watermark = state_store.get_watermark(PROVIDER, user_id)
+        since = get_listing_since(state_store, user_id)
+
+    unread_pages: list[str] = []
+
+    with RunJournal(
+        context['cache_dir'], PROVIDER, user_id, resume=context['resume']
+    ) as journal:
+        if LISTING_READ in journal.marks:
+            rechecked = LISTING_RECHECKED in journal.marks
+            scraps = [
+                scrap
+                for scrap_id, scrap in journal.scraped.items()
+                if scrap_id not in journal.uploaded
+            ]
+        else:
+            scraps, unread_pages = read_scraps(context, since)
+
+            for scrap in scraps:
+                journal.record_scraped(scrap['scrap_id'], scrap)
+
+            # a listing with unread pages is read again by the resumed run
+            rechecked = since is None and not unread_pages
+            if rechecked:
+                journal.mark(LISTING_RECHECKED)
+            if not unread_pages:
+                journal.mark(LISTING_READ)
+
+        result_count = upload_scraps(
+            scraps,
+            user_id,
+            readwise_client,
+            state_store,
+            tags,
+            full_sync=context['full_sync'],
+            journal=journal,
+            listing_complete=not unread_pages,
+        )
+        result_count['failed_pages'] = len(unread_pages)
+
+        if not has_failed_items(result_count):
+            if rechecked:
+                state_store.set_watermark(
+                    RECHECK_WATERMARK,
+                    user_id,
+                    datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                )
+            journal.finish()
+
+    if not scraps and not watermark and not journal.resumed and not unread_pages:
+        return None
+
+    return result_count
+
+
+def export_scraps(context: ContextState) -> Iterator['Scrap']:
+    """
+    Yields every scrap, regardless of the sync state.
+    """
+    with create_client(context) as longblack_client:
+        yield from longblack_client.iter_scraps()
+
+
+@metrics.span('upload', provider=PROVIDER)
+def upload_scraps(
+    scraps: Iterable['Scrap'],
+    user_id: str,
+    readwise_client: 'ReadwiseClient',
+    state_store: SyncStateStore,
+    tags: Optional[list[str]],
+    full_sync: bool = False,
+    journal: Optional[RunJournal] = None,
+    listing_complete: bool = True,
+) -> dict[str, int]:
+    """
+    Uploads the scraps changed since the last sync, e.g. the scraps of a snapshot,
+    and returns the counts of the result.
+
+    The scraps of each article are uploaded apart, so a failed upload does not
+    stop the others and is retried at the end. The watermark is only moved past
+    the scraps of a `listing_complete`, without pages left unread.
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+
+    scraps = list(scraps)
+    result_count = {
+        'articles': 0,
+        'highlights': 0,
+        'unchanged': 0,
+        'failed_highlights': 0,
+    }
+
+    if not scraps:
+        return result_count
+
+    latest_scrap_datetime = max(scrap['created_datetime'] for scrap in scraps)
+
+    highlights = {scrap['scrap_id']: to_readwise_highlight(scrap) for scrap in scraps}
+    scrap_fingerprints = {
+        scrap_id: get_highlight_fingerprint(highlight)
+        for scrap_id, highlight in highlights.items()
+    }
+
+    if full_sync:
+        changed_scrap_ids = set(scrap_fingerprints)
+    else:
+        changed_scrap_ids = state_store.filter_changed(
+            PROVIDER, user_id, scrap_fingerprints
+        )
+
+    result_count['unchanged'] = len(scraps) - len(changed_scrap_ids)
+
+    articles: dict[str, list[str]] = {}
+    for scrap in scraps:
+        if scrap['scrap_id'] in changed_scrap_ids:
+            articles.setdefault(scrap['note']['note_id'], []).append(scrap['scrap_id'])
+
+    def mark_synced(scrap_ids: list[str]):
+        state_store.mark_synced(
+            PROVIDER,
+            user_id,
+            {scrap_id: scrap_fingerprints[scrap_id] for scrap_id in scrap_ids},
+        )
+
+        if journal is not None:
+            journal.record_uploaded(scrap_ids)
+
+    with UploadPipeline(readwise_client, tags=tags, keep_failed=True) as pipeline:
+        for scrap_ids in articles.values():
+            pipeline.put(
+                [highlights[scrap_id] for scrap_id in scrap_ids],
+                on_uploaded=functools.partial(mark_synced, scrap_ids),
+            )
+
+    result_count['articles'] = len(articles) - len(pipeline.failed_batches)
+    result_count['highlights'] = (
+        len(changed_scrap_ids) - pipeline.failed_highlight_count
+    )
+    result_count['failed_highlights'] = pipeline.failed_highlight_count
+
+    # the scraps which failed are older than the watermark on the next run, so it is
+    # kept until they are uploaded
+    watermark = state_store.get_watermark(PROVIDER, user_id)
+    if (
+        listing_complete
+        and not pipeline.failed_batches
+        and (
+            not watermark
+            or datetime.datetime.fromisoformat(watermark) < latest_scrap_datetime
+        )
+    ):
+        # an older snapshot must not move the watermark back
+        state_store.set_watermark(PROVIDER, user_id, latest_scrap_datetime.isoformat())
+
+    metrics.inc(
+        'highlights_unchanged_total', result_count['unchanged'], provider=PROVIDER
+    )
+
+    return result_count
+
+
+def print_result(result_count: dict[str, int]):
+    print('Articles: ', result_count['articles'])
+    print('Highlights: ', result_count['highlights'])
+    print('Unchanged: ', result_count['unchanged'])
+
+    if has_failed_items(result_count):
+        print('Failed pages: ', result_count.get('failed_pages', 0))
+        print('Failed highlights: ', result_count['failed_highlights'])
+
+
 @app.command()
 @with_extra_parameters(common_params)
+@with_extra_parameters(readwise_params)
 @with_extra_parameters(longblack_common_params)
 def readwise(
     ctx: typer.Context,
@@ -94,67 +405,36 @@ def readwise(
     """
     Sync Longblack scraps to Readwise.io.
     """
+    # pylint: disable=import-outside-toplevel
+    from ridiwise.api.readwise import ReadwiseClient
 
     context: ContextState = ctx.ensure_object(dict)
 
     with (
-        LongblackClient(
-            user_id=context['auths'][PROVIDER]['user_id'],
-            password=context['auths'][PROVIDER]['password'],
-            cache_dir=context['cache_dir'],
-            headless=context['headless_mode'],
-            browser_timeout_seconds=context['browser_timeout_seconds'],
-        ) as longblack_client,
-        ReadwiseClient(token=readwise_token) as readwise_client,
+        ReadwiseClient(
+            token=readwise_token,
+            transport_settings=context['readwise_transport'],
+            compress_requests=context['readwise_compress_requests'],
+        ) as readwise_client,
+        SyncStateStore(context['cache_dir']) as state_store,
     ):
-        scraps = longblack_client.get_scraps()
-
-        if not scraps:
-            print('No scraps found.')
-
-            if context['error_on_empty_source']:
-                raise typer.Exit(EXIT_CODE_EMPTY_SOURCE)
-
-            raise typer.Exit()
-
-        result_count = {
-            'articles': 0,
-            'highlights': 0,
-        }
-
-        highlights_response = readwise_client.create_highlights(
-            highlights=[
-                {
-                    'text': scrap['highlighted_text'],
-                    'title': scrap['note']['title'],
-                    'source_type': PROVIDER,
-                    'category': 'articles',
-                    'author': scrap['note']['author'],
-                    'highlighted_at': scrap['created_datetime'].isoformat(),
-                    'note': scrap['memo'],
-                    'source_url': scrap['note']['note_url'],
-                    'highlight_url': scrap['scrap_url'],
-                    'image_url': scrap['note']['cover_image_url'],
-                }
-                for scrap in scraps
-            ]
-        )
+        result_count = sync_to_readwise(context, readwise_client, state_store, tags)
 
-        modified_highlight_ids = itertools.chain.from_iterable(
-            article_result['modified_highlights']
-            for article_result in highlights_response
-        )
+    if result_count is None:
+        print('No scraps found.')
 
-        if tags:
-            for highlight_id, tag in zip(modified_highlight_ids, tags):
-                readwise_client.create_highlight_tag(
-                    highlight_id=highlight_id,
-                    tag=tag,
-                )
+        if context['error_on_empty_source']:
+            raise typer.Exit(EXIT_CODE_EMPTY_SOURCE)
+
+        raise typer.Exit()
+
+    if not any(result_count.values()):
+        print('No new scraps found.')
+        raise typer.Exit()
 
-        result_count['articles'] = len({scrap['note']['note_id'] for scrap in scraps})
-        result_count['highlights'] = len(scraps)
+    print('Synced notes to Readwise.io:')
+    print_result(result_count)
 
-        print('Synced notes to Readwise.io:')
-        print('Articles: ', result_count['articles'])
-        print('Highlights: ', result_count['highlights'])
+    if has_failed_items(result_count):
+        print('Some items failed. Run again with `--resume` to retry them.')
+        raise typer.Exit(EXIT_CODE_INCOMPLETE)
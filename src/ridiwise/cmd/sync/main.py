@@ -1,6 +1,6 @@
 import typer
 
-from ridiwise.cmd.sync import longblack, ridibooks
+from ridiwise.cmd.sync import all_providers, longblack, ridibooks
 
 app = typer.Typer()
 
@@ -21,3 +21,8 @@ app.add_typer(
     longblack.app,
     no_args_is_help=True,
 )
+
+app.add_typer(
+    all_providers.app,
+    no_args_is_help=True,
+)
@@ -1,17 +1,34 @@
-from typing import Optional
+import datetime
+import functools
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
 
 import typer
 from typing_extensions import Annotated
 
-from ridiwise.api.readwise import ReadwiseClient
-from ridiwise.api.ridibooks import RidiClient
-from ridiwise.cmd.common_option import common_params
-from ridiwise.cmd.context import AuthMethod, AuthState, ContextState
-from ridiwise.cmd.exit_code import EXIT_CODE_EMPTY_SOURCE
+from ridiwise import metrics
+from ridiwise.api.settings import CookieBrowser, NoteExtractionMode
+from ridiwise.cmd.checkpoint import RunJournal, has_failed_items, retry_failed
+from ridiwise.cmd.common_option import common_params, readwise_params
+from ridiwise.cmd.context import DEFAULT_ACCOUNT, AuthMethod, AuthState, ContextState
+from ridiwise.cmd.exit_code import EXIT_CODE_EMPTY_SOURCE, EXIT_CODE_INCOMPLETE
+from ridiwise.cmd.pipeline import UploadPipeline
+from ridiwise.cmd.state import (
+    SyncStateStore,
+    fingerprint,
+    get_highlight_fingerprint,
+)
 from ridiwise.cmd.utils import with_extra_parameters
 
+if TYPE_CHECKING:
+    from ridiwise.api.readwise import CreateHighlightRequestItem, ReadwiseClient
+    from ridiwise.api.ridibooks import Book, Note, RidiClient
+
 PROVIDER = 'ridibooks'
 
+# read the notes of a book again after this long, even if its shelf item did not
+# change, in case the shelf misses a change
+SHELF_RECHECK_INTERVAL = datetime.timedelta(days=1)
+
 app = typer.Typer(name=PROVIDER)
 
 
@@ -22,11 +39,14 @@ def main():
     """
 
 
+# pylint: disable=too-many-arguments
 def check_ridi_common_options(
     ctx: typer.Context,
     auth_method: AuthMethod,
     user_id: Optional[str],
     password: Optional[str],
+    note_extraction_mode: NoteExtractionMode,
+    cookie_browser: CookieBrowser = CookieBrowser.CHROME,
 ):
     context: ContextState = ctx.ensure_object(dict)
 
@@ -40,8 +60,13 @@ def check_ridi_common_options(
 
         auth_state['user_id'] = user_id
         auth_state['password'] = password
+    elif auth_method == AuthMethod.BROWSER_COOKIE:
+        auth_state['user_id'] = user_id or DEFAULT_ACCOUNT
+        auth_state['password'] = None
+        auth_state['cookie_browser'] = cookie_browser
 
     context['auths'][PROVIDER] = auth_state
+    context['note_extraction_mode'] = note_extraction_mode
 
 
 def ridi_common_params(
@@ -54,13 +79,24 @@ def ridi_common_params(
     user_id: Optional[str] = typer.Option(
         default=None,
         envvar='RIDI_USER_ID',
-        help='Ridibooks user ID.',
+        help='Ridibooks user ID. Optional with the browser_cookie auth method.',
     ),
     password: Optional[str] = typer.Option(
         default=None,
         envvar='RIDI_PASSWORD',
         help='Ridibooks password.',
     ),
+    cookie_browser: CookieBrowser = typer.Option(
+        default=CookieBrowser.CHROME,
+        envvar='RIDI_COOKIE_BROWSER',
+        help='Browser to import the Ridibooks session from, with the browser_cookie '
+        'auth method.',
+    ),
+    note_extraction_mode: NoteExtractionMode = typer.Option(
+        default=NoteExtractionMode.DOM,
+        envvar='RIDI_NOTE_EXTRACTION_MODE',
+        help='Read book notes from the rendered page or its API responses.',
+    ),
 ):
     ctx.ensure_object(dict)
     check_ridi_common_options(
@@ -68,11 +104,303 @@ def ridi_common_params(
         auth_method=auth_method,
         user_id=user_id,
         password=password,
+        note_extraction_mode=note_extraction_mode,
+        cookie_browser=cookie_browser,
     )
 
 
+def get_shelf_fingerprint(book: 'Book') -> str:
+    return fingerprint(book['shelf_summary'])
+
+
+class BookUploader:
+    """
+    Queues the notes of the books changed since the last sync for upload, and
+    records each book as synced once its notes are uploaded.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        pipeline: UploadPipeline,
+        state_store: SyncStateStore,
+        user_id: str,
+        full_sync: bool = False,
+        journal: Optional[RunJournal] = None,
+    ):
+        self.pipeline = pipeline
+        self.state_store = state_store
+        self.user_id = user_id
+        self.full_sync = full_sync
+        self.journal = journal
+
+    def put(self, book: 'Book') -> list['Note']:
+        """
+        Queues the changed notes of the book, and returns them.
+        """
+        highlights = {
+            note['id']: to_readwise_highlight(book, note) for note in book['notes']
+        }
+        note_fingerprints = {
+            note_id: get_highlight_fingerprint(highlight)
+            for note_id, highlight in highlights.items()
+        }
+
+        if self.full_sync:
+            changed_note_ids = set(note_fingerprints)
+        else:
+            changed_note_ids = self.state_store.filter_changed(
+                PROVIDER, self.user_id, note_fingerprints
+            )
+
+        notes = [note for note in book['notes'] if note['id'] in changed_note_ids]
+
+        if not notes:
+            self.mark_synced(book, {})
+            return notes
+
+        synced_notes = {note['id']: note_fingerprints[note['id']] for note in notes}
+        self.pipeline.put(
+            [highlights[note['id']] for note in notes],
+            on_uploaded=functools.partial(self.mark_synced, book, synced_notes),
+        )
+
+        return notes
+
+    def mark_synced(self, book: 'Book', note_fingerprints: dict[str, str]):
+        self.state_store.mark_synced(PROVIDER, self.user_id, note_fingerprints)
+        self.state_store.mark_sources_checked(
+            PROVIDER, self.user_id, {book['book_id']: get_shelf_fingerprint(book)}
+        )
+
+        if self.journal is not None:
+            self.journal.record_uploaded([book['book_id']])
+
+
+def to_readwise_highlight(book: 'Book', note: 'Note') -> 'CreateHighlightRequestItem':
+    return {
+        'text': note['highlighted_text'],
+        'title': book['book_title'],
+        'source_type': PROVIDER,
+        'category': 'books',
+        'author': ', '.join(book['authors']),
+        'highlighted_at': note['created_date'].isoformat(),
+        'note': note['memo'],
+        'source_url': book['book_url'],
+        'highlight_url': f'{book["book_notes_url"]}#annotation_{note["id"]}',
+        'image_url': book['book_cover_image_url'],
+    }
+
+
+def create_client(context: ContextState) -> 'RidiClient':
+    # pylint: disable=import-outside-toplevel
+    from ridiwise.api.ridibooks import RidiClient
+
+    return RidiClient(
+        user_id=context['auths'][PROVIDER]['user_id'],
+        password=context['auths'][PROVIDER]['password'],
+        cache_dir=context['cache_dir'],
+        headless=context['headless_mode'],
+        browser_timeout_seconds=context['browser_timeout_seconds'],
+        concurrency=context['browser_concurrency'],
+        lean_browsing=context['lean_browsing'],
+        browser_endpoint=context['browser_endpoint'],
+        fetch_mode=context['fetch_mode'],
+        cookie_browser=context['auths'][PROVIDER].get('cookie_browser'),
+        note_extraction_mode=context['note_extraction_mode'],
+    )
+
+
+@metrics.span('sync', provider=PROVIDER)
+def sync_to_readwise(
+    context: ContextState,
+    readwise_client: 'ReadwiseClient',
+    state_store: SyncStateStore,
+    tags: Optional[list[str]],
+) -> Optional[dict[str, int]]:
+    """
+    Syncs the changed book notes, and returns the counts of the result, or None if
+    no book is found.
+
+    The notes of each book are queued for upload as soon as the book is read, so
+    the uploads overlap with scraping the rest of the shelf. Books whose shelf item
+    did not change since the last sync are skipped without reading their notes.
+
+    A book or an upload that fails does not stop the others, and is retried at the
+    end of the run. The progress is kept in a journal until the run has nothing
+    left, so a run with `resume` continues it.
+    """
+    # pylint: disable=too-many-locals
+
+    logger = context['logger']
+    user_id = context['auths'][PROVIDER]['user_id']
+
+    result_count = {
+        'books': 0,
+        'highlights': 0,
+        'unchanged': 0,
+        'skipped_books': 0,
+        'failed_books': 0,
+        'failed_highlights': 0,
+    }
+    book_count = 0
+    failed_books: list['Book'] = []
+
+    journal = RunJournal(
+        context['cache_dir'], PROVIDER, user_id, resume=context['resume']
+    )
+
+    def filter_changed_books(books: list['Book']) -> list['Book']:
+        nonlocal book_count
+        book_count = len(books)
+
+        # read by the resumed run
+        books = [
+            book
+            for book in books
+            if book['book_id'] not in journal.scraped
+            and book['book_id'] not in journal.uploaded
+        ]
+
+        if context['full_sync']:
+            return books
+
+        changed_book_ids = state_store.filter_changed_sources(
+            PROVIDER,
+            user_id,
+            {book['book_id']: get_shelf_fingerprint(book) for book in books},
+            max_age=SHELF_RECHECK_INTERVAL,
+        )
+        result_count['skipped_books'] = len(books) - len(changed_book_ids)
+
+        return [book for book in books if book['book_id'] in changed_book_ids]
+
+    def on_error(book: Optional['Book'], _: Exception):
+        # a shelf item not read as a book is not retried
+        if book is None:
+            result_count['failed_books'] += 1
+        else:
+            failed_books.append(book)
+
+    with (
+        journal,
+        create_client(context) as ridi_client,
+        UploadPipeline(readwise_client, tags=tags, keep_failed=True) as pipeline,
+    ):
+        uploader = BookUploader(
+            pipeline, state_store, user_id, context['full_sync'], journal
+        )
+
+        def put_book(book: 'Book'):
+            notes = uploader.put(book)
+            result_count['unchanged'] += len(book['notes']) - len(notes)
+
+            if not notes:
+                logger.info(f'No changes: `{book["book_title"]}`')
+                return
+
+            result_count['books'] += 1
+            result_count['highlights'] += len(notes)
+
+            logger.info(f'Readwise highlights: `{book["book_title"]}` / {len(notes)}')
+
+        def read_books(books: list['Book']) -> list['Book']:
+            failed_books.clear()
+
+            for book in ridi_client.iter_books_with_notes(books, on_error):
+                journal.record_scraped(book['book_id'], book)
+                put_book(book)
+
+            return list(failed_books)
+
+        # read by the resumed run, but not uploaded
+        for book_id, book in journal.scraped.items():
+            if book_id not in journal.uploaded:
+                put_book(book)
+
+        for book in ridi_client.iter_books_from_shelf(filter_changed_books, on_error):
+            journal.record_scraped(book['book_id'], book)
+            put_book(book)
+
+        unread_books = retry_failed(list(failed_books), read_books, logger)
+
+    result_count['failed_books'] += len(unread_books)
+    result_count['failed_highlights'] = pipeline.failed_highlight_count
+    result_count['highlights'] -= pipeline.failed_highlight_count
+
+    if not has_failed_items(result_count):
+        journal.finish()
+
+    if not book_count:
+        return None
+
+    metrics.inc(
+        'highlights_unchanged_total', result_count['unchanged'], provider=PROVIDER
+    )
+
+    return result_count
+
+
+def export_books(context: ContextState) -> Iterator['Book']:
+    """
+    Yields every book of the shelf with its notes, regardless of the sync state.
+    """
+    with create_client(context) as ridi_client:
+        yield from ridi_client.iter_books_from_shelf()
+
+
+@metrics.span('upload', provider=PROVIDER)
+def upload_books(
+    books: Iterable['Book'],
+    user_id: str,
+    readwise_client: 'ReadwiseClient',
+    state_store: SyncStateStore,
+    tags: Optional[list[str]],
+) -> dict[str, int]:
+    """
+    Uploads the notes of the books changed since the last sync, e.g. the books of
+    a snapshot, and returns the counts of the result.
+    """
+    result_count = {
+        'books': 0,
+        'highlights': 0,
+        'unchanged': 0,
+        'skipped_books': 0,
+        'failed_books': 0,
+        'failed_highlights': 0,
+    }
+
+    with UploadPipeline(readwise_client, tags=tags, keep_failed=True) as pipeline:
+        uploader = BookUploader(pipeline, state_store, user_id)
+
+        for book in books:
+            notes = uploader.put(book)
+            result_count['unchanged'] += len(book['notes']) - len(notes)
+
+            if notes:
+                result_count['books'] += 1
+                result_count['highlights'] += len(notes)
+
+    result_count['failed_highlights'] = pipeline.failed_highlight_count
+    result_count['highlights'] -= pipeline.failed_highlight_count
+
+    return result_count
+
+
+def print_result(result_count: dict[str, int]):
+    print('Books: ', result_count['books'])
+    print('Highlights: ', result_count['highlights'])
+    print('Unchanged: ', result_count['unchanged'])
+    print('Skipped books: ', result_count['skipped_books'])
+
+    if has_failed_items(result_count):
+        print('Failed books: ', result_count['failed_books'])
+        print('Failed highlights: ', result_count['failed_highlights'])
+
+
 @app.command()
 @with_extra_parameters(common_params)
+@with_extra_parameters(readwise_params)
 @with_extra_parameters(ridi_common_params)
 def readwise(
     ctx: typer.Context,
@@ -93,73 +421,32 @@ def readwise(
     """
     Sync Ridibooks book notes to Readwise.io.
     """
+    # pylint: disable=import-outside-toplevel
+    from ridiwise.api.readwise import ReadwiseClient
 
     context: ContextState = ctx.ensure_object(dict)
-    logger = context['logger']
 
     with (
-        RidiClient(
-            user_id=context['auths'][PROVIDER]['user_id'],
-            password=context['auths'][PROVIDER]['password'],
-            cache_dir=context['cache_dir'],
-            headless=context['headless_mode'],
-            browser_timeout_seconds=context['browser_timeout_seconds'],
-        ) as ridi_client,
-        ReadwiseClient(token=readwise_token) as readwise_client,
+        ReadwiseClient(
+            token=readwise_token,
+            transport_settings=context['readwise_transport'],
+            compress_requests=context['readwise_compress_requests'],
+        ) as readwise_client,
+        SyncStateStore(context['cache_dir']) as state_store,
     ):
-        books = ridi_client.get_books_from_shelf()
-
-        if not books:
-            print('No book notes found.')
-
-            if context['error_on_empty_source']:
-                raise typer.Exit(EXIT_CODE_EMPTY_SOURCE)
-
-            raise typer.Exit()
-
-        result_count = {
-            'books': 0,
-            'highlights': 0,
-        }
-
-        for book in books:
-            highlights_response = readwise_client.create_highlights(
-                highlights=[
-                    {
-                        'text': note['highlighted_text'],
-                        'title': book['book_title'],
-                        'source_type': PROVIDER,
-                        'category': 'books',
-                        'author': ', '.join(book['authors']),
-                        'highlighted_at': note['created_date'].isoformat(),
-                        'note': note['memo'],
-                        'source_url': book['book_url'],
-                        'highlight_url': (
-                            f'{book["book_notes_url"]}#annotation_{note["id"]}'
-                        ),
-                        'image_url': book['book_cover_image_url'],
-                    }
-                    for note in book['notes']
-                ]
-            )
+        result_count = sync_to_readwise(context, readwise_client, state_store, tags)
 
-            modified_highlight_ids = highlights_response[0]['modified_highlights']
+    if result_count is None:
+        print('No book notes found.')
 
-            if tags:
-                for highlight_id, tag in zip(modified_highlight_ids, tags):
-                    readwise_client.create_highlight_tag(
-                        highlight_id=highlight_id,
-                        tag=tag,
-                    )
+        if context['error_on_empty_source']:
+            raise typer.Exit(EXIT_CODE_EMPTY_SOURCE)
 
-            result_count['books'] += 1
-            result_count['highlights'] += len(book['notes'])
+        raise typer.Exit()
 
-            logger.info(
-                'Created Readwise highlights: '
-                f"`{book['book_title']}` / {len(book['notes'])}"
-            )
+    print('Synced notes to Readwise.io:')
+    print_result(result_count)
 
-        print('Synced notes to Readwise.io:')
-        print('Books: ', result_count['books'])
-        print('Highlights: ', result_count['highlights'])
+    if has_failed_items(result_count):
+        print('Some items failed. Run again with `--resume` to retry them.')
+        raise typer.Exit(EXIT_CODE_INCOMPLETE)
@@ -0,0 +1,102 @@
+from pathlib import Path
+from typing import Optional
+
+import typer
+from typing_extensions import Annotated
+
+from ridiwise.cmd.checkpoint import has_failed_items
+from ridiwise.cmd.common_option import readwise_params
+from ridiwise.cmd.context import ContextState
+from ridiwise.cmd.exit_code import EXIT_CODE_INCOMPLETE
+from ridiwise.cmd.snapshot import iter_snapshot_records, read_snapshot_header
+from ridiwise.cmd.state import SyncStateStore
+from ridiwise.cmd.sync import longblack, ridibooks
+from ridiwise.cmd.utils import with_extra_parameters
+
+UPLOADERS = {
+    ridibooks.PROVIDER: (ridibooks.upload_books, ridibooks.print_result),
+    longblack.PROVIDER: (longblack.upload_scraps, longblack.print_result),
+}
+
+app = typer.Typer(name='upload')
+
+
+@app.callback()
+def main():
+    """
+    Upload highlights exported with `ridiwise export` to another service.
+    """
+
+
+@app.command()
+@with_extra_parameters(readwise_params)
+def readwise(
+    ctx: typer.Context,
+    from_snapshot: Annotated[
+        Path,
+        typer.Option(
+            exists=True,
+            dir_okay=False,
+            readable=True,
+            help='Snapshot written by `ridiwise export`.',
+        ),
+    ],
+    readwise_token: Annotated[
+        str,
+        typer.Option(
+            envvar='READWISE_TOKEN',
+            help='Readwise.io API token. https://readwise.io/access_token',
+        ),
+    ],
+    tags: Annotated[
+        Optional[list[str]],
+        typer.Option(
+            help='Tags to attach to the highlights. Multiple tags can be provided.',
+        ),
+    ] = None,
+):
+    """
+    Upload the highlights of a snapshot to Readwise.io.
+
+    Highlights already synced from this machine are skipped, so an interrupted
+    upload can be run again.
+    """
+    # pylint: disable=import-outside-toplevel
+    from ridiwise.api.readwise import ReadwiseClient
+
+    context: ContextState = ctx.ensure_object(dict)
+
+    try:
+        header = read_snapshot_header(from_snapshot)
+    except (OSError, ValueError) as e:
+        raise typer.BadParameter(str(e), param_hint='--from-snapshot') from e
+
+    if header['provider'] not in UPLOADERS:
+        raise typer.BadParameter(
+            f'Unknown provider: {header["provider"]}', param_hint='--from-snapshot'
+        )
+
+    upload, print_result = UPLOADERS[header['provider']]
+
+    with (
+        ReadwiseClient(
+            token=readwise_token,
+            transport_settings=context['readwise_transport'],
+            compress_requests=context['readwise_compress_requests'],
+        ) as readwise_client,
+        SyncStateStore(context['cache_dir']) as state_store,
+    ):
+        result_count = upload(
+            iter_snapshot_records(from_snapshot),
+            header['account'],
+            readwise_client,
+            state_store,
+            tags,
+        )
+
+    print(f'Uploaded {header["provider"]} snapshot to Readwise.io:')
+    print_result(result_count)
+
+    if has_failed_items(result_count):
+        print('Some highlights failed. Run the upload again to retry them.')
+        raise typer.Exit(EXIT_CODE_INCOMPLETE)
@@ -0,0 +1,190 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+
+PREFIX = 'ridiwise'
+
+# upper bounds in seconds, from a fast HTTP fetch to a slow login
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels, **extra: str) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # the last one counts the values above every bucket
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> Iterator[tuple[str, int]]:
+        count = 0
+        for bound, bucket_count in zip(
+            [*map(str, self.buckets), '+Inf'], self.bucket_counts
+        ):
+            count += bucket_count
+            yield bound, count
+
+
+class MetricsRegistry:
+    """
+    Counters and latency histograms of a sync run, exported as JSON or in the
+    Prometheus text format.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.histograms: dict[str, dict[Labels, Histogram]] = {}
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self.lock:
+            counter = self.counters.setdefault(name, {})
+            key = _labels(labels)
+            counter[key] = counter.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        with self.lock:
+            histogram = self.histograms.setdefault(name, {})
+            key = _labels(labels)
+            if key not in histogram:
+                histogram[key] = Histogram()
+            histogram[key].observe(value)
+
+    @contextlib.contextmanager
+    def span(self, phase: str, **labels):
+        """
+        Times the block as a phase of the run, counting the failed ones.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc('phase_errors_total', phase=phase, **labels)
+            raise
+        finally:
+            self.observe(
+                'phase_duration_seconds',
+                time.perf_counter() - started,
+                phase=phase,
+                **labels,
+            )
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for name, counter in self.counters.items()
+                    for labels, value in counter.items()
+                ],
+                'histograms': [
+                    {
+                        'name': name,
+                        'labels': dict(labels),
+                        'count': histogram.count,
+                        'sum': histogram.sum,
+                        'buckets': dict(histogram.cumulative_counts()),
+                    }
+                    for name, histograms in self.histograms.items()
+                    for labels, histogram in histograms.items()
+                ],
+            }
+
+    def to_prometheus(self) -> str:
+        lines = []
+
+        with self.lock:
+            for name, counter in sorted(self.counters.items()):
+                lines.append(f'# TYPE {PREFIX}_{name} counter')
+                for labels, value in sorted(counter.items()):
+                    lines.append(f'{PREFIX}_{name}{_format_labels(labels)} {value}')
+
+            for name, histograms in sorted(self.histograms.items()):
+                lines.append(f'# TYPE {PREFIX}_{name} histogram')
+                for labels, histogram in sorted(histograms.items()):
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append(
+                            f'{PREFIX}_{name}_bucket'
+                            f'{_format_labels(labels, le=bound)} {count}'
+                        )
+                    lines.append(
+                        f'{PREFIX}_{name}_sum{_format_labels(labels)} {histogram.sum}'
+                    )
+                    lines.append(
+                        f'{PREFIX}_{name}_count{_format_labels(labels)} '
+                        f'{histogram.count}'
+                    )
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: Path):
+        """
+        Writes the metrics as JSON for a `.json` path, or in the Prometheus text
+        format otherwise. The file is replaced at once, so a collector never reads
+        a partial one.
+        """
+        if path.suffix == '.json':
+            content = json.dumps(self.to_dict(), indent=2)
+        else:
+            content = self.to_prometheus()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f'.{path.name}.tmp')
+        temp_path.write_text(content, encoding='utf-8')
+        os.replace(temp_path, path)
+
+
+# shared by the clients and commands of the run
+registry = MetricsRegistry()
+
+inc = registry.inc
+observe = registry.observe
+span = registry.span
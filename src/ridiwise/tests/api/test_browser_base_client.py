@@ -0,0 +1,254 @@
+import http.cookiejar
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from ridiwise.api.browser_base_client import BrowserBaseClient
+
+
+class FakePage:
+    def __init__(self, events: list):
+        self.events = events
+        self.url = None
+        self.closed = False
+
+    def goto(self, url, **_kwargs):
+        self.events.append(('goto', url))
+        self.url = url
+
+        if url.endswith('/broken'):
+            raise RuntimeError('net::ERR_CONNECTION_RESET')
+
+    def wait_for_load_state(self, *_args, **_kwargs):
+        self.events.append(('load', self.url))
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBrowserContext:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.events = []
+        self.pages = []
+        self.cookies = []
+
+    def new_page(self):
+        page = FakePage(self.events)
+        self.pages.append(page)
+        return page
+
+    def add_cookies(self, cookies):
+        self.cookies.extend(cookies)
+
+
+class DummyBrowserClient(BrowserBaseClient):
+    base_url = 'https://example.com'
+    provider = 'dummy'
+    login_path = '/login'
+    auth_cookie_names = ('token',)
+    cookie_domain = 'example.com'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.authenticated = True
+        self.calls = []
+
+    def is_authenticated(self):
+        self.calls.append('probe')
+        return self.authenticated
+
+    def login(self):
+        self.calls.append('login')
+        self.write_storage_state(expires=-1)
+
+    def write_storage_state(self, expires):
+        cookie = {'name': 'token', 'value': 'x', 'domain': '.example.com'}
+        self.storage_state_path.write_text(
+            json.dumps({'cookies': [{**cookie, 'expires': expires}]}),
+            encoding='utf-8',
+        )
+
+
+class TestBrowserBaseClient(unittest.TestCase):
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+
+    def _client(self, concurrency, **kwargs):
+        client = DummyBrowserClient(
+            cache_dir=Path(self.cache_dir.name), concurrency=concurrency, **kwargs
+        )
+        client._browser_context = FakeBrowserContext()  # pylint: disable=protected-access
+        self.addCleanup(client.client.close)
+        return client
+
+    def test_map_pages_keeps_order_and_reuses_pages(self):
+        client = self._client(concurrency=3)
+        urls = [f'https://example.com/{i}' for i in range(10)]
+
+        results = list(client.map_pages(urls, lambda page: page.url))
+
+        self.assertEqual(results, urls)
+        self.assertEqual(len(client.browser_context.pages), 3)
+        self.assertTrue(all(page.closed for page in client.browser_context.pages))
+
+    def test_map_pages_starts_loading_ahead(self):
+        client = self._client(concurrency=2)
+        urls = ['https://example.com/a', 'https://example.com/b']
+
+        results = client.map_pages(urls, lambda page: page.url)
+        next(results)
+
+        self.assertEqual(
+            client.browser_context.events[:3],
+            [
+                ('goto', 'https://example.com/a'),
+                ('goto', 'https://example.com/b'),
+                ('load', 'https://example.com/a'),
+            ],
+        )
+        results.close()
+        self.assertTrue(all(page.closed for page in client.browser_context.pages))
+
+    def test_map_pages_returns_navigation_errors(self):
+        client = self._client(concurrency=2)
+        urls = [f'https://example.com/{i}' for i in ('a', 'broken', 'b', 'c')]
+
+        with self.assertLogs('dummy', level='WARNING'):
+            results = list(
+                client.map_pages(urls, lambda page: page.url, return_exceptions=True)
+            )
+
+        self.assertEqual(results[0], urls[0])
+        self.assertIsInstance(results[1], RuntimeError)
+        self.assertEqual(results[2:], urls[2:])
+
+        with self.assertRaises(RuntimeError):
+            list(client.map_pages(urls, lambda page: page.url))
+
+    def test_is_blocked_request(self):
+        client = self._client(concurrency=1)
+        test_cases = [
+            ('image', 'https://example.com/cover.png', True),
+            ('font', 'https://example.com/font.woff2', True),
+            ('stylesheet', 'https://example.com/style.css', True),
+            ('document', 'https://example.com/', False),
+            ('xhr', 'https://example.com/api', False),
+            ('script', 'https://www.googletagmanager.com/gtag/js', True),
+            ('script', 'https://googletagmanager.com.example.com/js', False),
+            ('xhr', 'https://region1.google-analytics.com/g/collect', True),
+        ]
+
+        for case in test_cases:
+            with self.subTest(case=case):
+                self.assertEqual(client.is_blocked_request(case[0], case[1]), case[2])
+
+    def test_is_blocked_request_with_provider_allowlist(self):
+        client = self._client(concurrency=1)
+        client.allowed_resource_types = frozenset({'stylesheet'})
+        client.allowed_domains = frozenset({'facebook.com'})
+
+        self.assertFalse(
+            client.is_blocked_request('stylesheet', 'https://example.com/a.css')
+        )
+        self.assertFalse(
+            client.is_blocked_request('script', 'https://connect.facebook.com/sdk.js')
+        )
+        self.assertTrue(client.is_blocked_request('image', 'https://example.com/a.png'))
+
+    def test_ensure_session_trusts_probe(self):
+        client = self._client(concurrency=1)
+        client.write_storage_state(expires=time.time() + 3600)
+
+        client.ensure_session()
+        client.ensure_session()
+
+        self.assertEqual(client.calls, ['probe'])
+
+        client.invalidate_session()
+        client.ensure_session()
+
+        self.assertEqual(client.calls, ['probe', 'probe'])
+
+    def test_ensure_session_logs_in_without_probe_on_expired_cookies(self):
+        client = self._client(concurrency=1)
+        client.write_storage_state(expires=time.time() - 1)
+
+        client.ensure_session()
+        client.ensure_session()
+
+        self.assertEqual(client.calls, ['login'])
+
+    def test_ensure_session_logs_in_on_failed_probe(self):
+        client = self._client(concurrency=1)
+        client.write_storage_state(expires=-1)
+        client.authenticated = False
+
+        client.ensure_session()
+
+        self.assertEqual(client.calls, ['probe', 'login'])
+
+    def test_ensure_session_imports_browser_cookies(self):
+        client = self._client(concurrency=1, cookie_browser='chrome')
+        cookie_jar = http.cookiejar.CookieJar()
+        cookie_jar.set_cookie(
+            http.cookiejar.Cookie(
+                version=0,
+                name='token',
+                value='x',
+                port=None,
+                port_specified=False,
+                domain='.example.com',
+                domain_specified=True,
+                domain_initial_dot=True,
+                path='/',
+                path_specified=True,
+                secure=True,
+                expires=None,
+                discard=False,
+                comment=None,
+                comment_url=None,
+                rest={'HTTPOnly': ''},
+            )
+        )
+
+        with mock.patch(
+            'ridiwise.api.browser_base_client.get_cookie_jar', return_value=cookie_jar
+        ) as get_cookie_jar:
+            client.ensure_session()
+
+        get_cookie_jar.assert_called_once_with('chrome', 'example.com')
+        # probed once the cookies are imported, instead of logging in
+        self.assertEqual(client.calls, ['probe'])
+        self.assertEqual(client.get_session_cookie_expiry(), float('inf'))
+        self.assertEqual(client.client.cookies['token'], 'x')
+        self.assertEqual(
+            client.browser_context.cookies,
+            client.read_storage_state()['cookies'],
+        )
+        self.assertTrue(client.browser_context.cookies[0]['httpOnly'])
+
+        with mock.patch(
+            'ridiwise.api.browser_base_client.get_cookie_jar',
+            return_value=http.cookiejar.CookieJar(),
+        ):
+            with self.assertRaises(RuntimeError):
+                client.import_browser_cookies()
+
+    def test_get_session_cookie_expiry(self):
+        client = self._client(concurrency=1)
+        self.assertEqual(client.get_session_cookie_expiry(), 0)
+
+        client.write_storage_state(expires=-1)
+        self.assertEqual(client.get_session_cookie_expiry(), float('inf'))
+
+        client.write_storage_state(expires=1234)
+        self.assertEqual(client.get_session_cookie_expiry(), 1234)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from ridiwise.api.html import parse_html
+
+
+class TestHtml(unittest.TestCase):
+    def test_parse_html(self):
+        root = parse_html(
+            '<ul class="list"><li id="a"><p>first<br>line</p><img src="x.png">'
+            '<p>&lt;memo&gt;</p></li><li id="b" class="item selected">second</li></ul>'
+        )
+
+        items = root.find_all('li')
+        self.assertEqual([item.get('id') for item in items], ['a', 'b'])
+        self.assertEqual(
+            [p.text for p in items[0].find_all('p')], ['first\nline', '<memo>']
+        )
+        self.assertEqual(items[0].find('img').get('src'), 'x.png')
+        self.assertTrue(items[1].has_class('item', 'selected'))
+        self.assertEqual(root.find(class_='selected').text, 'second')
+        self.assertIsNone(root.find('a'))
+
+    def test_parse_html_with_unclosed_elements(self):
+        root = parse_html('<div><ul><li>a<li>b</ul><p>c</div><span>d</span>')
+
+        self.assertEqual(root.find('div').text, 'abc')
+        self.assertEqual(root.find('span').parent.tag, '#document')
+        self.assertEqual(
+            root.find_all(predicate=lambda elem: elem.text == 'd')[0].tag, 'span'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,27 @@
 import datetime
+import re
+import tempfile
 import unittest
+from pathlib import Path
+from unittest import mock
 from zoneinfo import ZoneInfo
 
-from ridiwise.api.longblack import LongblackClient
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+from ridiwise.api.longblack import LongblackClient, MemoCache, ScrapItem
+from ridiwise.api.settings import FetchMode
+
+
+def create_scrap_item(scrap_id: str, date: str) -> ScrapItem:
+    return {
+        'highlighted_text': f'Text of {scrap_id}',
+        'date': date,
+        'scrap_url': f'/note/123#memoId={scrap_id}',
+        'note_title': 'Author: Title',
+        'note_cover_image_url': None,
+        'has_memo': False,
+        'memo': None,
+    }
 
 
 class TestLongblackClient(unittest.TestCase):
@@ -66,6 +85,258 @@ class TestLongblackClient(unittest.TestCase):
                 result = LongblackClient.get_author_from_scrap_title(case['title'])
                 self.assertEqual(result, case['expected'])
 
+    def test_get_scraps_over_http(self):
+        listing = [
+            [
+                create_scrap_item('a', '2024.09.03 12:00'),
+                create_scrap_item('b', '2024.09.02 12:00'),
+            ],
+            # shifted by a scrap added while the listing was loaded
+            [
+                create_scrap_item('b', '2024.09.02 12:00'),
+                create_scrap_item('c', '2024.09.01 12:00'),
+            ],
+            [
+                create_scrap_item('d', '2024.08.31 12:00'),
+                create_scrap_item('e', '2024.08.30 12:00'),
+            ],
+            [create_scrap_item('f', '2024.08.29 12:00')],
+        ]
+
+        fetched_pages = []
+
+        def fetch_scrap_items(url):
+            page_num = int(re.search(r'page=(\d+)', url).group(1))
+            fetched_pages.append(page_num)
+            return listing[page_num - 1] if page_num <= len(listing) else []
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            client = LongblackClient(
+                user_id='user',
+                password='password',
+                cache_dir=Path(temp_dir),
+                headless=True,
+                browser_timeout_seconds=1,
+                concurrency=3,
+                lean_browsing=True,
+                browser_endpoint=None,
+                fetch_mode=FetchMode.HTTP,
+            )
+
+            with (
+                mock.patch.object(client, 'ensure_session'),
+                mock.patch.object(
+                    client, '_fetch_scrap_items', side_effect=fetch_scrap_items
+                ),
+            ):
+                scraps = client.get_scraps()
+                self.assertEqual(
+                    [scrap['scrap_id'] for scrap in scraps],
+                    ['a', 'b', 'c', 'd', 'e', 'f'],
+                )
+
+                scraps = client.get_scraps(
+                    since=datetime.datetime(
+                        2024, 8, 31, 0, 0, tzinfo=ZoneInfo('Asia/Seoul')
+                    )
+                )
+                self.assertEqual(
+                    [scrap['scrap_id'] for scrap in scraps], ['a', 'b', 'c', 'd']
+                )
+
+                # the other pages are not loaded once the first one reaches `since`
+                fetched_pages.clear()
+                scraps = client.get_scraps(
+                    since=datetime.datetime(
+                        2024, 9, 2, 13, 0, tzinfo=ZoneInfo('Asia/Seoul')
+                    )
+                )
+                self.assertEqual([scrap['scrap_id'] for scrap in scraps], ['a'])
+                self.assertEqual(fetched_pages, [1])
+
+    def test_get_scraps_in_browser(self):
+        listing = [
+            [
+                create_scrap_item('a', '2024.09.03 12:00'),
+                create_scrap_item('b', '2024.09.02 12:00'),
+            ],
+            [create_scrap_item('c', '2024.09.01 12:00')],
+        ]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            client = LongblackClient(
+                user_id='user',
+                password='password',
+                cache_dir=Path(temp_dir),
+                headless=True,
+                browser_timeout_seconds=1,
+                concurrency=3,
+                lean_browsing=True,
+                browser_endpoint=None,
+                fetch_mode=FetchMode.BROWSER,
+            )
+            loaded_urls = []
+
+            def map_pages(urls, fn, **_):
+                loaded_urls.extend(urls)
+                return (fn(url) for url in urls)
+
+            def get_scraps_from_dom_page(url, since):
+                page_num = int(re.search(r'page=(\d+)', url).group(1))
+                items = listing[page_num - 1] if page_num <= len(listing) else []
+                # pylint: disable=protected-access
+                items, reached_since = client._take_since(items, since)
+                return [
+                    client._get_scrap_from_item(item, None) for item in items
+                ], reached_since
+
+            with (
+                mock.patch.object(client, 'ensure_session'),
+                mock.patch.object(client, 'map_pages', side_effect=map_pages),
+                mock.patch.object(
+                    client,
+                    '_get_scraps_from_dom_page',
+                    side_effect=get_scraps_from_dom_page,
+                ),
+            ):
+                scraps = client.get_scraps(
+                    since=datetime.datetime(
+                        2024, 9, 2, 13, 0, tzinfo=ZoneInfo('Asia/Seoul')
+                    )
+                )
+                self.assertEqual([scrap['scrap_id'] for scrap in scraps], ['a'])
+                self.assertEqual(len(loaded_urls), 1)
+
+                loaded_urls.clear()
+                scraps = client.get_scraps(
+                    since=datetime.datetime(
+                        2024, 8, 1, 0, 0, tzinfo=ZoneInfo('Asia/Seoul')
+                    )
+                )
+                self.assertEqual(
+                    [scrap['scrap_id'] for scrap in scraps], ['a', 'b', 'c']
+                )
+
+    def test_iter_scraps_with_failed_page(self):
+        listing = [
+            [create_scrap_item('a', '2024.09.03 12:00')],
+            [create_scrap_item('b', '2024.09.02 12:00')],
+            [create_scrap_item('c', '2024.09.01 12:00')],
+        ]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            client = LongblackClient(
+                user_id='user',
+                password='password',
+                cache_dir=Path(temp_dir),
+                headless=True,
+                browser_timeout_seconds=1,
+                concurrency=3,
+                lean_browsing=True,
+                browser_endpoint=None,
+                fetch_mode=FetchMode.BROWSER,
+            )
+            failing_pages = {2}
+
+            def map_pages(urls, fn, return_exceptions=False, **_):
+                for url in urls:
+                    try:
+                        yield fn(url)
+                    except PlaywrightTimeoutError as e:
+                        if not return_exceptions:
+                            raise
+                        yield e
+
+            def get_scraps_from_dom_page(url, _):
+                page_num = int(re.search(r'page=(\d+)', url).group(1))
+                if page_num in failing_pages:
+                    raise PlaywrightTimeoutError('Timeout exceeded')
+
+                items = listing[page_num - 1] if page_num <= len(listing) else []
+                # pylint: disable=protected-access
+                return [
+                    client._get_scrap_from_item(item, None) for item in items
+                ], False
+
+            failed_urls = []
+
+            with (
+                mock.patch.object(client, 'ensure_session'),
+                mock.patch.object(client, 'map_pages', side_effect=map_pages),
+                mock.patch.object(
+                    client,
+                    '_get_scraps_from_dom_page',
+                    side_effect=get_scraps_from_dom_page,
+                ),
+            ):
+                scraps = list(
+                    client.iter_scraps(on_error=lambda url, _: failed_urls.append(url))
+                )
+                self.assertEqual([scrap['scrap_id'] for scrap in scraps], ['a', 'c'])
+                self.assertEqual(len(failed_urls), 1)
+                self.assertIn('page=2', failed_urls[0])
+
+                failing_pages.clear()
+                scraps = list(client.iter_scraps_of_pages(failed_urls))
+                self.assertEqual([scrap['scrap_id'] for scrap in scraps], ['b'])
+
+
+class TestMemoCache(unittest.TestCase):
+    def setUp(self):
+        self.item: ScrapItem = {
+            'highlighted_text': 'Highlighted text',
+            'date': '2024.09.01 12:00',
+            'scrap_url': '/note/123#memoId=abc',
+            'note_title': 'Author: Title',
+            'note_cover_image_url': None,
+            'has_memo': True,
+            'memo': None,
+        }
+
+    def test_get(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / 'memo_cache.json'
+            signature = MemoCache.get_signature(self.item)
+
+            memo_cache = MemoCache(path)
+            memo_cache.set('abc', signature, 'memo')
+            memo_cache.save()
+
+            memo_cache = MemoCache(path, ttl=datetime.timedelta(days=1))
+            self.assertEqual(memo_cache.get('abc', signature), 'memo')
+            self.assertIsNone(memo_cache.get('def', signature))
+
+            changed_item = {**self.item, 'highlighted_text': 'Edited text'}
+            self.assertIsNone(
+                memo_cache.get('abc', MemoCache.get_signature(changed_item))
+            )
+
+            with mock.patch(
+                'time.time',
+                return_value=memo_cache.entries['abc']['cached_at']
+                + datetime.timedelta(days=2).total_seconds(),
+            ):
+                self.assertIsNone(memo_cache.get('abc', signature))
+
+    def test_refresh_memos(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for refresh_memos, expected in [(False, 'memo'), (True, None)]:
+                client = LongblackClient(
+                    user_id='user',
+                    password='password',
+                    cache_dir=Path(temp_dir),
+                    headless=True,
+                    browser_timeout_seconds=1,
+                    concurrency=1,
+                    lean_browsing=True,
+                    browser_endpoint=None,
+                    refresh_memos=refresh_memos,
+                )
+                client.memo_cache.set('abc', MemoCache.get_signature(self.item), 'memo')
+
+                # pylint: disable=protected-access
+                self.assertEqual(client._get_known_memo(self.item), expected)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from ridiwise.api.rate_limit import RateLimiter, parse_retry_after
+
+
+class FakeClock:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_parse_retry_after(self):
+        test_cases = [
+            (None, None),
+            ('', None),
+            ('5', 5.0),
+            ('0.5', 0.5),
+            ('-1', 0.0),
+            ('Wed, 21 Oct 2015 07:28:00 GMT', 0.0),
+            ('invalid', None),
+        ]
+
+        for case in test_cases:
+            with self.subTest(case=case):
+                self.assertEqual(parse_retry_after(case[0]), case[1])
+
+    def test_reserve_spaces_requests_by_rate(self):
+        clock = FakeClock()
+        limiter = RateLimiter(max_rate=2, burst=2, clock=clock)
+
+        delays = [limiter.reserve() for _ in range(4)]
+
+        self.assertEqual(delays, [0.0, 0.0, 0.5, 1.0])
+
+        clock.now = 10.0
+        self.assertEqual(limiter.reserve(), 0.0)
+
+    def test_rate_limited_backs_off_and_recovers(self):
+        clock = FakeClock()
+        limiter = RateLimiter(max_rate=4, burst=4, clock=clock)
+
+        limiter.on_rate_limited(retry_after=3)
+
+        self.assertEqual(limiter.rate, 2)
+        self.assertEqual(limiter.reserve(), 3.0)
+
+        for _ in range(100):
+            limiter.on_success()
+
+        self.assertEqual(limiter.rate, 4)
+
+    def test_rate_limited_spaces_requests_after_block(self):
+        clock = FakeClock()
+        limiter = RateLimiter(max_rate=4, burst=4, clock=clock)
+
+        for _ in range(4):
+            limiter.reserve()
+
+        limiter.on_rate_limited(retry_after=30)
+
+        delays = [limiter.reserve() for _ in range(6)]
+
+        self.assertEqual(delays, [30.0, 30.5, 31.0, 31.5, 32.0, 32.5])
+
+        # nothing is earned while blocked
+        clock.now = 10.0
+        self.assertEqual(limiter.reserve(), 23.0)
+
+    def test_rate_does_not_drop_below_min_rate(self):
+        limiter = RateLimiter(max_rate=1, min_rate=0.5, clock=FakeClock())
+
+        for _ in range(10):
+            limiter.on_rate_limited()
+
+        self.assertEqual(limiter.rate, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import gzip
+import json
+import threading
+import unittest
+from unittest import mock
+
+import httpx
+
+from ridiwise.api.base_client import get_transport_options
+from ridiwise.api.rate_limit import RateLimiter
+from ridiwise.api.readwise import (
+    ReadwiseClient,
+    chunk_highlights,
+    merge_highlights_responses,
+)
+
+
+def _response_item(book_id, modified_highlights, num_highlights):
+    return {
+        'id': book_id,
+        'title': f'Book {book_id}',
+        'author': None,
+        'category': 'books',
+        'source': 'ridibooks',
+        'num_highlights': num_highlights,
+        'last_highlight_at': None,
+        'updated': '2024-01-01T00:00:00Z',
+        'cover_image_url': None,
+        'highlights_url': None,
+        'source_url': None,
+        'modified_highlights': modified_highlights,
+    }
+
+
+class TestReadwiseClient(unittest.TestCase):
+    def test_chunk_highlights_by_count(self):
+        highlights = [{'text': str(i), 'title': 'Title'} for i in range(5)]
+
+        chunks = list(chunk_highlights(highlights, max_count=2, max_bytes=10_000))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(sum(chunks, []), highlights)
+
+    def test_chunk_highlights_by_bytes(self):
+        highlights = [
+            {'text': 'a' * 40, 'title': 'Title'},
+            {'text': 'b' * 40, 'title': 'Title'},
+            {'text': 'c' * 200, 'title': 'Title'},
+            {'text': 'd', 'title': 'Title'},
+        ]
+
+        chunks = list(chunk_highlights(highlights, max_count=100, max_bytes=150))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1, 1])
+        self.assertEqual(sum(chunks, []), highlights)
+
+    def test_chunk_highlights_empty(self):
+        self.assertEqual(list(chunk_highlights([])), [])
+
+    def test_merge_highlights_responses(self):
+        merged = merge_highlights_responses(
+            [
+                [_response_item(1, [10, 11], 2), _response_item(2, [20], 1)],
+                [_response_item(1, [12], 3)],
+            ]
+        )
+
+        self.assertEqual([item['id'] for item in merged], [1, 2])
+        self.assertEqual(merged[0]['modified_highlights'], [10, 11, 12])
+        self.assertEqual(merged[0]['num_highlights'], 3)
+        self.assertEqual(merged[1]['modified_highlights'], [20])
+
+    def test_create_highlights(self):
+        requests = []
+        lock = threading.Lock()
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            content = request.content
+
+            if request.headers.get('Content-Encoding') == 'gzip':
+                content = gzip.decompress(content)
+
+            highlights = json.loads(content)['highlights']
+
+            with lock:
+                requests.append((request.headers.get('Content-Encoding'), highlights))
+
+            return httpx.Response(
+                200, json=[_response_item(1, [len(highlights)], len(highlights))]
+            )
+
+        highlights = [{'text': 'a' * 1024, 'title': 'Title'} for _ in range(40)]
+
+        with ReadwiseClient(
+            token='token',
+            max_highlights_per_request=20,
+            rate_limiter=RateLimiter(max_rate=1000, burst=10),
+            compress_requests=True,
+            transport=httpx.MockTransport(handler),
+        ) as client:
+            response = client.create_highlights(highlights)
+            client.create_highlights(highlights[:1])
+
+        self.assertEqual(response[0]['modified_highlights'], [20, 20])
+        self.assertEqual(sorted(len(request[1]) for request in requests), [1, 20, 20])
+        self.assertEqual(
+            sorted(request[0] or '' for request in requests), ['', 'gzip', 'gzip']
+        )
+
+    def test_error_responses_keep_the_rate(self):
+        status_codes = iter([500, 400, 401, 200])
+
+        def handler(_: httpx.Request) -> httpx.Response:
+            return httpx.Response(next(status_codes))
+
+        rate_limiter = RateLimiter(max_rate=1000, burst=10)
+        rate_limiter.on_rate_limited(0)
+
+        with ReadwiseClient(
+            token='token',
+            rate_limiter=rate_limiter,
+            transport=httpx.MockTransport(handler),
+        ) as client:
+            lowered_rate = client.request_rate
+
+            # pylint: disable=protected-access
+            for _ in range(3):
+                client._request('GET', '/auth/')
+            self.assertEqual(client.request_rate, lowered_rate)
+
+            client._request('GET', '/auth/')
+            self.assertGreater(client.request_rate, lowered_rate)
+
+
+class TestTransportOptions(unittest.TestCase):
+    def test_get_transport_options(self):
+        options = get_transport_options(
+            {'max_connections': 2, 'connect_timeout_seconds': 1, 'timeout_seconds': 9}
+        )
+
+        self.assertEqual(options['limits'].max_connections, 2)
+        self.assertEqual(options['limits'].max_keepalive_connections, 2)
+        self.assertEqual(options['timeout'].connect, 1)
+        self.assertEqual(options['timeout'].read, 9)
+        self.assertEqual(options['timeout'].pool, 9)
+        self.assertFalse(options['http2'])
+
+    def test_http2_without_h2(self):
+        with (
+            mock.patch('importlib.util.find_spec', return_value=None),
+            self.assertLogs(level='WARNING'),
+        ):
+            options = get_transport_options({'http2': True})
+
+        self.assertFalse(options['http2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,415 @@
+import datetime
+import tempfile
+import tracemalloc
+import unittest
+from pathlib import Path
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+from ridiwise.api.ridibooks import (
+    SELECTOR_MORE_BUTTON,
+    SELECTOR_NOTE_ITEMS,
+    RidiClient,
+)
+from ridiwise.api.settings import FetchMode, NoteExtractionMode
+
+KST = ZoneInfo('Asia/Seoul')
+
+
+class FakeLocator:
+    def __init__(self, page: 'FakeNotesPage', selector: str):
+        self.page = page
+        self.selector = selector
+
+    def evaluate_all(self, _, offset):
+        assert self.selector == SELECTOR_NOTE_ITEMS
+        self.page.offsets.append(offset)
+        return self.page.rendered_items[offset:]
+
+    def count(self):
+        assert self.selector == SELECTOR_NOTE_ITEMS
+        return len(self.page.rendered_items)
+
+    def is_visible(self):
+        assert self.selector == SELECTOR_MORE_BUTTON
+        return self.page.loaded < len(self.page.batches)
+
+    def click(self):
+        assert self.selector == SELECTOR_MORE_BUTTON
+        if self.page.click_error is not None:
+            raise self.page.click_error
+
+        if self.page.loaded < self.page.max_loaded:
+            self.page.loaded += 1
+
+
+class FakeNotesPage:
+    """
+    Reading-note page which renders a batch of note items on each "더보기" click,
+    up to `max_loaded` batches
+    """
+
+    url = 'https://ridibooks.com/reading-note/detail/1'
+
+    def __init__(self, batches, max_loaded=None, click_error=None):
+        self.batches = batches
+        self.max_loaded = len(batches) if max_loaded is None else max_loaded
+        self.click_error = click_error
+        self.loaded = 1
+        self.offsets = []
+        self.waits = []
+
+    @property
+    def rendered_items(self):
+        return [item for batch in self.batches[: self.loaded] for item in batch]
+
+    def locator(self, selector):
+        return FakeLocator(self, selector)
+
+    def wait_for_function(self, _, arg):
+        selector, count = arg
+        assert selector == SELECTOR_NOTE_ITEMS
+        self.waits.append(count)
+
+        if len(self.rendered_items) <= count:
+            raise PlaywrightTimeoutError('Timeout exceeded')
+
+    def wait_for_load_state(self, state):
+        self.waits.append(state)
+
+
+class FakeResponse:  # pylint: disable=too-few-public-methods
+    url = 'https://ridibooks.com/api/annotations'
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+def create_book(book_id: str):
+    return {
+        'book_title': f'Book {book_id}',
+        'book_url': f'https://ridibooks.com/books/{book_id}',
+        'book_notes_url': f'https://ridibooks.com/reading-note/detail/{book_id}',
+        'book_id': book_id,
+        'notes': [],
+        'authors': ['Author'],
+        'book_cover_image_url': '',
+        'shelf_summary': '',
+    }
+
+
+def create_note_item(annotation_id: str, text: str):
+    return {
+        'id': f'annotation_{annotation_id}',
+        'paragraphs': [text, '2024.07.01.'],
+    }
+
+
+class TestRidiClient(unittest.TestCase):
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+
+        self.client = RidiClient(
+            user_id='user', password='password', cache_dir=Path(cache_dir.name)
+        )
+        self.addCleanup(self.client.client.close)
+
+    def test_get_book_info_from_item(self):
+        item = {
+            'title': 'Book Title',
+            'text': 'Book Title\nAuthor A, Author B\n  3 notes  ',
+            'links': [
+                {'href': '/reading-note/detail/123', 'text': 'Book Title'},
+                {'href': '/reading-note/detail/123', 'text': ''},
+                {'href': '/author/1', 'text': 'Author A'},
+                {'href': '/author/2', 'text': 'Author B'},
+                {'href': '', 'text': 'no href'},
+            ],
+        }
+
+        self.assertEqual(
+            self.client._get_book_info_from_item(item),  # pylint: disable=protected-access
+            {
+                'book_title': 'Book Title',
+                'book_url': 'https://ridibooks.com/books/123',
+                'book_notes_url': 'https://ridibooks.com/reading-note/detail/123',
+                'book_id': '123',
+                'notes': [],
+                'authors': ['Author A', 'Author B'],
+                'book_cover_image_url': ('https://img.ridicdn.net/cover/123/xxlarge#1'),
+                'shelf_summary': 'Book Title Author A, Author B 3 notes',
+            },
+        )
+
+    def test_get_book_info_from_item_without_unique_book_id(self):
+        test_cases = [
+            [],
+            [
+                {'href': '/reading-note/detail/1', 'text': ''},
+                {'href': '/reading-note/detail/2', 'text': ''},
+            ],
+        ]
+
+        for links in test_cases:
+            with self.subTest(links=links), self.assertRaises(ValueError):
+                # pylint: disable=protected-access
+                self.client._get_book_info_from_item(
+                    {'title': 'T', 'text': 'T', 'links': links}
+                )
+
+    def test_get_note_from_item(self):
+        # pylint: disable=protected-access
+        test_cases = [
+            (
+                {
+                    'id': 'annotation_1',
+                    'paragraphs': [' text ', ' memo ', '2024.07.01.'],
+                },
+                {
+                    'id': '1',
+                    'highlighted_text': 'text',
+                    'memo': 'memo',
+                    'created_date': datetime.datetime(2024, 7, 1, tzinfo=KST),
+                },
+            ),
+            (
+                {'id': 'annotation_2', 'paragraphs': ['text', '2024.07.02.']},
+                {
+                    'id': '2',
+                    'highlighted_text': 'text',
+                    'memo': None,
+                    'created_date': datetime.datetime(2024, 7, 2, tzinfo=KST),
+                },
+            ),
+            ({'id': 'annotation_3', 'paragraphs': []}, None),
+        ]
+
+        for case in test_cases:
+            with self.subTest(case=case):
+                self.assertEqual(self.client._get_note_from_item(case[0]), case[1])
+
+    def test_parse_note_date(self):
+        test_cases = [
+            ('2024.07.01.', datetime.datetime(2024, 7, 1, tzinfo=KST)),
+            ('2023.12.31.', datetime.datetime(2023, 12, 31, tzinfo=KST)),
+            ('invalid', None),
+        ]
+
+        for case in test_cases:
+            with self.subTest(case=case):
+                self.assertEqual(RidiClient.parse_note_date(case[0]), case[1])
+
+    def test_parse_annotation_datetime(self):
+        expected = datetime.datetime(2024, 7, 1, 12, 30, tzinfo=KST)
+        test_cases = [
+            ('2024-07-01T12:30:00+09:00', expected),
+            ('2024-07-01T03:30:00Z', expected),
+            ('2024-07-01T12:30:00', expected),
+            (int(expected.timestamp()), expected),
+            (int(expected.timestamp()) * 1000, expected),
+            ('2024.07.01.', datetime.datetime(2024, 7, 1, tzinfo=KST)),
+            (None, None),
+            ('invalid', None),
+        ]
+
+        for case in test_cases:
+            with self.subTest(case=case):
+                self.assertEqual(RidiClient.parse_annotation_datetime(case[0]), case[1])
+
+    def test_parse_annotation_payload(self):
+        payload = {
+            'data': {
+                'annotations': [
+                    {
+                        'id': 123,
+                        'highlight': ' highlighted text ',
+                        'memo': 'memo',
+                        'created_at': '2024-07-01T12:30:00+09:00',
+                    },
+                    {
+                        'id': 'abc',
+                        'text': 'another text',
+                        'memo': '',
+                        'created_at': None,
+                    },
+                    {'id': 456, 'color': 'yellow'},
+                    # not an annotation, without a date
+                    {'id': 789, 'text': 'chapter'},
+                ],
+                'book': {'id': 1, 'content': 'description'},
+                'pagination': {'total': 2},
+            }
+        }
+
+        self.assertEqual(
+            RidiClient.parse_annotation_payload(payload),
+            [
+                {
+                    'id': '123',
+                    'highlighted_text': 'highlighted text',
+                    'memo': 'memo',
+                    'created_date': datetime.datetime(2024, 7, 1, 12, 30, tzinfo=KST),
+                },
+                {
+                    'id': 'abc',
+                    'highlighted_text': 'another text',
+                    'memo': None,
+                    'created_date': None,
+                },
+            ],
+        )
+
+    def test_parse_annotation_payload_without_annotations(self):
+        self.assertEqual(RidiClient.parse_annotation_payload({'user': 'me'}), [])
+        self.assertEqual(RidiClient.parse_annotation_payload([1, 'a', None]), [])
+        self.assertEqual(
+            RidiClient.parse_annotation_payload(
+                {'id': 1, 'text': 'text', 'created_at': None}
+            ),
+            [],
+        )
+
+    def measure_iter_books_with_notes(self, book_count: int) -> int:
+        """
+        Returns the peak memory allocated while the notes of the books are read
+        and released one book at a time.
+        """
+        books = [create_book(str(book_id)) for book_id in range(book_count)]
+
+        def fetch_notes(book):
+            return [
+                {
+                    'id': f'{book["book_id"]}-{note_id}',
+                    'highlighted_text': f'{book["book_id"]}-{note_id} ' * 100,
+                    'memo': None,
+                    'created_date': None,
+                }
+                for note_id in range(50)
+            ]
+
+        self.client.fetch_mode = FetchMode.HTTP
+
+        with (
+            mock.patch.object(self.client, 'ensure_session'),
+            mock.patch.object(self.client, '_fetch_notes', fetch_notes),
+        ):
+            tracemalloc.start()
+            try:
+                for book in self.client.iter_books_with_notes(books):
+                    self.assertEqual(len(book['notes']), 50)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+        # the books given are not kept with their notes
+        self.assertTrue(all(not book['notes'] for book in books))
+
+        return peak
+
+    def test_iter_books_with_notes_memory(self):
+        small = self.measure_iter_books_with_notes(20)
+        large = self.measure_iter_books_with_notes(400)
+
+        # 400 books of notes alone are over 20 MB
+        self.assertLess(large, small * 2)
+
+    def test_get_notes_from_responses(self):
+        self.client.note_extraction_mode = NoteExtractionMode.NETWORK
+        # the first batch is rendered by the server, without a response
+        page = FakeNotesPage(
+            [
+                [
+                    create_note_item('1', 'first'),
+                    create_note_item('2', 'second'),
+                    create_note_item('3', 'third'),
+                ]
+            ]
+        )
+        # pylint: disable=protected-access
+        self.client._annotation_responses[page] = [
+            FakeResponse(
+                {
+                    'annotations': [
+                        {
+                            'id': 3,
+                            'text': 'third',
+                            'memo': 'memo',
+                            'created_at': '2024-07-02T12:30:00+09:00',
+                        }
+                    ]
+                }
+            )
+        ]
+
+        notes = self.client._get_notes_from_responses(page)
+
+        self.assertEqual([note['id'] for note in notes], ['1', '2', '3'])
+        self.assertEqual(
+            notes[0]['created_date'], datetime.datetime(2024, 7, 1, tzinfo=KST)
+        )
+        self.assertEqual(notes[2]['memo'], 'memo')
+        self.assertEqual(
+            notes[2]['created_date'],
+            datetime.datetime(2024, 7, 2, 12, 30, tzinfo=KST),
+        )
+
+    def test_iter_notes_from_dom_page(self):
+        batches = [
+            [create_note_item('1', 'first'), create_note_item('2', 'second')],
+            [create_note_item('3', 'third')],
+            [create_note_item('4', 'fourth'), create_note_item('5', 'fifth')],
+        ]
+        page = FakeNotesPage(batches)
+
+        # pylint: disable=protected-access
+        notes = list(self.client._iter_notes_from_dom_page(page))
+
+        self.assertEqual([note['id'] for note in notes], ['1', '2', '3', '4', '5'])
+        # only the items appended by each "더보기" are read
+        self.assertEqual(page.offsets, [0, 2, 3])
+        # each round waits on the list to grow past the items read
+        self.assertEqual(page.waits, [2, 3])
+
+    def test_iter_notes_from_dom_page_stalled(self):
+        batches = [
+            [create_note_item('1', 'first')],
+            [create_note_item('2', 'second')],
+            [create_note_item('3', 'third')],
+        ]
+        # the button stays while the third batch is never loaded
+        page = FakeNotesPage(batches, max_loaded=2)
+
+        with self.assertLogs(self.client.logger, level='WARNING'):
+            # pylint: disable=protected-access
+            notes = list(self.client._iter_notes_from_dom_page(page))
+
+        self.assertEqual([note['id'] for note in notes], ['1', '2'])
+        self.assertEqual(page.offsets, [0, 1])
+        self.assertEqual(page.waits, [1, 2, 'networkidle'])
+
+    def test_iter_notes_from_dom_page_click_timeout(self):
+        batches = [
+            [create_note_item('1', 'first'), create_note_item('2', 'second')],
+            [create_note_item('3', 'third')],
+        ]
+        page = FakeNotesPage(
+            batches, click_error=PlaywrightTimeoutError('Timeout exceeded')
+        )
+
+        with self.assertLogs(self.client.logger, level='WARNING'):
+            # pylint: disable=protected-access
+            notes = list(self.client._iter_notes_from_dom_page(page))
+
+        self.assertEqual([note['id'] for note in notes], ['1', '2'])
+        self.assertEqual(page.waits, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
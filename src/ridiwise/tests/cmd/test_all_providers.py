@@ -0,0 +1,176 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from typer.testing import CliRunner
+
+from ridiwise.cmd.exit_code import EXIT_CODE_EMPTY_SOURCE, EXIT_CODE_INCOMPLETE
+from ridiwise.cmd.main import app
+
+# not to pick up the credentials of the environment running the tests
+ENV = dict.fromkeys(
+    [
+        'RIDI_AUTH_METHOD',
+        'RIDI_USER_ID',
+        'RIDI_PASSWORD',
+        'LONGBLACK_AUTH_METHOD',
+        'LONGBLACK_USER_ID',
+        'LONGBLACK_PASSWORD',
+        'ERROR_ON_EMPTY_SOURCE',
+        'FULL_SYNC',
+        'RESUME',
+        'METRICS_FILE',
+        'RIDIWISE_BROWSER_ENDPOINT',
+        'RIDIWISE_SHARE_BROWSER',
+        'FETCH_MODE',
+    ]
+)
+
+RIDIBOOKS_ARGS = ['--ridi-user-id', 'user', '--ridi-password', 'password']
+LONGBLACK_ARGS = ['--longblack-user-id', 'user', '--longblack-password', 'password']
+
+RIDIBOOKS_RESULT = {
+    'books': 1,
+    'highlights': 2,
+    'skipped_books': 0,
+    'unchanged': 0,
+    'failed_books': 0,
+    'failed_highlights': 0,
+}
+LONGBLACK_RESULT = {
+    'articles': 1,
+    'highlights': 3,
+    'unchanged': 0,
+    'failed_highlights': 0,
+}
+
+
+class TestSyncAll(unittest.TestCase):
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+
+    def sync(self, *args: str, ridibooks=None, longblack=None, fetch_mode='http'):
+        """
+        Runs `sync all readwise` with the sync of each provider returning or raising
+        the given result, and returns the CLI result with the stubs.
+        """
+        ridibooks_sync = mock.Mock(side_effect=[ridibooks])
+        longblack_sync = mock.Mock(side_effect=[longblack])
+
+        with (
+            mock.patch('ridiwise.cmd.sync.ridibooks.sync_to_readwise', ridibooks_sync),
+            mock.patch('ridiwise.cmd.sync.longblack.sync_to_readwise', longblack_sync),
+        ):
+            result = CliRunner().invoke(
+                app,
+                [
+                    '--cache-dir',
+                    self.cache_dir,
+                    'sync',
+                    'all',
+                    'readwise',
+                    '--readwise-token',
+                    'token',
+                    '--fetch-mode',
+                    fetch_mode,
+                    *args,
+                ],
+                env=ENV,
+            )
+
+        return result, ridibooks_sync, longblack_sync
+
+    def test_no_provider(self):
+        result, _, _ = self.sync()
+
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('No provider is configured', result.output)
+
+    def test_provider_selection(self):
+        result, ridibooks_sync, longblack_sync = self.sync(
+            *RIDIBOOKS_ARGS, ridibooks=RIDIBOOKS_RESULT
+        )
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        ridibooks_sync.assert_called_once()
+        longblack_sync.assert_not_called()
+
+        context = ridibooks_sync.call_args.args[0]
+        self.assertEqual(list(context['auths']), ['ridibooks'])
+
+        result, ridibooks_sync, longblack_sync = self.sync(
+            '--longblack-auth-method',
+            'browser_cookie',
+            longblack=LONGBLACK_RESULT,
+        )
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        ridibooks_sync.assert_not_called()
+        longblack_sync.assert_called_once()
+
+    def test_summary(self):
+        result, _, _ = self.sync(
+            *RIDIBOOKS_ARGS,
+            *LONGBLACK_ARGS,
+            ridibooks=RIDIBOOKS_RESULT,
+            longblack=LONGBLACK_RESULT,
+        )
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('[ridibooks]\nBooks:  1\nHighlights:  2\n', result.output)
+        self.assertIn('[longblack]\nArticles:  1\nHighlights:  3\n', result.output)
+
+    def test_exit_code(self):
+        incomplete = {**LONGBLACK_RESULT, 'failed_highlights': 1}
+
+        for ridibooks, longblack, args, exit_code in [
+            # a failed provider first, then failed items, then an empty source
+            (RuntimeError('login failed'), incomplete, [], 1),
+            (None, incomplete, ['--error-on-empty-source'], EXIT_CODE_INCOMPLETE),
+            (
+                None,
+                LONGBLACK_RESULT,
+                ['--error-on-empty-source'],
+                EXIT_CODE_EMPTY_SOURCE,
+            ),
+            (None, LONGBLACK_RESULT, [], 0),
+        ]:
+            with self.subTest(ridibooks=ridibooks, longblack=longblack, args=args):
+                result, _, _ = self.sync(
+                    *RIDIBOOKS_ARGS,
+                    *LONGBLACK_ARGS,
+                    *args,
+                    ridibooks=ridibooks,
+                    longblack=longblack,
+                )
+
+                self.assertEqual(result.exit_code, exit_code, result.output)
+                # the other provider is summarized even if one failed
+                self.assertIn('[longblack]\nArticles:  1\n', result.output)
+
+    def test_share_browser(self):
+        for args, launched in [([], False), (['--share-browser'], True)]:
+            with (
+                self.subTest(args=args),
+                mock.patch('playwright.sync_api.sync_playwright'),
+                mock.patch(
+                    'ridiwise.cmd.sync.all_providers.launch_browser'
+                ) as launch_browser,
+            ):
+                result, _, _ = self.sync(
+                    *RIDIBOOKS_ARGS,
+                    *args,
+                    ridibooks=RIDIBOOKS_RESULT,
+                    fetch_mode='browser',
+                )
+
+                self.assertEqual(result.exit_code, 0, result.output)
+                # the providers launch their own browsers unless one is shared
+                self.assertEqual(launch_browser.called, launched)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import datetime
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+
+from ridiwise.cmd.checkpoint import RunJournal, retry_failed
+
+
+class TestRunJournal(unittest.TestCase):
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        self.cache_dir = Path(self.temp_dir.name)
+
+    def test_resume(self):
+        book = {
+            'book_id': '1',
+            'notes': [
+                {
+                    'id': '10',
+                    'created_date': datetime.datetime(
+                        2024, 1, 1, tzinfo=datetime.timezone.utc
+                    ),
+                }
+            ],
+        }
+
+        with RunJournal(self.cache_dir, 'ridibooks', 'user') as journal:
+            journal.record_scraped('1', book)
+            journal.record_scraped('2', {'book_id': '2', 'notes': []})
+            journal.record_uploaded(['2'])
+            journal.mark('listing_read')
+
+        # interrupted while writing
+        with open(journal.path, 'a', encoding='utf-8') as f:
+            f.write('{"event": "scra')
+
+        with RunJournal(self.cache_dir, 'ridibooks', 'user', resume=True) as journal:
+            self.assertTrue(journal.resumed)
+            self.assertEqual(journal.scraped['1'], book)
+            self.assertEqual(journal.uploaded, {'2'})
+            self.assertEqual(journal.marks, {'listing_read'})
+
+            journal.record_uploaded(['1'])
+
+        with RunJournal(self.cache_dir, 'ridibooks', 'user', resume=True) as journal:
+            self.assertEqual(journal.uploaded, {'1', '2'})
+            journal.finish()
+
+        self.assertFalse(journal.path.exists())
+
+    def test_resume_other_account(self):
+        with RunJournal(self.cache_dir, 'ridibooks', 'user') as journal:
+            journal.record_uploaded(['1'])
+
+        with RunJournal(self.cache_dir, 'ridibooks', 'other', resume=True) as journal:
+            self.assertFalse(journal.resumed)
+            self.assertEqual(journal.uploaded, set())
+
+        with RunJournal(self.cache_dir, 'ridibooks', 'other') as journal:
+            self.assertFalse(journal.resumed)
+
+
+class TestRetryFailed(unittest.TestCase):
+    def test_retry_failed(self):
+        attempts = []
+
+        def retry(items):
+            attempts.append(items)
+            return [item for item in items if item == 'bad']
+
+        with self.assertLogs('test', level='WARNING'):
+            failed = retry_failed(
+                ['bad', 'flaky'],
+                retry,
+                logging.getLogger('test'),
+                rounds=2,
+                backoff_seconds=0,
+            )
+
+        self.assertEqual(failed, ['bad'])
+        self.assertEqual(attempts, [['bad', 'flaky'], ['bad']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import logging
+import unittest
+from unittest import mock
+
+from playwright.sync_api import Error as PlaywrightError
+
+from ridiwise.cmd.daemon import has_open_contexts, postpone_recycle
+
+
+class FakeCDPSession:
+    def __init__(self, browser: 'FakeBrowser'):
+        self.browser = browser
+
+    def send(self, method):
+        assert method == 'Target.getBrowserContexts'
+        return {'browserContextIds': self.browser.context_ids.pop(0)}
+
+    def detach(self):
+        pass
+
+
+class FakeBrowser:
+    """
+    Browser with the contexts of the attached clients at each check
+    """
+
+    def __init__(self, context_ids: list[list[str]], connected: bool = True):
+        self.context_ids = context_ids
+        self.connected = connected
+
+    def is_connected(self):
+        return self.connected
+
+    def new_browser_cdp_session(self):
+        if not self.connected:
+            raise PlaywrightError('Browser has been closed')
+        return FakeCDPSession(self)
+
+
+class TestDaemon(unittest.TestCase):
+    def test_has_open_contexts(self):
+        self.assertTrue(has_open_contexts(FakeBrowser([['1']])))
+        self.assertFalse(has_open_contexts(FakeBrowser([[]])))
+        self.assertFalse(has_open_contexts(FakeBrowser([], connected=False)))
+
+    def test_postpone_recycle(self):
+        # a sync between its books has a context without pages
+        browser = FakeBrowser([['1'], ['1', '2'], []])
+        logger = logging.getLogger('ridiwise')
+
+        with (
+            mock.patch('ridiwise.cmd.daemon.wait_until_recycle') as wait,
+            self.assertLogs(logger, level='INFO') as logs,
+        ):
+            postpone_recycle(browser, logger)
+
+        self.assertEqual(wait.call_count, 2)
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(browser.context_ids, [])
+
+    def test_postpone_recycle_when_disconnected(self):
+        browser = FakeBrowser([['1']], connected=False)
+
+        with mock.patch('ridiwise.cmd.daemon.wait_until_recycle') as wait:
+            postpone_recycle(browser, logging.getLogger('ridiwise'))
+
+        wait.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import contextlib
+import io
+import tempfile
+import tracemalloc
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from ridiwise.api.ridibooks import RidiClient
+from ridiwise.api.settings import FetchMode
+from ridiwise.cmd.export import write_snapshot
+from ridiwise.cmd.snapshot import iter_snapshot_records
+from ridiwise.cmd.sync import ridibooks
+
+NOTES_PER_BOOK = 50
+
+
+def create_shelf_item(book_id: int):
+    return {
+        'title': f'Book {book_id}',
+        'text': f'Book {book_id}\nAuthor\n  {NOTES_PER_BOOK} notes  ',
+        'links': [{'href': f'/reading-note/detail/{book_id}', 'text': ''}],
+    }
+
+
+def fetch_notes(book):
+    return [
+        {
+            'id': f'{book["book_id"]}-{note_id}',
+            'highlighted_text': f'{book["book_id"]}-{note_id} ' * 100,
+            'memo': None,
+            'created_date': None,
+        }
+        for note_id in range(NOTES_PER_BOOK)
+    ]
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.cache_dir = Path(temp_dir.name)
+
+    def export_ridibooks(self, book_count: int) -> int:
+        """
+        Exports a shelf of `book_count` books, and returns the peak memory allocated
+        while the snapshot is written.
+        """
+        shelf_items = [create_shelf_item(book_id) for book_id in range(book_count)]
+        client = RidiClient(
+            user_id='user',
+            password='password',
+            cache_dir=self.cache_dir,
+            fetch_mode=FetchMode.HTTP,
+        )
+        context = {
+            'auths': {ridibooks.PROVIDER: {'user_id': 'user'}},
+            'cache_dir': self.cache_dir,
+            'error_on_empty_source': False,
+        }
+        path = self.cache_dir / f'ridibooks-{book_count}.jsonl.gz'
+
+        with (
+            mock.patch.object(ridibooks, 'create_client', return_value=client),
+            mock.patch.object(client, 'ensure_session'),
+            mock.patch.object(client, '_fetch_shelf_items', lambda: shelf_items),
+            mock.patch.object(client, '_fetch_notes', fetch_notes),
+            contextlib.redirect_stdout(io.StringIO()),
+        ):
+            tracemalloc.start()
+            try:
+                write_snapshot(
+                    context, ridibooks.PROVIDER, ridibooks.export_books(context), path
+                )
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+        self.assertEqual(sum(1 for _ in iter_snapshot_records(path)), book_count)
+
+        return peak
+
+    def test_export_memory(self):
+        small = self.export_ridibooks(20)
+        large = self.export_ridibooks(400)
+
+        # the notes of 400 books alone are over 20 MB, while the books of the shelf
+        # are kept without them
+        self.assertLess(large, small * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import contextlib
+import datetime
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from ridiwise.cmd.state import SyncStateStore
+from ridiwise.cmd.sync.longblack import (
+    PROVIDER,
+    RECHECK_WATERMARK,
+    SCRAP_RECHECK_INTERVAL,
+    get_listing_since,
+    read_scraps,
+)
+
+
+class FakeLongblackClient(contextlib.AbstractContextManager):
+    """
+    Client whose listing pages fail the first `failures` times they are read
+    """
+
+    def __init__(self, pages: dict[str, list[str]], failures: dict[str, int]):
+        self.pages = pages
+        self.failures = failures
+
+    def __exit__(self, *args):
+        pass
+
+    def iter_scraps_of_pages(self, urls, _, on_error):
+        for url in urls:
+            if self.failures.get(url):
+                self.failures[url] -= 1
+                on_error(url, TimeoutError('Timeout exceeded'))
+                continue
+
+            for scrap_id in self.pages[url]:
+                yield {'scrap_id': scrap_id}
+
+    def iter_scraps(self, since, on_error):
+        return self.iter_scraps_of_pages(list(self.pages), since, on_error)
+
+
+class TestGetListingSince(unittest.TestCase):
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+
+        self.store = SyncStateStore(Path(self.cache_dir.name))
+        self.addCleanup(self.store.close)
+
+    def test_get_listing_since(self):
+        self.assertIsNone(get_listing_since(self.store, 'user'))
+
+        watermark = '2024-09-01T12:00:00+09:00'
+        self.store.set_watermark(PROVIDER, 'user', watermark)
+        # never read past the watermark
+        self.assertIsNone(get_listing_since(self.store, 'user'))
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.store.set_watermark(RECHECK_WATERMARK, 'user', now.isoformat())
+        self.assertEqual(
+            get_listing_since(self.store, 'user'),
+            datetime.datetime.fromisoformat(watermark),
+        )
+
+        self.store.set_watermark(
+            RECHECK_WATERMARK,
+            'user',
+            (now - SCRAP_RECHECK_INTERVAL * 2).isoformat(),
+        )
+        self.assertIsNone(get_listing_since(self.store, 'user'))
+
+
+class TestReadScraps(unittest.TestCase):
+    def read_scraps(self, client: FakeLongblackClient):
+        context = {'logger': logging.getLogger('ridiwise')}
+
+        with (
+            mock.patch(
+                'ridiwise.cmd.sync.longblack.create_client', return_value=client
+            ) as create_client,
+            mock.patch('ridiwise.cmd.checkpoint.time.sleep'),
+            self.assertLogs('ridiwise', level='WARNING'),
+        ):
+            result = read_scraps(context, None)
+
+        # the memos of a listing read past the watermark are not taken from the cache
+        create_client.assert_called_once_with(context, refresh_memos=True)
+
+        return result
+
+    def test_retry_failed_page(self):
+        client = FakeLongblackClient(
+            {'page=1': ['a', 'b'], 'page=2': ['b', 'c'], 'page=3': ['d']},
+            failures={'page=2': 1},
+        )
+
+        scraps, unread_pages = self.read_scraps(client)
+
+        self.assertEqual([scrap['scrap_id'] for scrap in scraps], ['a', 'b', 'd', 'c'])
+        self.assertEqual(unread_pages, [])
+
+    def test_unread_page(self):
+        client = FakeLongblackClient(
+            {'page=1': ['a'], 'page=2': ['b']},
+            failures={'page=2': 10},
+        )
+
+        scraps, unread_pages = self.read_scraps(client)
+
+        self.assertEqual([scrap['scrap_id'] for scrap in scraps], ['a'])
+        self.assertEqual(unread_pages, ['page=2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import subprocess
+import sys
+import unittest
+
+# loaded only by the commands which need them, not to slow down the CLI startup
+HEAVY_MODULES = ('playwright', 'httpx', 'browser_cookie3')
+
+SCRIPT = """
+import contextlib
+import io
+import sys
+
+from ridiwise.cmd.main import app
+
+with contextlib.redirect_stdout(io.StringIO()), contextlib.suppress(SystemExit):
+    app(sys.argv[1:])
+
+print(' '.join(sorted({name.split('.')[0] for name in sys.modules})))
+"""
+
+
+def get_imported_modules(*args: str) -> set[str]:
+    output = subprocess.run(
+        [sys.executable, '-c', SCRIPT, *args],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+
+    return set(output.splitlines()[-1].split())
+
+
+class TestMain(unittest.TestCase):
+    def test_startup_imports(self):
+        for args in (
+            ['--version'],
+            ['--help'],
+            ['sync', 'ridibooks', 'readwise', '--help'],
+            ['sync', 'all', 'readwise', '--help'],
+            ['upload', 'readwise', '--help'],
+        ):
+            with self.subTest(args=args):
+                modules = get_imported_modules(*args)
+
+                self.assertFalse(modules.intersection(HEAVY_MODULES))
+
+
+if __name__ == '__main__':
+    unittest.main()
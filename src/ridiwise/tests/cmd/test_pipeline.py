@@ -0,0 +1,140 @@
+import logging
+import threading
+import unittest
+
+from ridiwise.cmd.pipeline import UploadPipeline
+
+
+class FakeReadwiseClient:
+    max_highlights_per_request = 3
+    max_in_flight_requests = 2
+    logger = logging.getLogger('readwise')
+
+    def __init__(self, error=None, failures=0):
+        self.error = error
+        self.failures = failures
+        self.requests = []
+        self.highlight_count = 0
+        self.tags = []
+        # holds the uploads back until the test queued its batches
+        self.started = threading.Event()
+
+    def create_highlights(self, highlights):
+        self.started.wait(timeout=5)
+
+        if self.error:
+            raise self.error
+
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('upload failed')
+
+        self.requests.append([highlight['text'] for highlight in highlights])
+
+        # a result for each book, as Readwise responds
+        books: dict[str, list[int]] = {}
+        for highlight in highlights:
+            self.highlight_count += 1
+            books.setdefault(highlight.get('title'), []).append(self.highlight_count)
+
+        return [
+            {'id': book_id, 'modified_highlights': highlight_ids}
+            for book_id, highlight_ids in enumerate(books.values())
+        ]
+
+    def create_highlight_tag(self, highlight_id, tag):
+        self.tags.append((highlight_id, tag))
+
+
+class TestUploadPipeline(unittest.TestCase):
+    def test_upload_batches(self):
+        client = FakeReadwiseClient()
+        uploaded = []
+
+        with UploadPipeline(client, tags=['a']) as pipeline:
+            for text in ['1', '2', '3', '4']:
+                pipeline.put(
+                    [{'text': text, 'title': text}],
+                    on_uploaded=lambda text=text: uploaded.append(text),
+                )
+            client.started.set()
+
+        self.assertEqual(sorted(sum(client.requests, [])), ['1', '2', '3', '4'])
+        self.assertTrue(all(len(request) <= 6 for request in client.requests))
+        self.assertEqual(uploaded, ['1', '2', '3', '4'])
+        self.assertEqual(client.tags, [(1, 'a'), (2, 'a'), (3, 'a'), (4, 'a')])
+
+    def test_upload_queued_batches_together(self):
+        client = FakeReadwiseClient()
+
+        with UploadPipeline(client) as pipeline:
+            for text in ['1', '2', '3', '4', '5', '6', '7']:
+                pipeline.put([{'text': text}], on_uploaded=lambda: None)
+            client.started.set()
+
+        # more than the highlights of a request, for the client to send them in
+        # parallel
+        self.assertGreater(max(len(request) for request in client.requests), 3)
+        self.assertTrue(all(len(request) <= 6 for request in client.requests))
+
+    def test_tags_of_each_book(self):
+        client = FakeReadwiseClient()
+
+        with UploadPipeline(client, tags=['x', 'y']) as pipeline:
+            pipeline.put(
+                [{'text': text, 'title': 'A'} for text in ['1', '2', '3']],
+                on_uploaded=lambda: None,
+            )
+            pipeline.put([{'text': '4', 'title': 'B'}], on_uploaded=lambda: None)
+            client.started.set()
+
+        self.assertEqual(client.tags, [(1, 'x'), (2, 'y'), (4, 'x')])
+
+    def test_upload_error(self):
+        client = FakeReadwiseClient(error=RuntimeError('upload failed'))
+        client.started.set()
+
+        with self.assertRaisesRegex(RuntimeError, 'upload failed'):
+            with UploadPipeline(client) as pipeline:
+                pipeline.put([{'text': '1'}], on_uploaded=lambda: None)
+
+    def test_upload_queued_batches_on_error(self):
+        client = FakeReadwiseClient()
+        client.started.set()
+
+        with self.assertRaisesRegex(ValueError, 'scrape failed'):
+            with UploadPipeline(client) as pipeline:
+                pipeline.put([{'text': '1'}], on_uploaded=lambda: None)
+                raise ValueError('scrape failed')
+
+        self.assertEqual(client.requests, [['1']])
+
+    def test_keep_failed(self):
+        client = FakeReadwiseClient(failures=2)
+        client.started.set()
+        uploaded = []
+
+        with self.assertLogs('readwise', level='WARNING'):
+            with UploadPipeline(
+                client, keep_failed=True, retry_backoff_seconds=0
+            ) as pipeline:
+                pipeline.put([{'text': '1'}], on_uploaded=lambda: uploaded.append(1))
+
+        self.assertEqual(client.requests, [['1']])
+        self.assertEqual(uploaded, [1])
+        self.assertEqual(pipeline.failed_batches, [])
+
+        client = FakeReadwiseClient(error=RuntimeError('upload failed'))
+        client.started.set()
+
+        with self.assertLogs('readwise', level='WARNING'):
+            with UploadPipeline(
+                client, keep_failed=True, retry_backoff_seconds=0
+            ) as pipeline:
+                pipeline.put([{'text': '1'}, {'text': '2'}], on_uploaded=lambda: None)
+
+        self.assertEqual(pipeline.failed_highlight_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
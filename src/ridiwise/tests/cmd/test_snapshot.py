@@ -0,0 +1,58 @@
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+
+from ridiwise.cmd.snapshot import (
+    SnapshotWriter,
+    iter_snapshot_records,
+    read_snapshot_header,
+)
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        self.path = Path(self.temp_dir.name) / 'snapshots' / 'ridibooks.jsonl.gz'
+
+    def test_round_trip(self):
+        book = {
+            'book_id': '123',
+            'book_title': '책',
+            'notes': [
+                {
+                    'id': '1',
+                    'highlighted_text': 'text',
+                    'memo': None,
+                    'created_date': datetime.datetime(
+                        2024, 1, 1, tzinfo=datetime.timezone.utc
+                    ),
+                },
+            ],
+        }
+
+        with SnapshotWriter(self.path, 'ridibooks', 'user') as writer:
+            writer.write(book)
+
+        self.assertEqual(writer.count, 1)
+
+        header = read_snapshot_header(self.path)
+        self.assertEqual(header['provider'], 'ridibooks')
+        self.assertEqual(header['account'], 'user')
+
+        self.assertEqual(list(iter_snapshot_records(self.path)), [book])
+
+    def test_failed_write_leaves_no_snapshot(self):
+        with self.assertRaises(RuntimeError):
+            with SnapshotWriter(self.path, 'ridibooks', 'user') as writer:
+                writer.write({'book_id': '123'})
+                raise RuntimeError()
+
+        self.assertEqual(list(self.path.parent.iterdir()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
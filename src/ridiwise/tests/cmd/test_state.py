@@ -0,0 +1,111 @@
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+
+from ridiwise.cmd.state import (
+    SyncStateStore,
+    fingerprint,
+    get_highlight_fingerprint,
+)
+
+
+class TestSyncStateStore(unittest.TestCase):
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+
+        self.store = SyncStateStore(Path(self.cache_dir.name))
+        self.addCleanup(self.store.close)
+
+    def test_fingerprint(self):
+        created = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+        self.assertEqual(
+            fingerprint('text', None, created), fingerprint('text', None, created)
+        )
+        self.assertNotEqual(
+            fingerprint('text', None, created), fingerprint('text', 'memo', created)
+        )
+
+    def test_get_highlight_fingerprint(self):
+        highlight = {
+            'text': 'text',
+            'title': 'title',
+            'note': None,
+            'highlighted_at': '2024-01-01T00:00:00+00:00',
+            'source_url': 'https://example.com/book',
+            'highlight_url': 'https://example.com/book#1',
+        }
+
+        self.assertEqual(
+            get_highlight_fingerprint(highlight),
+            get_highlight_fingerprint({**highlight, 'title': 'renamed'}),
+        )
+        self.assertNotEqual(
+            get_highlight_fingerprint(highlight),
+            get_highlight_fingerprint({**highlight, 'note': 'memo'}),
+        )
+
+    def test_filter_changed(self):
+        self.store.mark_synced('ridibooks', 'user', {'1': 'a', '2': 'b'})
+
+        changed = self.store.filter_changed(
+            'ridibooks', 'user', {'1': 'a', '2': 'changed', '3': 'new'}
+        )
+
+        self.assertEqual(changed, {'2', '3'})
+
+    def test_filter_changed_is_scoped_by_account(self):
+        self.store.mark_synced('ridibooks', 'user', {'1': 'a'})
+
+        self.assertEqual(
+            self.store.filter_changed('ridibooks', 'other', {'1': 'a'}), {'1'}
+        )
+        self.assertEqual(
+            self.store.filter_changed('longblack', 'user', {'1': 'a'}), {'1'}
+        )
+
+    def test_state_is_persisted(self):
+        self.store.mark_synced('longblack', 'user', {'H1': 'a'})
+        self.store.close()
+
+        with SyncStateStore(Path(self.cache_dir.name)) as store:
+            self.assertEqual(
+                store.get_fingerprints('longblack', 'user', ['H1', 'H2']),
+                {'H1': 'a'},
+            )
+
+    def test_filter_changed_sources(self):
+        self.store.mark_sources_checked('ridibooks', 'user', {'1': 'a', '2': 'b'})
+
+        self.assertEqual(
+            self.store.filter_changed_sources(
+                'ridibooks', 'user', {'1': 'a', '2': 'changed', '3': 'new'}
+            ),
+            {'2', '3'},
+        )
+        self.assertEqual(
+            self.store.filter_changed_sources(
+                'ridibooks', 'user', {'1': 'a'}, max_age=datetime.timedelta(0)
+            ),
+            {'1'},
+        )
+        self.assertEqual(self.store.get_fingerprints('ridibooks', 'user', ['1']), {})
+
+    def test_watermark(self):
+        self.assertIsNone(self.store.get_watermark('longblack', 'user'))
+
+        self.store.set_watermark('longblack', 'user', '2024-01-01T00:00:00+09:00')
+        self.store.set_watermark('longblack', 'user', '2024-02-01T00:00:00+09:00')
+
+        self.assertEqual(
+            self.store.get_watermark('longblack', 'user'),
+            '2024-02-01T00:00:00+09:00',
+        )
+        self.assertIsNone(self.store.get_watermark('longblack', 'other'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from ridiwise.metrics import MetricsRegistry
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_span(self):
+        with self.registry.span('login', provider='ridibooks'):
+            pass
+
+        with self.assertRaises(ValueError):
+            with self.registry.span('login', provider='ridibooks'):
+                raise ValueError()
+
+        histogram = self.registry.histograms['phase_duration_seconds'][
+            (('phase', 'login'), ('provider', 'ridibooks'))
+        ]
+        self.assertEqual(histogram.count, 2)
+        self.assertEqual(
+            self.registry.counters['phase_errors_total'],
+            {(('phase', 'login'), ('provider', 'ridibooks')): 1},
+        )
+
+    def test_to_prometheus(self):
+        self.registry.inc('pages_total', provider='ridibooks')
+        self.registry.inc('pages_total', 2, provider='ridibooks')
+        self.registry.observe('phase_duration_seconds', 0.3, phase='shelf')
+        self.registry.observe('phase_duration_seconds', 200, phase='shelf')
+
+        lines = self.registry.to_prometheus().splitlines()
+
+        self.assertIn('# TYPE ridiwise_pages_total counter', lines)
+        self.assertIn('ridiwise_pages_total{provider="ridibooks"} 3', lines)
+        self.assertIn('# TYPE ridiwise_phase_duration_seconds histogram', lines)
+        self.assertIn(
+            'ridiwise_phase_duration_seconds_bucket{phase="shelf",le="0.25"} 0', lines
+        )
+        self.assertIn(
+            'ridiwise_phase_duration_seconds_bucket{phase="shelf",le="0.5"} 1', lines
+        )
+        self.assertIn(
+            'ridiwise_phase_duration_seconds_bucket{phase="shelf",le="+Inf"} 2', lines
+        )
+        self.assertIn('ridiwise_phase_duration_seconds_count{phase="shelf"} 2', lines)
+
+    def test_write(self):
+        self.registry.inc('pages_total', provider='longblack')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            json_path = Path(temp_dir) / 'metrics.json'
+            prom_path = Path(temp_dir) / 'ridiwise.prom'
+
+            self.registry.write(json_path)
+            self.registry.write(prom_path)
+
+            self.assertEqual(
+                json.loads(json_path.read_text())['counters'],
+                [
+                    {
+                        'name': 'pages_total',
+                        'labels': {'provider': 'longblack'},
+                        'value': 1,
+                    }
+                ],
+            )
+            self.assertIn('ridiwise_pages_total', prom_path.read_text())
+            self.assertEqual(
+                sorted(path.name for path in Path(temp_dir).iterdir()),
+                ['metrics.json', 'ridiwise.prom'],
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()